@@ -19,7 +19,14 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 ##
-from logging import Handler, currentframe, __file__, basicConfig, getLogger
+from logging import Handler, Filter, currentframe, __file__, basicConfig, getLogger, getLevelName
+from datetime import datetime, timezone
+from functools import lru_cache
+from json import dumps
+from queue import SimpleQueue, Empty
+from random import random
+from threading import Thread
+from traceback import format_exception
 import sys
 from pathlib import Path
 from loguru import logger
@@ -37,6 +44,7 @@ class InterceptHandler(Handler):
     }
 
     def emit(self, record):
+        # The handler level is checked by Handler.handle, the frames are only walked for emitted records
         try:
             level = logger.level(record.levelname).name
         except AttributeError:
@@ -54,17 +62,128 @@ class InterceptHandler(Handler):
         ).log(level, record.getMessage())
 
 
+class SamplingFilter(Filter):
+    """
+    Keep only a fraction of the records, used for the uvicorn access log under heavy polling.
+    """
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return self.rate >= 1 or random() < self.rate
+
+
+class BatchWriter:
+    """
+    Write the log lines from a background thread, joining the pending lines in a single write per batch.
+    """
+    def __init__(self, streams, batch_size=256, flush_interval=0.5, owned=None):
+        """
+        :param streams: streams receiving every batch
+        :param batch_size: maximum lines joined in a single write
+        :param flush_interval: seconds waited for a first line before checking again
+        :param owned: streams opened for the writer, closed after the last batch
+        """
+        self.streams = streams
+        self.owned = owned or list()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = SimpleQueue()
+        self.thread = Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, line):
+        self.queue.put(line)
+
+    def close(self):
+        """
+        Write the pending lines and close the owned streams.
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+        for stream in self.owned:
+            stream.close()
+
+    def _run(self):
+        running = True
+
+        while running:
+            try:
+                lines = [self.queue.get(timeout=self.flush_interval)]
+            except Empty:
+                continue
+
+            while len(lines) < self.batch_size:
+                try:
+                    lines.append(self.queue.get_nowait())
+                except Empty:
+                    break
+
+            if None in lines:
+                running = False
+                lines = [x for x in lines if x is not None]
+
+            data = ''.join(lines)
+            for stream in self.streams:
+                stream.write(data)
+                stream.flush()
+
+
+class JsonLinesHandler(Handler):
+    """
+    Format the stdlib records as JSON lines without going through loguru, the lines are written by a BatchWriter.
+    """
+    def __init__(self, writer, level=0):
+        super().__init__(level=level)
+        self.writer = writer
+
+    def emit(self, record):
+        try:
+            entry = {
+                "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+                "level": record.levelname,
+                "caller": caller(record.name, record.funcName, record.lineno),
+                "message": record.getMessage()
+            }
+
+            if record.exc_info:
+                entry["exception"] = ''.join(format_exception(*record.exc_info))
+
+            self.writer.write(dumps(entry) + '\n')
+        except Exception:
+            self.handleError(record)
+
+
+@lru_cache(maxsize=4096)
+def caller(name, function, line):
+    # The same call sites log again and again, the rendered caller is cached
+    return f'{name}:{function}:{line}'
+
+
 class CustomizeLogger:
+    writer = None
+
     @classmethod
     def make_logger(cls):
         logging_config = config.get('logger')
 
+        if logging_config.get('mode', 'loguru') == 'json':
+            return cls.customize_json_logging(
+                filepath=logging_config.get('path'),
+                level=logging_config.get('level'),
+                access_sample_rate=logging_config.get('access_sample_rate', 1),
+                batch_size=logging_config.get('batch_size', 256),
+                flush_interval=logging_config.get('flush_interval', 0.5))
+
         logger = cls.customize_logging(
             filepath=logging_config.get('path'),
             level=logging_config.get('level'),
             retention=logging_config.get('retention'),
             rotation=logging_config.get('rotation'),
-            format=logging_config.get('format'))
+            format=logging_config.get('format'),
+            access_sample_rate=logging_config.get('access_sample_rate', 1))
 
         return logger
 
@@ -74,7 +193,8 @@ class CustomizeLogger:
                           level: str,
                           rotation: str,
                           retention: str,
-                          format: str):
+                          format: str,
+                          access_sample_rate: float = 1):
 
         logger.remove()
 
@@ -94,11 +214,62 @@ class CustomizeLogger:
             level=level.upper(),
             format=format)
 
-        basicConfig(handlers=[InterceptHandler()], level=0)
-        getLogger("uvicorn.access").handlers = [InterceptHandler()]
+        # The records under the configured level are discarded by the stdlib loggers before reaching the handler
+        level_number = getLevelName(level.upper())
+        basicConfig(handlers=[InterceptHandler(level=level_number)], level=level_number, force=True)
+
+        cls._route_uvicorn(InterceptHandler(level=level_number), access_sample_rate)
+
+        return logger.bind(request_id=None, method=None)
+
+    @classmethod
+    def customize_json_logging(cls,
+                               filepath: Path,
+                               level: str,
+                               access_sample_rate: float = 1,
+                               batch_size: int = 256,
+                               flush_interval: float = 0.5):
+        """
+        JSON lines logging with the stdlib loggers only: the level is checked before the record is created,
+        the caller is cached per call site and the lines are written in batches from a background thread.
+        Rotation and retention are only applied by the loguru mode.
+        """
+        logger.remove()
 
+        path = Path(filepath)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        cls.close()
+
+        file = open(path, 'a', buffering=1 << 16)
+        cls.writer = BatchWriter(streams=[sys.stdout, file],
+                                 batch_size=batch_size,
+                                 flush_interval=flush_interval,
+                                 owned=[file])
+
+        level_number = getLevelName(level.upper())
+        handler = JsonLinesHandler(writer=cls.writer, level=level_number)
+        basicConfig(handlers=[handler], level=level_number, force=True)
+
+        cls._route_uvicorn(handler, access_sample_rate)
+
+        return getLogger('api')
+
+    @classmethod
+    def close(cls):
+        """
+        Flush the pending lines of the JSON mode and close its log file, the loguru sinks are not affected.
+        """
+        if cls.writer is not None:
+            writer, cls.writer = cls.writer, None
+            writer.close()
+
+    @staticmethod
+    def _route_uvicorn(handler, access_sample_rate):
         for _log in ['uvicorn', 'uvicorn.error', 'uvicorn.access', 'fastapi']:
             _logger = getLogger(_log)
-            _logger.handlers = [InterceptHandler()]
+            _logger.handlers = [handler]
+            _logger.propagate = False
 
-        return logger.bind(request_id=None, method=None)
+        access = getLogger("uvicorn.access")
+        access.filters = [SamplingFilter(rate=access_sample_rate)] if access_sample_rate < 1 else list()
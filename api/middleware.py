@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from json import dumps
+from time import perf_counter
+from secure import Server, ContentSecurityPolicy, StrictTransportSecurity, \
+    ReferrerPolicy, PermissionsPolicy, CacheControl, Secure
+from components.metrics import request_duration
+from components.profiling import current_trace, SamplingProfiler
+
+
+def build_secure_headers():
+    """
+    Compute the security headers of the responses once, as raw ASGI header tuples.
+
+    :return: list of (name, value) byte tuples
+    """
+    server = Server().set("Secure")
+
+    csp = (
+        ContentSecurityPolicy().default_src("'none'")
+                               .base_uri("'self'")
+                               .connect_src("'self'" "api.spam.com")
+                               .frame_src("'none'")
+                               .img_src("'self'", "static.spam.com")
+    )
+
+    hsts = StrictTransportSecurity().include_subdomains().preload().max_age(2592000)
+
+    referrer = ReferrerPolicy().no_referrer()
+
+    permissions_value = (
+        PermissionsPolicy().geolocation("self", "'spam.com'").vibrate()
+    )
+
+    cache_value = CacheControl().must_revalidate()
+
+    secure_headers = Secure(
+        server=server,
+        csp=csp,
+        hsts=hsts,
+        referrer=referrer,
+        permissions=permissions_value,
+        cache=cache_value,
+    )
+
+    return [(name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in secure_headers.headers().items()]
+
+
+class SecureHeadersMiddleware:
+    """
+    ASGI middleware adding the precomputed security headers to every HTTP response, replacing the headers
+    with the same name set by the endpoint.
+    """
+    def __init__(self, app, headers):
+        self.app = app
+        self.headers = headers
+        self.names = {name for name, _ in headers}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = [x for x in message.get("headers", list()) if x[0].lower() not in self.names]
+                message["headers"] = headers + self.headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+class LatencyMiddleware:
+    """
+    ASGI middleware observing the latency of the HTTP requests per route template, e.g. /jobs/{job_id}, to keep
+    the cardinality of the histogram bounded.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            request_duration.labels(method=scope["method"],
+                                    route=route.path if route is not None else "unmatched",
+                                    status=status).observe(perf_counter() - start)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware recording the trace of the HTTP requests, its identifier is returned in the X-Trace-Id
+    header. A request with the profiling header, e.g. "X-Profile: 1", is traced and also profiled by sampling
+    the event loop and the threads working for it. The other requests are only traced when trace_all is set.
+    """
+    def __init__(self, app, recorder, header="X-Profile", interval=0.005, trace_all=True):
+        self.app = app
+        self.recorder = recorder
+        self.header = header.lower().encode('latin-1') if header else None
+        self.interval = interval
+        self.trace_all = trace_all
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profiled = self.header is not None and \
+            any(name == self.header and value not in (b'', b'0', b'false') for name, value in scope["headers"])
+
+        if not profiled and not self.trace_all:
+            await self.app(scope, receive, send)
+            return
+
+        trace = self.recorder.begin(scope["method"], scope["path"])
+        token = current_trace.set(trace)
+        status = 500
+
+        profiler = None
+        if profiled:
+            profiler = SamplingProfiler(interval=self.interval, threads=trace.threads).start()
+
+        async def send_with_trace(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", list())) + [(b'x-trace-id', trace.id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            if profiler is not None:
+                trace.profile = profiler.stop()
+
+            current_trace.reset(token)
+            route = scope.get("route")
+            self.recorder.end(trace, status, route=route.path if route is not None else None)
+
+
+class ReadinessMiddleware:
+    """
+    ASGI middleware answering 503 to the requests that need the subsystems until they are initialized, so the
+    event loop never waits for the initialization lock. The exempt paths, and their subpaths, are always served.
+    """
+    def __init__(self, app, ready, exempt=()):
+        self.app = app
+        self.ready = ready
+        self.exempt = tuple(exempt)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.ready.is_set() or \
+                any(scope["path"] == path or scope["path"].startswith(f'{path}/') for path in self.exempt):
+            await self.app(scope, receive, send)
+            return
+
+        body = dumps({'message': 'The services are not ready, check GET /ready'}).encode()
+        await send({"type": "http.response.start",
+                    "status": 503,
+                    "headers": [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode()),
+                                (b'retry-after', b'1')]})
+        await send({"type": "http.response.body", "body": body})
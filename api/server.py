@@ -21,66 +21,84 @@
 ##
 
 from fastapi import FastAPI, Request, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from asyncio import get_running_loop, sleep, Queue, create_task, run_coroutine_threadsafe
+from json import dumps
+from functools import partial
+from time import perf_counter
+from threading import Thread, Event
+from concurrent.futures import TimeoutError as FutureTimeout
+from uuid import uuid4
 from uvicorn import run
 from datetime import datetime
-from secure import Server, ContentSecurityPolicy, StrictTransportSecurity, \
-    ReferrerPolicy, PermissionsPolicy, CacheControl, Secure
 from logging import getLogger
 from api.custom_logging import CustomizeLogger
-from components.compose import Compose
-from components.exceptions import ComposeInitialization, UnknownBroker, Unimplemented
+from api.middleware import SecureHeadersMiddleware, LatencyMiddleware, TracingMiddleware, ReadinessMiddleware, \
+    build_secure_headers
+from api.services import Services
+from components.metrics import export, handled
+from components.profiling import TraceRecorder, LoopLagMonitor, SamplingProfiler
+from components.exceptions import ComposeInitialization, UnknownBroker, Unimplemented, UnknownJob, \
+    InvalidDeployment, DockerBackendError, AdmissionRejected, UnknownDeployment, NoHealthyHost, UnknownDiagnostics, \
+    UnknownTrace, NoFreePort
+from components.jobs import JobStatus
+from common.config import config
 from cli.command import __version__
 
 initial_uptime = datetime.now()
 logger = getLogger(__name__)
 
 
-def create_app() -> FastAPI:
+def create_app(services) -> FastAPI:
     app = FastAPI(title='BrokerCleaner Management', debug=False)
-    app.logger = CustomizeLogger.make_logger()
-
-    return app
+    # The handlers and files of the logger are configured on startup, not when the server is imported
+    app.logger = getLogger('api')
 
+    # The stalls of the event loop are attributed to the requests in flight, whose traces are kept here
+    app.traces = TraceRecorder(max_traces=config['profiling']['max_traces'],
+                               slow=config['profiling']['slow_request'],
+                               max_spans=config['profiling']['max_spans'])
+    app.lag_monitor = LoopLagMonitor(threshold=config['profiling']['lag_threshold'],
+                                     interval=config['profiling']['lag_interval'],
+                                     max_stalls=config['profiling']['max_stalls'],
+                                     recorder=app.traces)
 
-application = create_app()
-composeEngine = Compose()
+    # Pure ASGI middlewares, the security headers never change so they are computed only once
+    # Without profiling only the requests with the profiling header are traced
+    app.add_middleware(TracingMiddleware, recorder=app.traces, header=config['profiling']['header'],
+                       interval=config['profiling']['sample_interval'], trace_all=config['profiling']['enabled'])
+    app.add_middleware(ReadinessMiddleware, ready=services.ready,
+                       exempt=["/ready", "/version", "/metrics", "/docs", "/openapi.json", "/stalls", "/traces",
+                               "/profile"])
+    app.add_middleware(LatencyMiddleware)
+    app.add_middleware(SecureHeadersMiddleware, headers=build_secure_headers())
 
+    return app
 
-@application.middleware("http")
-async def set_secure_headers(request, call_next):
-    response = await call_next(request)
-    server = Server().set("Secure")
 
-    csp = (
-        ContentSecurityPolicy().default_src("'none'")
-                               .base_uri("'self'")
-                               .connect_src("'self'" "api.spam.com")
-                               .frame_src("'none'")
-                               .img_src("'self'", "static.spam.com")
-    )
+services = Services()
+application = create_app(services)
 
-    hsts = StrictTransportSecurity().include_subdomains().preload().max_age(2592000)
 
-    referrer = ReferrerPolicy().no_referrer()
+@application.on_event("startup")
+def startup():
+    application.logger = CustomizeLogger.make_logger()
 
-    permissions_value = (
-        PermissionsPolicy().geolocation("self", "'spam.com'").vibrate()
-    )
+    # The docker clients, compose models and pools are created in the background, /ready reports when they are
+    services.start()
 
-    cache_value = CacheControl().must_revalidate()
+    if config['profiling']['enabled']:
+        application.lag_monitor.start()
 
-    secure_headers = Secure(
-        server=server,
-        csp=csp,
-        hsts=hsts,
-        referrer=referrer,
-        permissions=permissions_value,
-        cache=cache_value,
-    )
 
-    secure_headers.framework.fastapi(response)
+@application.on_event("shutdown")
+async def shutdown():
+    application.lag_monitor.stop()
+    await services.stop()
 
-    return response
+    # The records of the stop are written before the log file is closed
+    CustomizeLogger.close()
 
 
 @application.get("/version", status_code=status.HTTP_200_OK)
@@ -97,7 +115,18 @@ def getversion(request: Request):
     return data
 
 
-@application.post("/init", status_code=status.HTTP_201_CREATED)
+@application.get("/ready", status_code=status.HTTP_200_OK)
+async def get_ready(request: Request, response: Response):
+    resp = services.status()
+
+    if resp['status'] != "ready":
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        request.app.logger.info(f'GET /ready 503 Service Unavailable, services {resp["status"]}')
+
+    return resp
+
+
+@application.post("/init", status_code=status.HTTP_202_ACCEPTED)
 async def init(request: Request, response: Response):
     request.app.logger.info(f'Request init a Context Broker')
 
@@ -106,27 +135,87 @@ async def init(request: Request, response: Response):
         json = await request.json()
         broker = json["broker"]
 
-        # Send the information to the docker management classes
         try:
-            composeEngine.initialize(broker=broker)
-            composeEngine.up()
+            priority = int(json.get("priority", 0))
+        except (TypeError, ValueError):
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            request.app.logger.error(f'POST /init 400 Bad Request, invalid priority {json.get("priority")}')
 
-            resp = {'message': f'Deploying the Context Broker: {broker}'}
-            response.status_code = status.HTTP_201_CREATED
-            request.app.logger.info(f'POST /init 201 Created Request, Deploying {broker}')
+            return {'message': 'The priority should be an integer'}
+
+        # Send the information to the docker management classes, the deployment is executed in the job pool
+        # unless a healthy deployment is available in the warm pool
+        try:
+            deployment = None
+            current = services.registry.deployments.get(broker)
+            if json.get("deployment") is None and current is None:
+                deployment = await run_in_threadpool(services.pool.take, broker)
+
+            if deployment is not None:
+                await run_in_threadpool(services.registry.adopt, deployment, alias=broker)
+                containers = await run_in_threadpool(deployment.engine.get_container_names)
+
+                # The standby stack has its own ports and container names, the client reaches the broker with them
+                resp = {'message': f'Deployed the Context Broker: {broker}', 'deployment': deployment.id,
+                        'ports': deployment.ports, 'containers': sorted(containers.keys())}
+                response.status_code = status.HTTP_201_CREATED
+                request.app.logger.info(f'POST /init 201 Created Request, Warm pool {broker}, {deployment.id}')
+            else:
+                created = services.registry.deployments.get(json.get("deployment") or broker) is None
+                deployment = await run_in_threadpool(services.registry.acquire, broker=broker,
+                                                     deployment_id=json.get("deployment"))
+
+                # The deployment waits in the admission queue until the host has the resources of the broker
+                admission = partial(services.scheduler.request, broker=broker, deployment_id=deployment.id,
+                                    priority=priority) if services.scheduler is not None else None
+                # Only the deployment created by this request is released when it is rejected, now or once
+                # queued, a running one keeps its containers
+                on_reject = partial(services.registry.release, deployment) if created else None
+                try:
+                    job = services.jobs.submit("init", broker, deploy, deployment, deployment=deployment.id,
+                                               admission=admission, on_reject=on_reject)
+                except AdmissionRejected:
+                    if on_reject is not None:
+                        await run_in_threadpool(on_reject)
+                    raise
+
+                resp = {'message': f'Deploying the Context Broker: {broker}', 'job': job.to_dict()}
+                response.status_code = status.HTTP_202_ACCEPTED
+                response.headers['Location'] = f'/jobs/{job.id}'
+                request.app.logger.info(f'POST /init 202 Accepted Request, Deploying {broker}, job {job.id} '
+                                        f'{job.status.value}')
 
         except ComposeInitialization as e:
+            handled(e)
             resp = {'message': f'The docker engine was not initialized'}
             response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
             request.app.logger.error(f'POST /init 500 Internal Server Error: {e.message}')
         except UnknownBroker as e:
-            resp = {'message': f'Unexpected name for the Context Broker. Valid values: {composeEngine.brokers.keys()}'}
+            handled(e)
+            resp = {'message': f'Unexpected name for the Context Broker. '
+                               f'Valid values: {services.compose.brokers.keys()}'}
             response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
             request.app.logger.error(f'POST /init 500 Internal Server Error: {e.message}')
         except Unimplemented as e:
+            handled(e)
             resp = {'message': f'The deployment of {broker} is not implemented'}
             response.status_code = status.HTTP_501_NOT_IMPLEMENTED
             request.app.logger.error(f'POST /init 501 Internal Server Error: {e.message}')
+        except InvalidDeployment as e:
+            handled(e)
+            resp = {'message': f'Invalid deployment {e.data}: {e.message}'}
+            response.status_code = status.HTTP_409_CONFLICT
+            request.app.logger.error(f'POST /init 409 Conflict: {e.message}')
+        except NoHealthyHost as e:
+            handled(e)
+            resp = {'message': f'The deployment {e.data} cannot be placed: {e.message}'}
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            request.app.logger.error(f'POST /init 503 Service Unavailable: {e.message}')
+        except AdmissionRejected as e:
+            handled(e)
+            resp = {'message': f'The deployment {e.data} was not admitted: {e.message}'}
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            request.app.logger.error(f'POST /init 503 Service Unavailable: {e.message}')
 
     else:
         resp = {'message': 'Allowed Content-Type is only application/json'}
@@ -136,7 +225,7 @@ async def init(request: Request, response: Response):
     return resp
 
 
-@application.post("/clean", status_code=status.HTTP_200_OK)
+@application.post("/clean", status_code=status.HTTP_202_ACCEPTED)
 async def clean(request: Request, response: Response):
     request.app.logger.info(f'Request clean a Context Broker')
 
@@ -145,13 +234,36 @@ async def clean(request: Request, response: Response):
         json = await request.json()
         broker = json["broker"]
 
-        # Send the information to the docker management classes
-        composeEngine.initialize(broker=broker)
-        composeEngine.down()
+        # Send the information to the docker management classes, the teardown is executed in the job pool
+        try:
+            deployment = services.registry.find(broker=broker, deployment_id=json.get("deployment"))
+            job = services.jobs.submit("clean", broker, teardown, deployment, deployment=deployment.id)
 
-        resp = {'message': f'Cleaning the Context Broker: {json["broker"]}'}
-        response.status_code = status.HTTP_200_OK
-        request.app.logger.info(f'POST /clean 200 Created Request, Deploying {json["broker"]}')
+            resp = {'message': f'Cleaning the Context Broker: {broker}', 'job': job.to_dict()}
+            response.status_code = status.HTTP_202_ACCEPTED
+            response.headers['Location'] = f'/jobs/{job.id}'
+            request.app.logger.info(f'POST /clean 202 Accepted Request, Cleaning {broker}, job {job.id}')
+        except UnknownBroker as e:
+            handled(e)
+            resp = {'message': f'Unexpected name for the Context Broker. '
+                               f'Valid values: {services.compose.brokers.keys()}'}
+            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+            request.app.logger.error(f'POST /clean 500 Internal Server Error: {e.message}')
+        except Unimplemented as e:
+            handled(e)
+            resp = {'message': f'The deployment of {broker} is not implemented'}
+            response.status_code = status.HTTP_501_NOT_IMPLEMENTED
+            request.app.logger.error(f'POST /clean 501 Internal Server Error: {e.message}')
+        except InvalidDeployment as e:
+            handled(e)
+            resp = {'message': f'Invalid deployment {e.data}: {e.message}'}
+            response.status_code = status.HTTP_409_CONFLICT
+            request.app.logger.error(f'POST /clean 409 Conflict: {e.message}')
+        except UnknownDeployment as e:
+            handled(e)
+            resp = {'message': f'Unknown deployment {e.data} of the Context Broker {broker}'}
+            response.status_code = status.HTTP_404_NOT_FOUND
+            request.app.logger.error(f'POST /clean 404 Not Found: {e.message}')
     else:
         resp = {'message': 'Allowed Content-Type is only application/json'}
         response.status_code = status.HTTP_400_BAD_REQUEST
@@ -160,8 +272,55 @@ async def clean(request: Request, response: Response):
     return resp
 
 
+@application.post("/reset", status_code=status.HTTP_202_ACCEPTED)
+async def reset(request: Request, response: Response):
+    request.app.logger.info(f'Request reset the data of a Context Broker')
+
+    content_type = request.headers.get('Content-Type')
+    if content_type == 'application/json':
+        json = await request.json()
+        broker = json["broker"]
+
+        # The containers keep running, only the data is removed, the reset is executed in the job pool
+        try:
+            deployment = services.registry.find(broker=broker, deployment_id=json.get("deployment"))
+            job = services.jobs.submit("reset", broker, wipe, deployment, deployment=deployment.id)
+
+            resp = {'message': f'Resetting the Context Broker: {broker}', 'job': job.to_dict()}
+            response.status_code = status.HTTP_202_ACCEPTED
+            response.headers['Location'] = f'/jobs/{job.id}'
+            request.app.logger.info(f'POST /reset 202 Accepted Request, Resetting {broker}, job {job.id}')
+        except UnknownBroker as e:
+            handled(e)
+            resp = {'message': f'Unexpected name for the Context Broker. '
+                               f'Valid values: {services.compose.brokers.keys()}'}
+            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+            request.app.logger.error(f'POST /reset 500 Internal Server Error: {e.message}')
+        except Unimplemented as e:
+            handled(e)
+            resp = {'message': f'The deployment of {broker} is not implemented'}
+            response.status_code = status.HTTP_501_NOT_IMPLEMENTED
+            request.app.logger.error(f'POST /reset 501 Internal Server Error: {e.message}')
+        except InvalidDeployment as e:
+            handled(e)
+            resp = {'message': f'Invalid deployment {e.data}: {e.message}'}
+            response.status_code = status.HTTP_409_CONFLICT
+            request.app.logger.error(f'POST /reset 409 Conflict: {e.message}')
+        except UnknownDeployment as e:
+            handled(e)
+            resp = {'message': f'Unknown deployment {e.data} of the Context Broker {broker}'}
+            response.status_code = status.HTTP_404_NOT_FOUND
+            request.app.logger.error(f'POST /reset 404 Not Found: {e.message}')
+    else:
+        resp = {'message': 'Allowed Content-Type is only application/json'}
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        request.app.logger.error(f'POST /reset 400 Bad Request')
+
+    return resp
+
+
 @application.post("/check_status", status_code=status.HTTP_200_OK)
-async def clean(request: Request, response: Response):
+async def check_status(request: Request, response: Response):
     request.app.logger.info(f'Request healthy check status of the deployment of a Context Broker')
 
     content_type = request.headers.get('Content-Type')
@@ -169,20 +328,874 @@ async def clean(request: Request, response: Response):
         json = await request.json()
         broker = json["broker"]
 
-        # Check the health status of the composer
-        composeEngine.initialize(broker=broker)
-        resp = composeEngine.check_health_status()
+        # Check the health status of the composer, the docker calls are executed out of the event loop
+        try:
+            deployment = services.registry.find(broker=broker, deployment_id=json.get("deployment"))
+            resp = await get_health_status(deployment, probe=json.get("probe", False))
 
-        response.status_code = status.HTTP_200_OK
-        request.app.logger.info(f'POST /check_status 200 Check Status Request, broker {json["broker"]}')
+            response.status_code = status.HTTP_200_OK
+            request.app.logger.info(f'POST /check_status 200 Check Status Request, broker {broker}')
+        except UnknownBroker as e:
+            handled(e)
+            resp = {'message': f'Unexpected name for the Context Broker. '
+                               f'Valid values: {services.compose.brokers.keys()}'}
+            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+            request.app.logger.error(f'POST /check_status 500 Internal Server Error: {e.message}')
+        except Unimplemented as e:
+            handled(e)
+            resp = {'message': f'The deployment of {broker} is not implemented'}
+            response.status_code = status.HTTP_501_NOT_IMPLEMENTED
+            request.app.logger.error(f'POST /check_status 501 Internal Server Error: {e.message}')
+        except InvalidDeployment as e:
+            handled(e)
+            resp = {'message': f'Invalid deployment {e.data}: {e.message}'}
+            response.status_code = status.HTTP_409_CONFLICT
+            request.app.logger.error(f'POST /check_status 409 Conflict: {e.message}')
+        except UnknownDeployment as e:
+            handled(e)
+            resp = {'message': f'Unknown deployment {e.data} of the Context Broker {broker}'}
+            response.status_code = status.HTTP_404_NOT_FOUND
+            request.app.logger.error(f'POST /check_status 404 Not Found: {e.message}')
     else:
         resp = {'message': 'Allowed Content-Type is only application/json'}
         response.status_code = status.HTTP_400_BAD_REQUEST
-        request.app.logger.error(f'POST /clean 400 Bad Request')
+        request.app.logger.error(f'POST /check_status 400 Bad Request')
+
+    return resp
+
+
+@application.post("/wait", status_code=status.HTTP_200_OK)
+async def wait(request: Request, response: Response):
+    request.app.logger.info(f'Request wait until a Context Broker reaches a status')
+
+    content_type = request.headers.get('Content-Type')
+    if content_type == 'application/json':
+        json = await request.json()
+        broker = json["broker"]
+        target = json.get("state", "healthy")
+
+        try:
+            timeout = float(json.get("timeout", config['wait']['timeout']))
+            if not timeout >= 0:
+                raise ValueError(timeout)
+        except (TypeError, ValueError):
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            request.app.logger.error(f'POST /wait 400 Bad Request, invalid timeout {json.get("timeout")}')
+
+            return {'message': 'The timeout should be a positive number of seconds'}
+
+        try:
+            deployment = services.registry.find(broker=broker, deployment_id=json.get("deployment"))
+
+            resp = None
+            async for kind, data in watch_deployment(deployment, target, timeout, json.get("fail_fast", True)):
+                if kind in ("reached", "failed", "timeout"):
+                    resp = {**data, 'result': kind}
+
+            if resp['result'] == "timeout":
+                response.status_code = status.HTTP_408_REQUEST_TIMEOUT
+                request.app.logger.error(f'POST /wait 408 Request Timeout, broker {broker} is {resp["status"]}')
+            else:
+                response.status_code = status.HTTP_200_OK
+                request.app.logger.info(f'POST /wait 200 Wait Request, broker {broker} is {resp["status"]}')
+        except UnknownBroker as e:
+            handled(e)
+            resp = {'message': f'Unexpected name for the Context Broker. '
+                               f'Valid values: {services.compose.brokers.keys()}'}
+            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+            request.app.logger.error(f'POST /wait 500 Internal Server Error: {e.message}')
+        except Unimplemented as e:
+            handled(e)
+            resp = {'message': f'The deployment of {broker} is not implemented'}
+            response.status_code = status.HTTP_501_NOT_IMPLEMENTED
+            request.app.logger.error(f'POST /wait 501 Internal Server Error: {e.message}')
+        except InvalidDeployment as e:
+            handled(e)
+            resp = {'message': f'Invalid deployment {e.data}: {e.message}'}
+            response.status_code = status.HTTP_409_CONFLICT
+            request.app.logger.error(f'POST /wait 409 Conflict: {e.message}')
+        except UnknownDeployment as e:
+            handled(e)
+            resp = {'message': f'Unknown deployment {e.data} of the Context Broker {broker}'}
+            response.status_code = status.HTTP_404_NOT_FOUND
+            request.app.logger.error(f'POST /wait 404 Not Found: {e.message}')
+    else:
+        resp = {'message': 'Allowed Content-Type is only application/json'}
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        request.app.logger.error(f'POST /wait 400 Bad Request')
 
     return resp
 
 
+@application.get("/wait/stream", status_code=status.HTTP_200_OK)
+async def wait_stream(request: Request, response: Response, broker: str, deployment: str = None,
+                      state: str = "healthy", timeout: float = None, fail_fast: bool = True):
+    request.app.logger.info(f'Request stream of the transitions of a Context Broker')
+
+    try:
+        deployment = services.registry.find(broker=broker, deployment_id=deployment)
+    except UnknownBroker as e:
+        handled(e)
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        request.app.logger.error(f'GET /wait/stream 500 Internal Server Error: {e.message}')
+        return {'message': f'Unexpected name for the Context Broker. '
+                           f'Valid values: {services.compose.brokers.keys()}'}
+    except Unimplemented as e:
+        handled(e)
+        response.status_code = status.HTTP_501_NOT_IMPLEMENTED
+        request.app.logger.error(f'GET /wait/stream 501 Internal Server Error: {e.message}')
+        return {'message': f'The deployment of {broker} is not implemented'}
+    except InvalidDeployment as e:
+        handled(e)
+        response.status_code = status.HTTP_409_CONFLICT
+        request.app.logger.error(f'GET /wait/stream 409 Conflict: {e.message}')
+        return {'message': f'Invalid deployment {e.data}: {e.message}'}
+    except UnknownDeployment as e:
+        handled(e)
+        response.status_code = status.HTTP_404_NOT_FOUND
+        request.app.logger.error(f'GET /wait/stream 404 Not Found: {e.message}')
+        return {'message': f'Unknown deployment {e.data} of the Context Broker {broker}'}
+
+    timeout = timeout if timeout is not None else config['wait']['timeout']
+
+    async def events():
+        async for kind, data in watch_deployment(deployment, state, timeout, fail_fast):
+            yield f'event: {kind}\ndata: {dumps(data)}\n\n'
+
+    request.app.logger.info(f'GET /wait/stream 200 Stream Request, broker {broker}')
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@application.get("/logs", status_code=status.HTTP_200_OK)
+async def get_logs(request: Request, response: Response, broker: str, deployment: str = None, service: str = None,
+                   tail: int = 100, follow: bool = False, timestamps: bool = False):
+    request.app.logger.info(f'Request logs of the containers of a Context Broker')
+
+    try:
+        deployment = services.registry.find(broker=broker, deployment_id=deployment)
+    except UnknownBroker as e:
+        handled(e)
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        request.app.logger.error(f'GET /logs 500 Internal Server Error: {e.message}')
+        return {'message': f'Unexpected name for the Context Broker. '
+                           f'Valid values: {services.compose.brokers.keys()}'}
+    except Unimplemented as e:
+        handled(e)
+        response.status_code = status.HTTP_501_NOT_IMPLEMENTED
+        request.app.logger.error(f'GET /logs 501 Internal Server Error: {e.message}')
+        return {'message': f'The deployment of {broker} is not implemented'}
+    except InvalidDeployment as e:
+        handled(e)
+        response.status_code = status.HTTP_409_CONFLICT
+        request.app.logger.error(f'GET /logs 409 Conflict: {e.message}')
+        return {'message': f'Invalid deployment {e.data}: {e.message}'}
+    except UnknownDeployment as e:
+        handled(e)
+        response.status_code = status.HTTP_404_NOT_FOUND
+        request.app.logger.error(f'GET /logs 404 Not Found: {e.message}')
+        return {'message': f'Unknown deployment {e.data} of the Context Broker {broker}'}
+
+    names = [name for name, x in deployment.engine.get_container_names().items() if service in (None, x.name)]
+    if len(names) == 0:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        request.app.logger.error(f'GET /logs 404 Not Found, unknown service {service}')
+        return {'message': f'Unknown service {service} of the Context Broker {broker}'}
+
+    request.app.logger.info(f'GET /logs 200 Logs Request, broker {broker}, {len(names)} containers')
+
+    return StreamingResponse(stream_logs(deployment.engine.backend, names, tail, follow, timestamps),
+                             media_type='text/plain', headers={'Cache-Control': 'no-cache'})
+
+
+@application.post("/batch/init", status_code=status.HTTP_200_OK)
+async def batch_init(request: Request, response: Response):
+    request.app.logger.info(f'Request init a batch of Context Brokers')
+
+    content_type = request.headers.get('Content-Type')
+    if content_type == 'application/json':
+        json = await request.json()
+        batch = json.get("batch") or uuid4().hex[:8]
+        try:
+            timeout = float(json.get("timeout", config['wait']['timeout']))
+            if not timeout >= 0:
+                raise ValueError(timeout)
+            priority = int(json.get("priority", 0))
+        except (TypeError, ValueError):
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            request.app.logger.error(f'POST /batch/init 400 Bad Request, invalid timeout {json.get("timeout")} or '
+                                     f'priority {json.get("priority")}')
+
+            return {'message': 'The timeout should be a positive number of seconds and the priority an integer'}
+
+        try:
+            brokers = get_batch_brokers(json.get("brokers", "all"))
+
+            deployments = await run_in_threadpool(acquire_batch, batch, brokers)
+        except UnknownBroker as e:
+            handled(e)
+            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+            request.app.logger.error(f'POST /batch/init 500 Internal Server Error: {e.message}')
+            return {'message': f'Unexpected name for the Context Broker. '
+                               f'Valid values: {services.compose.brokers.keys()}'}
+        except Unimplemented as e:
+            handled(e)
+            response.status_code = status.HTTP_501_NOT_IMPLEMENTED
+            request.app.logger.error(f'POST /batch/init 501 Internal Server Error: {e.message}')
+            return {'message': f'The deployment of {e.data} is not implemented'}
+        except InvalidDeployment as e:
+            handled(e)
+            response.status_code = status.HTTP_409_CONFLICT
+            request.app.logger.error(f'POST /batch/init 409 Conflict: {e.message}')
+            return {'message': f'Invalid deployment {e.data}: {e.message}'}
+        except NoHealthyHost as e:
+            handled(e)
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            request.app.logger.error(f'POST /batch/init 503 Service Unavailable: {e.message}')
+            return {'message': f'The deployment {e.data} cannot be placed: {e.message}'}
+        except NoFreePort as e:
+            handled(e)
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            request.app.logger.error(f'POST /batch/init 503 Service Unavailable: {e.message}')
+            return {'message': f'The deployments of the batch cannot publish their ports: {e.message}'}
+
+        async def run(broker, deployment, emit):
+            admission = partial(services.scheduler.request, broker=broker, deployment_id=deployment.id,
+                                priority=priority) if services.scheduler is not None else None
+
+            try:
+                job = services.jobs.submit("init", broker, deploy, deployment, deployment=deployment.id,
+                                           admission=admission)
+            except AdmissionRejected as e:
+                handled(e)
+                await run_in_threadpool(services.registry.release, deployment)
+                await emit(broker, "rejected", {'message': e.message})
+                return "rejected"
+
+            await emit(broker, "job", {'job': job.id, 'deployment': deployment.id})
+
+            job = await follow_job(job, broker, emit)
+            if job.status != JobStatus.SUCCEEDED:
+                return "failed"
+
+            # The job ends after the up, the deployment is followed until its containers are healthy
+            async for kind, data in watch_deployment(deployment, "healthy", timeout):
+                await emit(broker, kind, data)
+                if kind in ("reached", "failed", "timeout"):
+                    return "healthy" if kind == "reached" else kind
+
+        header = {'batch': batch, 'deployments': {broker: {'deployment': deployment.id, 'ports': deployment.ports}
+                                                  for broker, deployment in deployments.items()}}
+
+        request.app.logger.info(f'POST /batch/init 200 Batch Request, batch {batch}, brokers {list(brokers)}')
+
+        return StreamingResponse(stream_batch(header, {broker: partial(run, broker, deployment)
+                                                       for broker, deployment in deployments.items()}),
+                                 media_type='application/x-ndjson', headers={'Cache-Control': 'no-cache'})
+    else:
+        resp = {'message': 'Allowed Content-Type is only application/json'}
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        request.app.logger.error(f'POST /batch/init 400 Bad Request')
+
+    return resp
+
+
+@application.post("/batch/clean", status_code=status.HTTP_200_OK)
+async def batch_clean(request: Request, response: Response):
+    request.app.logger.info(f'Request clean a batch of Context Brokers')
+
+    content_type = request.headers.get('Content-Type')
+    if content_type == 'application/json':
+        json = await request.json()
+        batch = json.get("batch")
+
+        if batch is None:
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            request.app.logger.error(f'POST /batch/clean 400 Bad Request, missing batch')
+            return {'message': 'The batch identifier is mandatory'}
+
+        try:
+            brokers = get_batch_brokers(json.get("brokers", "all"))
+        except UnknownBroker as e:
+            handled(e)
+            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+            request.app.logger.error(f'POST /batch/clean 500 Internal Server Error: {e.message}')
+            return {'message': f'Unexpected name for the Context Broker. '
+                               f'Valid values: {services.compose.brokers.keys()}'}
+        except Unimplemented as e:
+            handled(e)
+            response.status_code = status.HTTP_501_NOT_IMPLEMENTED
+            request.app.logger.error(f'POST /batch/clean 501 Internal Server Error: {e.message}')
+            return {'message': f'The deployment of {e.data} is not implemented'}
+
+        async def run(broker, emit):
+            try:
+                deployment = services.registry.get(f'{batch}-{broker.lower()}')
+            except UnknownDeployment as e:
+                handled(e)
+                await emit(broker, "skipped", {'message': e.message, 'deployment': e.data})
+                return "skipped"
+
+            job = services.jobs.submit("clean", broker, teardown, deployment, deployment=deployment.id)
+            await emit(broker, "job", {'job': job.id, 'deployment': deployment.id})
+
+            job = await follow_job(job, broker, emit)
+
+            return "cleaned" if job.status == JobStatus.SUCCEEDED else "failed"
+
+        request.app.logger.info(f'POST /batch/clean 200 Batch Request, batch {batch}, brokers {list(brokers)}')
+
+        return StreamingResponse(stream_batch({'batch': batch}, {broker: partial(run, broker) for broker in brokers}),
+                                 media_type='application/x-ndjson', headers={'Cache-Control': 'no-cache'})
+    else:
+        resp = {'message': 'Allowed Content-Type is only application/json'}
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        request.app.logger.error(f'POST /batch/clean 400 Bad Request')
+
+    return resp
+
+
+@application.get("/metrics", status_code=status.HTTP_200_OK)
+async def get_metrics():
+    data, content_type = export()
+
+    return Response(content=data, headers={"Content-Type": content_type})
+
+
+@application.get("/jobs", status_code=status.HTTP_200_OK)
+async def get_jobs(request: Request):
+    request.app.logger.info(f'Request list of jobs')
+
+    return services.jobs.list()
+
+
+@application.get("/jobs/{job_id}", status_code=status.HTTP_200_OK)
+async def get_job(request: Request, response: Response, job_id: str):
+    request.app.logger.info(f'Request status of the job {job_id}')
+
+    try:
+        resp = services.jobs.get(job_id).to_dict()
+        response.status_code = status.HTTP_200_OK
+    except UnknownJob as e:
+        handled(e)
+        resp = {'message': f'Unknown job identifier: {job_id}'}
+        response.status_code = status.HTTP_404_NOT_FOUND
+        request.app.logger.error(f'GET /jobs/{job_id} 404 Not Found: {e.message}')
+
+    return resp
+
+
+@application.get("/pool", status_code=status.HTTP_200_OK)
+async def get_pool(request: Request):
+    request.app.logger.info(f'Request statistics of the warm pool')
+
+    return services.pool.stats()
+
+
+@application.get("/snapshots", status_code=status.HTTP_200_OK)
+async def get_snapshots(request: Request):
+    request.app.logger.info(f'Request statistics of the volume snapshots')
+
+    return services.compose.volume_cache.stats() if services.compose.volume_cache is not None else dict()
+
+
+@application.get("/scheduler", status_code=status.HTTP_200_OK)
+async def get_scheduler(request: Request):
+    request.app.logger.info(f'Request statistics of the admission scheduler')
+
+    return await run_in_threadpool(services.scheduler.stats) if services.scheduler is not None else dict()
+
+
+@application.get("/diagnostics", status_code=status.HTTP_200_OK)
+async def get_diagnostics(request: Request):
+    request.app.logger.info(f'Request list of the diagnostics bundles')
+
+    return {
+        "bundles": services.diagnostics.list(),
+        "collector": services.collector.stats() if services.collector is not None else None
+    }
+
+
+@application.get("/diagnostics/{bundle_id}", status_code=status.HTTP_200_OK)
+async def get_diagnostics_bundle(request: Request, response: Response, bundle_id: str):
+    request.app.logger.info(f'Request diagnostics bundle {bundle_id}')
+
+    try:
+        resp = await run_in_threadpool(services.diagnostics.get, bundle_id)
+        response.status_code = status.HTTP_200_OK
+    except UnknownDiagnostics as e:
+        handled(e)
+        resp = {'message': f'Unknown diagnostics bundle identifier: {bundle_id}'}
+        response.status_code = status.HTTP_404_NOT_FOUND
+        request.app.logger.error(f'GET /diagnostics/{bundle_id} 404 Not Found: {e.message}')
+
+    return resp
+
+
+@application.get("/hosts", status_code=status.HTTP_200_OK)
+async def get_hosts(request: Request):
+    request.app.logger.info(f'Request status of the docker hosts')
+
+    return services.hosts.stats()
+
+
+@application.get("/deployments", status_code=status.HTTP_200_OK)
+async def get_deployments(request: Request):
+    request.app.logger.info(f'Request list of deployments')
+
+    return services.registry.list()
+
+
+@application.post("/sweep", status_code=status.HTTP_200_OK)
+async def sweep(request: Request, response: Response):
+    request.app.logger.info(f'Request sweep of the orphan containers, volumes and networks')
+
+    json = await request.json() if request.headers.get('Content-Type') == 'application/json' else dict()
+
+    # The resources of the deployments that are not alive are removed out of the event loop
+    try:
+        resp = await run_in_threadpool(services.sweeper.sweep, ttl=json.get("ttl"), dry_run=json.get("dry_run", False))
+
+        response.status_code = status.HTTP_200_OK
+        request.app.logger.info(f'POST /sweep 200 Sweep Request, reclaimed {resp["reclaimed_bytes"]} bytes')
+    except DockerBackendError as e:
+        handled(e)
+        resp = {'message': f'The docker engine could not be queried: {e.message}'}
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        request.app.logger.error(f'POST /sweep 500 Internal Server Error: {e.message}')
+
+    return resp
+
+
+@application.get("/sweep", status_code=status.HTTP_200_OK)
+async def get_sweep(request: Request):
+    request.app.logger.info(f'Request report of the last sweep')
+
+    return services.sweeper.last or dict()
+
+
+@application.post("/prefetch", status_code=status.HTTP_202_ACCEPTED)
+async def prefetch(request: Request, response: Response):
+    request.app.logger.info(f'Request prefetch of the broker images')
+
+    json = await request.json() if request.headers.get('Content-Type') == 'application/json' else dict()
+    brokers = json.get("brokers")
+
+    # The brokers are validated before the job is queued, the pulls run in the prefetcher workers
+    try:
+        services.prefetcher.images(brokers)
+        job = services.jobs.submit("prefetch", ','.join(brokers) if brokers else None, pull_images, brokers,
+                                   json.get("force", False))
+
+        resp = {'message': f'Prefetching the images', 'job': job.to_dict()}
+        response.status_code = status.HTTP_202_ACCEPTED
+        response.headers['Location'] = f'/jobs/{job.id}'
+        request.app.logger.info(f'POST /prefetch 202 Accepted Request, job {job.id}')
+    except UnknownBroker as e:
+        handled(e)
+        resp = {'message': f'Unexpected name for the Context Broker. '
+                           f'Valid values: {services.compose.brokers.keys()}'}
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        request.app.logger.error(f'POST /prefetch 500 Internal Server Error: {e.message}')
+
+    return resp
+
+
+@application.get("/prefetch", status_code=status.HTTP_200_OK)
+async def get_prefetch(request: Request):
+    request.app.logger.info(f'Request statistics of the image prefetch')
+
+    return services.prefetcher.stats()
+
+
+@application.get("/stalls", status_code=status.HTTP_200_OK)
+async def get_stalls(request: Request):
+    request.app.logger.info(f'Request stalls of the event loop')
+
+    return request.app.lag_monitor.stats()
+
+
+@application.get("/traces", status_code=status.HTTP_200_OK)
+async def get_traces(request: Request):
+    request.app.logger.info(f'Request list of the request traces')
+
+    return request.app.traces.list()
+
+
+@application.get("/traces/{trace_id}", status_code=status.HTTP_200_OK)
+async def get_trace(request: Request, response: Response, trace_id: str):
+    request.app.logger.info(f'Request trace {trace_id}')
+
+    try:
+        resp = request.app.traces.get(trace_id)
+        response.status_code = status.HTTP_200_OK
+    except UnknownTrace as e:
+        handled(e)
+        resp = {'message': f'Unknown trace identifier: {trace_id}'}
+        response.status_code = status.HTTP_404_NOT_FOUND
+        request.app.logger.error(f'GET /traces/{trace_id} 404 Not Found: {e.message}')
+
+    return resp
+
+
+@application.post("/profile", status_code=status.HTTP_200_OK)
+async def profile(request: Request, response: Response):
+    request.app.logger.info(f'Request sampling profile of the service')
+
+    json = await request.json() if request.headers.get('Content-Type') == 'application/json' else dict()
+
+    try:
+        seconds = float(json.get("seconds", 5))
+        if not 0 < seconds <= config['profiling']['max_sample']:
+            raise ValueError(seconds)
+    except (TypeError, ValueError):
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        request.app.logger.error(f'POST /profile 400 Bad Request, invalid seconds {json.get("seconds")}')
+
+        return {'message': f'The seconds should be a number between 0 and {config["profiling"]["max_sample"]}'}
+
+    # Every thread is sampled, the event loop keeps serving the other requests meanwhile
+    profiler = SamplingProfiler(interval=config['profiling']['sample_interval']).start()
+    try:
+        await sleep(seconds)
+    finally:
+        resp = await run_in_threadpool(profiler.stop)
+
+    request.app.logger.info(f'POST /profile 200 OK, {resp["samples"]} samples in {seconds}s')
+
+    return resp
+
+
+async def watch_deployment(deployment, target, timeout, fail_fast=True):
+    """
+    Follow a deployment until it reaches the target status. Without a synchronized health monitor the status
+    is polled instead of waiting for the container transitions.
+
+    :param deployment: the Deployment to follow
+    :param target: aggregated status to reach, e.g. "healthy", or "ready" to use the readiness probes too
+    :param timeout: maximum seconds to wait
+    :param fail_fast: finish when the deployment becomes unhealthy instead of waiting for the target
+    :return: async generator of (kind, data): "status" and "container" while waiting, and finally "reached",
+             "failed" or "timeout" with the last status
+    """
+    loop = get_running_loop()
+    deadline = loop.time() + timeout
+    subscription = None
+    interval = config['wait']['interval']
+    probe = target == "ready"
+    attempt = 0
+    engine = deployment.engine
+    monitor, prober = engine.monitor, services.prober
+
+    if monitor is not None:
+        subscription = monitor.subscribe(names=list(engine.get_container_names()))
+
+    try:
+        last = None
+        while True:
+            current = await get_health_status(deployment, probe=probe)
+
+            if last is None or current['status'] != last['status'] or current.get('ready') != last.get('ready'):
+                yield "status", current
+            last = current
+
+            if current['status'] == target or (probe and current['ready']):
+                yield "reached", current
+                return
+            elif fail_fast and current['status'] == "unhealthy":
+                yield "failed", await capture_diagnostics(deployment, "failed", current)
+                return
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                yield "timeout", await capture_diagnostics(deployment, "timeout", current)
+                return
+
+            # The probes are retried with a short growing backoff, the docker healthchecks are much coarser
+            if probe and prober is not None:
+                remaining = min(remaining, prober.backoff(attempt))
+                attempt += 1
+
+            if subscription is not None and monitor.synced:
+                transition = await subscription.get(timeout=remaining)
+                if transition is not None:
+                    yield "container", transition
+            else:
+                await sleep(min(interval, remaining))
+    finally:
+        if subscription is not None:
+            monitor.unsubscribe(subscription)
+
+
+async def capture_diagnostics(deployment, reason, current):
+    """
+    Capture the diagnostics bundle of a deployment that failed its health gate.
+
+    :return: the last status of the deployment with the identifier of the bundle
+    """
+    try:
+        bundle = await run_in_threadpool(services.diagnostics.capture, deployment, reason, current['status'])
+    except Exception as e:
+        handled(e)
+        logger.error(f'Unable to capture the diagnostics of {deployment.id}: {e}')
+        bundle = None
+
+    return {**current, 'diagnostics': bundle['id']} if bundle is not None else current
+
+
+async def stream_logs(backend, names, tail, follow, timestamps):
+    """
+    Merge the logs of several containers, each line prefixed with the container name. Every container is read in
+    its own thread, which waits while the queue is full, so a slow client never makes the lines pile up in memory.
+
+    :return: async generator of lines
+    """
+    loop = get_running_loop()
+    queue = Queue(maxsize=config['logs']['queue'])
+    stopped = Event()
+    streams = list()
+
+    def put(item):
+        future = run_coroutine_threadsafe(queue.put(item), loop)
+        while not stopped.is_set():
+            try:
+                return future.result(timeout=1)
+            except FutureTimeout:
+                continue
+        future.cancel()
+
+    def reader(name):
+        try:
+            stream = backend.container_logs(name, tail=tail, follow=follow)
+            streams.append(stream)
+            if stopped.is_set():
+                stream.close()
+
+            for at, text in stream:
+                stamp = f'{datetime.fromtimestamp(at).isoformat()} ' if timestamps and at is not None else ''
+                put(f'{name} | {stamp}{text}\n')
+        except Exception as e:
+            handled(e)
+            if not stopped.is_set():
+                put(f'{name} | Unable to read the logs: {e}\n')
+        finally:
+            put(None)
+
+    for name in names:
+        Thread(target=reader, args=(name,), name=f'logs-{name}', daemon=True).start()
+
+    try:
+        pending = len(names)
+        while pending > 0:
+            line = await queue.get()
+            if line is None:
+                pending -= 1
+            else:
+                yield line
+    finally:
+        # The client went away, the followed streams are closed so their threads end
+        stopped.set()
+        for stream in list(streams):
+            stream.close()
+
+
+async def get_health_status(deployment, probe=False):
+    """
+    Health status of a deployment, optionally with the result of the active readiness probes of the broker.
+    A deployment is ready when its containers are healthy or when all its probes succeed. The status is kept as
+    the last known health of the deployment.
+    """
+    engine = deployment.engine
+    monitor, prober = engine.monitor, services.prober
+
+    if monitor is not None and monitor.synced:
+        resp = engine.check_health_status()
+    else:
+        resp = await run_in_threadpool(engine.check_health_status)
+
+    # Only a change of the health is written in the journal
+    if resp['status'] != deployment.health:
+        await run_in_threadpool(services.registry.observe, deployment, resp['status'])
+
+    if probe:
+        resp['ready'] = resp['status'] == "healthy"
+
+        if prober is not None and prober.supports(engine.broker):
+            probes = await prober.probe(engine)
+            # Without containers the probes could be answered by another stack publishing the same ports
+            resp['ready'] = resp['ready'] or (probes['ready'] and resp['status'] != "absent")
+            resp['probes'] = probes['probes']
+
+    return resp
+
+
+def acquire_batch(batch, brokers):
+    """
+    Create the deployments of a batch, every broker of the batch is an isolated deployment with its own host
+    ports, so they run together. If one of them cannot be created, none is kept.
+
+    :return: dict with the Deployment of each broker
+    """
+    deployments = dict()
+
+    try:
+        for broker in brokers:
+            deployments[broker] = services.registry.acquire(broker=broker, deployment_id=f'{batch}-{broker.lower()}',
+                                                            remap_ports=True)
+    except Exception:
+        # The batch is created as a whole, the deployments already created are released
+        for deployment in deployments.values():
+            services.registry.release(deployment)
+        raise
+
+    return deployments
+
+
+def get_batch_brokers(brokers):
+    """
+    :param brokers: list of context broker names, or "all" for every implemented broker
+    :return: the list of brokers without duplicates
+    """
+    available = services.compose.brokers
+
+    if brokers == "all":
+        return [broker for broker, files in available.items() if len(files) > 0]
+
+    for broker in brokers:
+        if broker not in available:
+            raise UnknownBroker(data=broker, message=f'Unknown Context Broker name. Valid values: {available.keys()}')
+        elif len(available[broker]) == 0:
+            raise Unimplemented(data=broker)
+
+    return list(dict.fromkeys(brokers))
+
+
+async def follow_job(job, broker, emit, interval=0.25):
+    """
+    Emit the steps of a job while it runs and the job itself once it finishes.
+
+    :return: the finished Job
+    """
+    sent = 0
+    while True:
+        finished = job.finished is not None
+
+        for step in job.steps[sent:]:
+            await emit(broker, "step", step)
+        sent = len(job.steps)
+
+        if finished:
+            await emit(broker, "status", {'job': job.id, 'status': job.status.value, 'duration': job.duration,
+                                          'result': job.result, 'error': job.error})
+            return job
+
+        await sleep(interval)
+
+
+async def stream_batch(header, runners):
+    """
+    Run the coroutine of every broker of a batch concurrently and merge their events in a single stream of JSON
+    lines. The first line describes the batch and the last one summarizes the result of each broker.
+
+    :param header: content of the first "batch" event
+    :param runners: dict broker -> coroutine function receiving the emit callback, it returns the broker result
+    :return: async generator of JSON lines
+    """
+    queue = Queue()
+    start = perf_counter()
+    results = dict()
+
+    async def emit(broker, kind, data):
+        await queue.put({'event': kind, 'broker': broker, 'elapsed': round(perf_counter() - start, 3), **data})
+
+    async def task(broker, runner):
+        try:
+            result = await runner(emit)
+        except Exception as e:
+            handled(e)
+            logger.error(f'Batch operation of {broker} failed: {e}')
+            await emit(broker, "error", {'message': str(e)})
+            result = "failed"
+
+        results[broker] = {'result': result, 'duration': round(perf_counter() - start, 3)}
+        await queue.put(None)
+
+    yield dumps({'event': "batch", **header}) + '\n'
+
+    tasks = [create_task(task(broker, runner)) for broker, runner in runners.items()]
+
+    try:
+        pending = len(tasks)
+        while pending > 0:
+            event = await queue.get()
+            if event is None:
+                pending -= 1
+            else:
+                yield dumps(event) + '\n'
+
+        # The sum of the durations is what the brokers would take one after another
+        yield dumps({'event': "summary", 'wall_time': round(perf_counter() - start, 3),
+                     'sequential_time': round(sum(x['duration'] for x in results.values()), 3),
+                     'results': results}) + '\n'
+    finally:
+        # The client closed the stream, the jobs keep running but they are not followed anymore
+        for x in tasks:
+            x.cancel()
+
+
+def deploy(job, deployment):
+    try:
+        with deployment.hold("init") as engine:
+            result = engine.up(progress=job.step)
+
+        # The first deployment with the current images saves its volumes once healthy, the job ends afterwards.
+        # The deployment is only held while the tarballs are written, a clean is not delayed by the wait
+        snapshot = engine.snapshot_volumes(progress=job.step,
+                                           timeout=config['volume_cache']['timeout'],
+                                           interval=config['volume_cache']['interval'],
+                                           deployment=deployment)
+        if snapshot is not None:
+            if 'error' in snapshot and not deployment.released:
+                snapshot['diagnostics'] = services.diagnostics.capture_failure(deployment, "snapshot")
+            result['snapshot'] = snapshot
+    except Exception:
+        if not deployment.released:
+            services.diagnostics.capture_failure(deployment, "init")
+
+        # A failed deployment does not keep the resources of the host reserved
+        if services.scheduler is not None:
+            services.scheduler.release(deployment.id)
+        raise
+
+    return {'message': f'Deployed the Context Broker: {deployment.broker}', 'deployment': deployment.id, **result}
+
+
+def wipe(job, deployment):
+    with deployment.hold("reset") as engine:
+        drivers = engine.reset(progress=job.step)
+
+    return {'message': f'Reset the Context Broker: {deployment.broker}', 'deployment': deployment.id,
+            'drivers': drivers}
+
+
+def teardown(job, deployment):
+    with deployment.hold("clean") as engine:
+        engine.down(progress=job.step)
+        services.registry.release(deployment)
+
+    if services.scheduler is not None:
+        services.scheduler.release(deployment.id)
+
+    # Top up the warm pool in case a replacement failed while the deployment was running
+    services.pool.refill(deployment.broker)
+
+    return {'message': f'Cleaned the Context Broker: {deployment.broker}', 'deployment': deployment.id}
+
+
+def pull_images(job, brokers, force):
+    return services.prefetcher.prefetch(brokers=brokers, force=force, progress=job.step)
+
+
 def get_uptime():
     now = datetime.now()
     delta = now - initial_uptime
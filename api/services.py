@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from threading import RLock, Event, Thread
+from time import perf_counter
+from logging import getLogger
+from starlette.concurrency import run_in_threadpool
+from common.config import config
+
+logger = getLogger(__name__)
+
+
+class Services:
+    """
+    Subsystems of the service, created on their first use so that importing the server only pays for FastAPI.
+    The modules of each subsystem are imported inside its factory, therefore the recorded timings include both
+    the import and the initialization of the subsystem, but not of its dependencies.
+    """
+    def __init__(self, **instances):
+        """
+        :param instances: subsystems created by the caller instead of the factories, e.g. the backend of a benchmark
+        """
+        self.instances = dict(instances)
+        self.timings = dict()
+        self.lock = RLock()
+        self.ready = Event()
+        self.error = None
+        self.thread = None
+
+    @property
+    def backend(self):
+        def factory():
+            from components.docker_backend import create_backend
+
+            return create_backend(config['docker'])
+
+        return self._resolve("backend", factory)
+
+    @property
+    def monitor(self):
+        if not config['health_monitor']['enabled']:
+            return None
+
+        backend = self.backend
+
+        def factory():
+            from components.health_monitor import HealthMonitor
+            from components.metrics import StartingTimeCollector
+
+            monitor = HealthMonitor(backend=backend)
+            monitor.attach(StartingTimeCollector())
+
+            return monitor
+
+        return self._resolve("monitor", factory)
+
+    @property
+    def compose(self):
+        monitor, backend = self.monitor, self.backend
+
+        def factory():
+            from components.compose import Compose
+            from components.build_cache import BuildCache
+            from components.volume_cache import VolumeCache
+
+            volume_cache = VolumeCache(path=config['volume_cache']['path'],
+                                       brokers=config['volume_cache']['brokers'],
+                                       image=config['volume_cache']['image'],
+                                       max_bytes=config['volume_cache']['max_bytes'],
+                                       max_age=config['volume_cache']['max_age']) \
+                if config['volume_cache']['enabled'] else None
+
+            return Compose(build_cache=BuildCache(path=config['build_cache']['path']),
+                           monitor=monitor,
+                           backend=backend,
+                           volume_cache=volume_cache)
+
+        return self._resolve("compose", factory)
+
+    @property
+    def hosts(self):
+        backend, monitor, compose = self.backend, self.monitor, self.compose
+
+        def factory():
+            from components.docker_backend import create_backend
+            from components.hosts import DockerHost, HostPool
+            from components.ports import PortAllocator
+
+            # The local engine reuses the backend and the health monitor of the service
+            hosts = [DockerHost(name=config['hosts']['local']['name'], backend=backend, monitor=monitor,
+                                address=config['hosts']['local']['address'],
+                                ports=PortAllocator(host=config['ports']['host'],
+                                                    start=config['ports']['start'],
+                                                    end=config['ports']['end']))] \
+                if config['hosts']['local']['enabled'] else list()
+
+            # The ports of a remote engine cannot be checked from here, its allocator only tracks the ports handed out
+            hosts += [DockerHost(name=engine['name'],
+                                 backend=create_backend({**config['docker'], **engine}),
+                                 host=engine.get('host'),
+                                 context=engine.get('context'),
+                                 address=engine.get('address'),
+                                 ports=PortAllocator(start=config['ports']['start'],
+                                                     end=config['ports']['end'],
+                                                     check=False))
+                      for engine in config['hosts']['engines']]
+
+            return HostPool(hosts=hosts,
+                            footprints=compose.footprints,
+                            interval=config['hosts']['interval'],
+                            failures=config['hosts']['failures'])
+
+        return self._resolve("hosts", factory)
+
+    @property
+    def registry(self):
+        compose, hosts = self.compose, self.hosts
+
+        def factory():
+            from components.deployments import DeploymentRegistry
+            from components.journal import DeploymentJournal
+
+            journal = DeploymentJournal(path=config['journal']['path']) if config['journal']['enabled'] else None
+
+            # The host ports are allocated by the docker host of each deployment
+            registry = DeploymentRegistry(compose=compose, path=config['deployments']['path'], hosts=hosts,
+                                          journal=journal)
+
+            # The deployments of the previous run are known before the first request uses the registry
+            registry.restore()
+
+            return registry
+
+        return self._resolve("registry", factory)
+
+    @property
+    def jobs(self):
+        def factory():
+            from components.jobs import JobManager
+
+            return JobManager(workers=config['jobs']['workers'], history=config['jobs']['history'])
+
+        return self._resolve("jobs", factory)
+
+    @property
+    def scheduler(self):
+        if not config['scheduler']['enabled']:
+            return None
+
+        hosts, compose = self.hosts, self.compose
+
+        def factory():
+            from pathlib import Path
+            from components.scheduler import AdmissionScheduler, HostAdmission
+
+            # The local engine keeps the configured file of learned footprints, every other host has its own
+            def scheduler(host):
+                path = Path(config['scheduler']['path'])
+                if host.host is not None or host.context is not None:
+                    path = path.with_name(f'{path.stem}-{host.name}{path.suffix}')
+
+                return AdmissionScheduler(backend=host.backend,
+                                          footprints=compose.footprints,
+                                          path=str(path),
+                                          reserve=config['scheduler']['reserve'],
+                                          cpu_overcommit=config['scheduler']['cpu_overcommit'],
+                                          max_queue=config['scheduler']['max_queue'],
+                                          max_wait=config['scheduler']['max_wait'],
+                                          aging=config['scheduler']['aging'],
+                                          interval=config['scheduler']['interval'],
+                                          name=host.name)
+
+            return HostAdmission(hosts=hosts, factory=scheduler)
+
+        return self._resolve("scheduler", factory)
+
+    @property
+    def pool(self):
+        registry, scheduler, diagnostics = self.registry, self.scheduler, self.diagnostics
+
+        def factory():
+            from components.warm_pool import WarmPool
+
+            return WarmPool(registry=registry,
+                            sizes=config['pool']['sizes'],
+                            workers=config['pool']['workers'],
+                            timeout=config['pool']['timeout'],
+                            interval=config['pool']['interval'],
+                            scheduler=scheduler,
+                            diagnostics=diagnostics)
+
+        return self._resolve("pool", factory)
+
+    @property
+    def prober(self):
+        if not config['probes']['enabled']:
+            return None
+
+        def factory():
+            from components.probes import ReadinessProber
+
+            return ReadinessProber(host=config['probes']['host'],
+                                   timeout=config['probes']['timeout'],
+                                   max_connections=config['probes']['max_connections'],
+                                   initial_backoff=config['probes']['initial_backoff'],
+                                   max_backoff=config['probes']['max_backoff'])
+
+        return self._resolve("prober", factory)
+
+    @property
+    def sweeper(self):
+        hosts, registry = self.hosts, self.registry
+
+        def factory():
+            from components.sweeper import OrphanSweeper
+
+            return OrphanSweeper(hosts=hosts,
+                                 registry=registry,
+                                 ttl=config['sweeper']['ttl'],
+                                 interval=config['sweeper']['interval'] if config['sweeper']['enabled'] else 0,
+                                 workers=config['sweeper']['workers'])
+
+        return self._resolve("sweeper", factory)
+
+    @property
+    def collector(self):
+        if not config['logs']['enabled']:
+            return None
+
+        hosts = self.hosts
+
+        def factory():
+            from components.log_collector import LogCollector
+
+            return LogCollector(backends={host.name: host.backend for host in hosts.hosts.values()},
+                                lines=config['logs']['lines'],
+                                max_line=config['logs']['max_line'],
+                                interval=config['logs']['interval'],
+                                workers=config['logs']['workers'])
+
+        return self._resolve("collector", factory)
+
+    @property
+    def diagnostics(self):
+        collector = self.collector
+
+        def factory():
+            from components.diagnostics import DiagnosticsRecorder
+
+            return DiagnosticsRecorder(collector=collector,
+                                       path=config['diagnostics']['path'],
+                                       max_bundles=config['diagnostics']['max_bundles'],
+                                       tail=config['diagnostics']['tail'],
+                                       min_interval=config['diagnostics']['min_interval'])
+
+        return self._resolve("diagnostics", factory)
+
+    @property
+    def prefetcher(self):
+        compose, hosts = self.compose, self.hosts
+
+        def factory():
+            from components.prefetch import ImagePrefetcher
+
+            return ImagePrefetcher(compose=compose,
+                                   hosts=hosts,
+                                   workers=config['prefetch']['workers'],
+                                   interval=config['prefetch']['interval'] if config['prefetch']['enabled'] else 0,
+                                   on_start=config['prefetch']['enabled'] and config['prefetch']['on_start'])
+
+        return self._resolve("prefetcher", factory)
+
+    def initialize(self):
+        """
+        Create every subsystem without starting their background work.
+
+        :return: seconds spent in each subsystem
+        """
+        for name in ("backend", "monitor", "compose", "hosts", "registry", "jobs", "scheduler", "pool", "prober",
+                     "sweeper", "collector", "diagnostics", "prefetcher"):
+            getattr(self, name)
+
+        return dict(self.timings)
+
+    def start(self, background=True):
+        """
+        Create the subsystems and start the health monitor, the checks of the docker hosts, the admission
+        scheduler, the warm pool, the orphan sweeper, the log collector and the image prefetcher. The service is
+        ready afterwards.
+
+        :param background: run in a daemon thread, so that the server answers while the subsystems are created
+        """
+        if background:
+            self.thread = Thread(target=self.start, args=(False,), name="services-start", daemon=True)
+            self.thread.start()
+            return
+
+        try:
+            self.initialize()
+
+            if self.monitor is not None:
+                self.monitor.start()
+
+            self.hosts.start()
+
+            if self.scheduler is not None:
+                self.scheduler.start()
+
+            self.pool.start()
+            self.sweeper.start()
+
+            if self.collector is not None:
+                self.collector.start()
+
+            self.prefetcher.start()
+            self.ready.set()
+        except Exception as e:
+            self.error = e
+            logger.error(f'Unable to start the services: {e}')
+
+    async def stop(self):
+        """
+        Stop only the subsystems that were created. The blocking stops, e.g. the compose down of the standby
+        deployments of the warm pool, run in the threadpool so the event loop keeps serving meanwhile.
+        """
+        await run_in_threadpool(self._stop)
+
+        if "prober" in self.instances:
+            await self.instances["prober"].close()
+
+    def _stop(self):
+        if "jobs" in self.instances:
+            self.instances["jobs"].shutdown()
+
+        if "pool" in self.instances:
+            self.instances["pool"].shutdown()
+
+        if "monitor" in self.instances:
+            self.instances["monitor"].stop()
+
+        if "hosts" in self.instances:
+            self.instances["hosts"].stop()
+
+        if "sweeper" in self.instances:
+            self.instances["sweeper"].stop()
+
+        if "collector" in self.instances:
+            self.instances["collector"].stop()
+
+        if "prefetcher" in self.instances:
+            self.instances["prefetcher"].stop()
+
+        if "scheduler" in self.instances:
+            self.instances["scheduler"].stop()
+
+        if "registry" in self.instances and self.instances["registry"].journal is not None:
+            self.instances["registry"].journal.close()
+
+    def status(self):
+        status = "ready" if self.ready.is_set() else "failed" if self.error is not None else "starting"
+        resp = {
+            "status": status,
+            "subsystems": {name: round(duration, 6) for name, duration in self.timings.items()}
+        }
+
+        if self.error is not None:
+            resp["error"] = str(self.error)
+
+        return resp
+
+    def _resolve(self, name, factory):
+        # The instances are only added once created, the subsystems already created are returned without locking
+        instance = self.instances.get(name)
+        if instance is not None:
+            return instance
+
+        # Reentrant because the dependencies of a subsystem are resolved before its own factory runs
+        with self.lock:
+            if name not in self.instances:
+                started = perf_counter()
+                self.instances[name] = factory()
+                self.timings[name] = perf_counter() - started
+
+            return self.instances[name]
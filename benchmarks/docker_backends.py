@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+"""Benchmark of the docker backends used for ps/inspect/volume/network calls
+
+Usage:
+  docker_backends.py [--socket SOCKET] [--containers N] [--iterations N] [--fake]
+  docker_backends.py [-H | --help]
+
+Options:
+  -s, --socket SOCKET     docker engine unix socket [default: /var/run/docker.sock]
+  -c, --containers N      containers created in the fake docker engine [default: 10]
+  -i, --iterations N      calls measured for each operation [default: 100]
+  -f, --fake              run against a stand-in docker engine on a temporary socket
+
+  -H, --help              show this help message and exit
+
+"""
+from docopt import docopt
+from json import dumps
+from os.path import join
+from shutil import which
+from statistics import mean, median, quantiles
+from tempfile import mkdtemp
+from time import perf_counter
+from python_on_whales import DockerClient
+from components.docker_backend import NativeBackend, WhalesBackend
+from utils.fake_docker import FakeDocker
+
+
+def measure(function, iterations):
+    timings = list()
+
+    for _ in range(iterations):
+        start = perf_counter()
+        function()
+        timings.append((perf_counter() - start) * 1000)
+
+    return {
+        "mean_ms": round(mean(timings), 3),
+        "p50_ms": round(median(timings), 3),
+        "p95_ms": round(quantiles(timings, n=20)[-1], 3) if len(timings) > 1 else round(timings[0], 3),
+        "max_ms": round(max(timings), 3)
+    }
+
+
+def run(backend, iterations):
+    container = backend.list_containers(all=True)[0]
+
+    return {
+        "list_containers": measure(lambda: backend.list_containers(all=True), iterations),
+        "inspect_container": measure(lambda: backend.inspect_containers([container["id"]]), iterations),
+        "list_volumes": measure(lambda: backend.list_volumes(), iterations),
+        "list_networks": measure(lambda: backend.list_networks(), iterations)
+    }
+
+
+def main():
+    args = docopt(__doc__)
+    socket_path = args['--socket']
+    fake = None
+
+    if args['--fake']:
+        socket_path = join(mkdtemp(), 'docker.sock')
+        fake = FakeDocker(socket_path).start()
+        for index in range(int(args['--containers'])):
+            fake.add_container(f'benchmark-{index}', health="healthy", labels={"com.docker.compose.project": "bench"})
+        fake.add_volume("benchmark-volume")
+        fake.add_network("benchmark-network")
+
+    iterations = int(args['--iterations'])
+    results = {"socket": socket_path, "iterations": iterations}
+
+    try:
+        native = NativeBackend(socket_path=socket_path)
+        results["native"] = run(native, iterations)
+        native.close()
+
+        if which('docker') is not None:
+            results["whales"] = run(WhalesBackend(DockerClient(host=f'unix://{socket_path}')), iterations)
+        else:
+            results["whales"] = "skipped, the docker CLI is not installed"
+    finally:
+        if fake is not None:
+            fake.stop()
+
+    print(dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
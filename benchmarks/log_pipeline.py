@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+"""Benchmark of the logging pipelines, records per second from the stdlib loggers to the sinks
+
+Usage:
+  log_pipeline.py [--records N] [--sample RATE]
+  log_pipeline.py [-H | --help]
+
+Options:
+  -n, --records N      records logged per scenario [default: 20000]
+  -s, --sample RATE    access log sampling rate of the json mode [default: 0.1]
+
+  -H, --help           show this help message and exit
+
+"""
+import sys
+from docopt import docopt
+from json import dumps
+from logging import getLogger, basicConfig
+from os import devnull
+from os.path import join
+from tempfile import mkdtemp
+from time import perf_counter
+from loguru import logger
+from api.custom_logging import CustomizeLogger, InterceptHandler
+
+log_format = "<level>{level: <8}</level> {time} {extra[request_id]} {name}:{function} - {message}"
+
+
+def emit(records, level="info", name="uvicorn.error"):
+    stdlib = getLogger(name)
+    log = getattr(stdlib, level)
+
+    for index in range(records):
+        log("GET /check_status 200 %d", index)
+
+
+def scenario(configure, flush, records, level="info", name="uvicorn.error"):
+    configure()
+
+    start = perf_counter()
+    emit(records, level=level, name=name)
+    flush()
+
+    return round(records / (perf_counter() - start))
+
+
+def main():
+    args = docopt(__doc__)
+    records = int(args['--records'])
+    sample = float(args['--sample'])
+    folder = mkdtemp()
+    stdout, sys.stdout = sys.stdout, open(devnull, 'w')
+    writers = list()
+
+    def legacy():
+        # Configuration before the level gating: every record reaches the InterceptHandler and the uvicorn
+        # records are handled by their own handler and again by the root one
+        def configure():
+            CustomizeLogger.customize_logging(filepath=join(folder, 'legacy.log'), level="info",
+                                              rotation="20 days", retention="1 months", format=log_format)
+            basicConfig(handlers=[InterceptHandler()], level=0, force=True)
+
+            for _log in ['uvicorn', 'uvicorn.error', 'uvicorn.access', 'fastapi']:
+                _logger = getLogger(_log)
+                _logger.handlers = [InterceptHandler()]
+                _logger.propagate = True
+                _logger.filters = list()
+
+        return configure
+
+    def loguru(rate=1):
+        return lambda: CustomizeLogger.customize_logging(filepath=join(folder, 'loguru.log'), level="info",
+                                                         rotation="20 days", retention="1 months",
+                                                         format=log_format, access_sample_rate=rate)
+
+    def json(rate=1):
+        def configure():
+            CustomizeLogger.customize_json_logging(filepath=join(folder, 'json.log'), level="info",
+                                                   access_sample_rate=rate)
+            writers.append(getLogger().handlers[0].writer)
+
+        return configure
+
+    def flush_json():
+        writers[-1].close()
+
+    results = {
+        "records": records,
+        "records_per_second": {
+            "legacy": scenario(legacy(), logger.complete, records),
+            "loguru": scenario(loguru(), logger.complete, records),
+            "json": scenario(json(), flush_json, records),
+            "legacy_filtered_debug": scenario(legacy(), logger.complete, records, level="debug"),
+            "loguru_filtered_debug": scenario(loguru(), logger.complete, records, level="debug"),
+            "json_filtered_debug": scenario(json(), flush_json, records, level="debug"),
+            f"loguru_access_sampled_{sample}": scenario(loguru(sample), logger.complete, records, name="uvicorn.access"),
+            f"json_access_sampled_{sample}": scenario(json(sample), flush_json, records, name="uvicorn.access")
+        }
+    }
+
+    sys.stdout = stdout
+    print(dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+"""Micro-benchmark of the per-request overhead of the security headers middleware
+
+Compares the previous implementation (BaseHTTPMiddleware building the secure objects on every response)
+with the precomputed headers of api.middleware.SecureHeadersMiddleware, calling the ASGI applications
+directly so no network or docker operation is involved.
+
+Usage:
+  middleware.py [--requests N]
+  middleware.py [-H | --help]
+
+Options:
+  -n, --requests N     requests measured per endpoint and implementation [default: 5000]
+
+  -H, --help           show this help message and exit
+
+"""
+from asyncio import run
+from docopt import docopt
+from json import dumps
+from time import perf_counter
+from fastapi import FastAPI, Request
+from secure import Server, ContentSecurityPolicy, StrictTransportSecurity, \
+    ReferrerPolicy, PermissionsPolicy, CacheControl, Secure
+from api.middleware import SecureHeadersMiddleware, build_secure_headers
+
+
+async def set_secure_headers(request, call_next):
+    # Implementation before the precomputed headers, kept as reference
+    response = await call_next(request)
+    server = Server().set("Secure")
+
+    csp = (
+        ContentSecurityPolicy().default_src("'none'")
+                               .base_uri("'self'")
+                               .connect_src("'self'" "api.spam.com")
+                               .frame_src("'none'")
+                               .img_src("'self'", "static.spam.com")
+    )
+
+    hsts = StrictTransportSecurity().include_subdomains().preload().max_age(2592000)
+
+    referrer = ReferrerPolicy().no_referrer()
+
+    permissions_value = (
+        PermissionsPolicy().geolocation("self", "'spam.com'").vibrate()
+    )
+
+    cache_value = CacheControl().must_revalidate()
+
+    secure_headers = Secure(
+        server=server,
+        csp=csp,
+        hsts=hsts,
+        referrer=referrer,
+        permissions=permissions_value,
+        cache=cache_value,
+    )
+
+    secure_headers.framework.fastapi(response)
+
+    return response
+
+
+def create_app(precomputed):
+    app = FastAPI()
+
+    if precomputed:
+        app.add_middleware(SecureHeadersMiddleware, headers=build_secure_headers())
+    else:
+        app.middleware("http")(set_secure_headers)
+
+    @app.get("/version")
+    def getversion():
+        return {"version": "benchmark"}
+
+    @app.post("/check_status")
+    async def check_status(request: Request):
+        json = await request.json()
+        return {"status": "healthy", "containers": [], "broker": json["broker"]}
+
+    return app
+
+
+async def call(app, method, path, body=b''):
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+             "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+             "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+             "client": ("127.0.0.1", 1234), "server": ("127.0.0.1", 5000)}
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def measure(app, method, path, body, requests):
+    # Warm up the routing and the middleware stack before measuring
+    for _ in range(100):
+        await call(app, method, path, body)
+
+    start = perf_counter()
+    for _ in range(requests):
+        await call(app, method, path, body)
+
+    return (perf_counter() - start) / requests * 1e6
+
+
+async def benchmark(requests):
+    endpoints = {"/version": ("GET", b''), "/check_status": ("POST", dumps({"broker": "Stellio"}).encode())}
+    apps = {"before": create_app(precomputed=False), "after": create_app(precomputed=True)}
+    results = dict()
+
+    for path, (method, body) in endpoints.items():
+        timings = {name: await measure(app, method, path, body, requests) for name, app in apps.items()}
+        results[path] = {
+            "before_us": round(timings["before"], 1),
+            "after_us": round(timings["after"], 1),
+            "speedup": round(timings["before"] / timings["after"], 2)
+        }
+
+    return results
+
+
+def main():
+    args = docopt(__doc__)
+
+    print(dumps(run(benchmark(int(args['--requests']))), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from datetime import datetime
+from json import dump, load
+from math import ceil
+from os.path import join
+from tempfile import mkdtemp
+from time import perf_counter, sleep
+from api.services import Services
+from components.compose import Compose
+from components.docker_backend import NativeBackend
+from utils.fake_docker import FakeDocker, FakeDockerClient
+
+phases = ["build", "up", "healthy", "down"]
+
+
+class LifecycleBenchmark:
+    """
+    Drive the Compose engine through init -> healthy -> clean cycles per broker, recording the duration of
+    each phase and the time each container needs to become healthy after the up.
+
+    The Compose engine, its build and volume caches and the health monitor are created by the subsystems of the
+    service, so Compose.up and the health checks take the same paths as a deployment of the service. The up
+    phase includes the restore of the volumes from the volume cache.
+
+    In fake mode the docker engine is replaced by utils.fake_docker, so only the overhead of the service is
+    measured (compose model, docker backend calls, health aggregation), not the containers themselves.
+    """
+    def __init__(self, brokers, cycles=3, timeout=600, interval=1.0, fake=False):
+        self.brokers = brokers
+        self.cycles = cycles
+        self.timeout = timeout
+        self.interval = interval
+        self.fake = None
+
+        if fake:
+            self.fake = FakeDocker(join(mkdtemp(), 'docker.sock')).start()
+            self.services = Services(backend=NativeBackend(socket_path=self.fake.socket_path))
+        else:
+            self.services = Services()
+
+        self.compose = self.services.compose
+        self.monitor = self.services.monitor
+
+    def run(self):
+        results = {
+            "date": datetime.now().isoformat(),
+            "mode": "fake" if self.fake is not None else "docker",
+            "cycles": self.cycles,
+            "brokers": dict()
+        }
+
+        # The health checks are answered by the monitor once it is synchronized, as in the service
+        if self.monitor is not None:
+            self.monitor.start()
+            start = perf_counter()
+            while not self.monitor.synced and perf_counter() - start < 10:
+                sleep(0.01)
+
+        try:
+            for broker in self.brokers:
+                samples = [self.cycle(broker) for _ in range(self.cycles)]
+                results["brokers"][broker] = summarize(samples)
+        finally:
+            if self.monitor is not None:
+                self.monitor.stop()
+
+            if self.fake is not None:
+                self.fake.stop()
+
+        return results
+
+    def cycle(self, broker):
+        engine = self.compose.session(broker=broker)
+
+        if self.fake is not None:
+            engine.dockerEngine = FakeDockerClient(docker=self.fake, engine=engine)
+
+        timings, containers = dict(), dict()
+
+        # The build is the first step of the up, the restore of the volumes and the up of the containers follow
+        steps = list()
+        start = perf_counter()
+        engine.up(progress=lambda step: steps.append((step, perf_counter())))
+        end = perf_counter()
+        built = next((at for step, at in steps if step != "build"), end)
+        timings["build"] = built - start
+        timings["up"] = end - built
+
+        expected = engine.get_container_names()
+        start = perf_counter()
+        status = None
+        while perf_counter() - start < self.timeout:
+            status = engine.check_health_status()
+
+            # The containers without healthcheck only need to be running, the health of the others is "unknown"
+            # until the monitor inspects them after the start
+            ready = [x["name"] for x in status["containers"] if x["status"] == "running" and
+                     (x["health"] == "healthy" or x["name"] in expected and expected[x["name"]].healthcheck is None)]
+            for name in ready:
+                containers.setdefault(name, perf_counter() - start)
+
+            if status["status"] == "unhealthy" or len(ready) == len(expected):
+                break
+
+            sleep(self.interval)
+        timings["healthy"] = perf_counter() - start
+
+        start = perf_counter()
+        engine.down()
+        timings["down"] = perf_counter() - start
+
+        return {"phases": timings, "containers": containers, "status": status["status"] if status else None}
+
+
+def percentiles(values):
+    values = sorted(values)
+
+    def rank(p):
+        return values[min(len(values) - 1, max(0, ceil(p / 100 * len(values)) - 1))]
+
+    return {
+        "min": values[0],
+        "p50": rank(50),
+        "p90": rank(90),
+        "p99": rank(99),
+        "max": values[-1],
+        "mean": sum(values) / len(values)
+    }
+
+
+def summarize(samples):
+    containers = sorted({name for sample in samples for name in sample["containers"]})
+
+    return {
+        "phases": {phase: percentiles([x["phases"][phase] for x in samples]) for phase in phases},
+        "containers": {name: percentiles([x["containers"][name] for x in samples if name in x["containers"]])
+                       for name in containers},
+        "statuses": [x["status"] for x in samples]
+    }
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Compare the p50 of every phase against a baseline.
+
+    :param tolerance: relative slowdown accepted before reporting a regression
+    :return: list of regressions
+    """
+    regressions = list()
+
+    for broker, result in results["brokers"].items():
+        reference = baseline.get("brokers", dict()).get(broker)
+        if reference is None:
+            continue
+
+        for phase, values in result["phases"].items():
+            previous = reference["phases"].get(phase, dict()).get("p50")
+            if previous and values["p50"] > previous * (1 + tolerance):
+                regressions.append({"broker": broker, "phase": phase, "baseline_p50": previous,
+                                    "p50": values["p50"], "ratio": values["p50"] / previous})
+
+    return regressions
+
+
+def run_benchmark(args):
+    """
+    Execute the bench subcommand, write the JSON results and compare them against the baseline.
+
+    :param args: arguments parsed by cli.command.parse_cli
+    :return: process exit code, 1 when a regression is found
+    """
+    compose = Compose()
+    unknown = [x for x in args['--broker'] if x not in compose.brokers]
+    if len(unknown) > 0:
+        exit(f'--broker NAME should be one of {", ".join(compose.brokers.keys())}, unknown {", ".join(unknown)}')
+
+    brokers = args['--broker'] or list(compose.brokers.keys())
+
+    benchmark = LifecycleBenchmark(brokers=brokers,
+                                   cycles=args['--cycles'],
+                                   timeout=args['--timeout'],
+                                   interval=args['--interval'],
+                                   fake=args['--fake'])
+    results = benchmark.run()
+
+    if args['--baseline'] is not None:
+        with open(args['--baseline']) as file:
+            results["regressions"] = compare(results, load(file), tolerance=args['--tolerance'])
+
+    with open(args['--output'], 'w') as file:
+        dump(results, file, indent=2)
+
+    for broker, result in results["brokers"].items():
+        summary = ', '.join(f'{phase} p50 {values["p50"]:.3f}s' for phase, values in result["phases"].items())
+        print(f'{broker}: {summary}')
+
+    for regression in results.get("regressions", list()):
+        print(f'Regression {regression["broker"]} {regression["phase"]}: '
+              f'{regression["baseline_p50"]:.3f}s -> {regression["p50"]:.3f}s')
+
+    return 1 if results.get("regressions") else 0
@@ -23,6 +23,10 @@
 
 Usage:
   agent.py [--host HOST] [--port PORT]
+  agent.py bench [--broker NAME]... [--cycles N] [--timeout SECONDS] [--interval SECONDS]
+                 [--output FILE] [--baseline FILE] [--tolerance RATIO] [--fake]
+  agent.py --profile-startup
+  agent.py dump [--url URL] [--trace ID] [--sample SECONDS] [--raw]
   agent.py [-H | --help]
   agent.py --version
 
@@ -32,6 +36,22 @@ Options:
   -p, --port PORT     launch the server in the corresponding port
                       [default: 5000]
 
+  -b, --broker NAME         broker to benchmark, all the brokers if omitted
+  -c, --cycles N            init -> healthy -> clean cycles per broker [default: 3]
+  -t, --timeout SECONDS     maximum wait until a broker is healthy [default: 600]
+  -i, --interval SECONDS    interval between health checks [default: 1]
+  -o, --output FILE         file with the JSON results [default: benchmark.json]
+  -B, --baseline FILE       JSON results to compare with, exit code 1 on regression
+  -T, --tolerance RATIO     slowdown of the p50 accepted by the comparison [default: 0.2]
+  -f, --fake                use a stand-in docker engine to measure only the service overhead
+
+  -P, --profile-startup     report the import and initialization time per module and exit
+
+  -u, --url URL             address of the running service [default: http://127.0.0.1:5000]
+  --trace ID                print the spans of a request trace
+  --sample SECONDS          profile the running service by sampling during SECONDS
+  --raw                     print the JSON returned by the service
+
   -H, --help          show this help message and exit
   -v, --version       show version and exit
 
@@ -58,7 +78,23 @@ def parse_cli() -> dict:
             '--port': Or(None, And(Use(int), lambda n: 1 < n < 65535),
                          error='--port N, N should be integer 1 < N < 65535'),
             '--host': Or(None, str, error='--host HOST should be a string'),
-            '--version': bool
+            '--version': bool,
+            'bench': bool,
+            '--broker': [str],
+            '--cycles': And(Use(int), lambda n: n > 0, error='--cycles N, N should be a positive integer'),
+            '--timeout': And(Use(float), lambda n: n > 0, error='--timeout SECONDS should be a positive number'),
+            '--interval': And(Use(float), lambda n: n >= 0, error='--interval SECONDS should be a number'),
+            '--output': str,
+            '--baseline': Or(None, str, error='--baseline FILE should be a string'),
+            '--tolerance': And(Use(float), lambda n: n >= 0, error='--tolerance RATIO should be a number'),
+            '--fake': bool,
+            '--profile-startup': bool,
+            'dump': bool,
+            '--url': str,
+            '--trace': Or(None, str, error='--trace ID should be a string'),
+            '--sample': Or(None, And(Use(float), lambda n: n > 0),
+                           error='--sample SECONDS should be a positive number'),
+            '--raw': bool
         }
     )
 
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from subprocess import run
+from sys import executable
+from time import perf_counter
+
+local_packages = ("api", "cli", "common", "components", "utils")
+
+
+def parse_importtime(output):
+    """
+    Parse the report of python -X importtime.
+
+    :param output: stderr of the interpreter
+    :return: list of (module, self seconds, cumulative seconds) in import order
+    """
+    modules = list()
+
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        self_time, cumulative, module = line[len("import time:"):].split("|")
+        modules.append((module.strip(), int(self_time) / 1e6, int(cumulative) / 1e6))
+
+    return modules
+
+
+def group_by_package(modules):
+    """
+    :return: dict top level package -> self seconds of all its modules, sorted from the slowest
+    """
+    packages = dict()
+
+    for module, self_time, _ in modules:
+        package = module.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + self_time
+
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+
+def profile_startup(module="api.server", top=15):
+    """
+    Measure the cold start of the service: the import of the server in a fresh interpreter, broken down per
+    module and per package, and the creation of each subsystem, which is deferred until first use.
+
+    :param module: module imported to start the service
+    :param top: number of modules and packages in the report
+    :return: dict with the report
+    """
+    started = perf_counter()
+    process = run([executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+    wall = perf_counter() - started
+
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+
+    modules = parse_importtime(process.stderr)
+
+    # Once the import is measured in isolation, the subsystems are created in this process to time them
+    from api.server import services
+
+    return {
+        "import": {
+            "wall": wall,
+            "total": sum(self_time for _, self_time, _ in modules),
+            "local": [entry for entry in sorted(modules, key=lambda entry: entry[2], reverse=True)
+                      if entry[0].split(".")[0] in local_packages][:top],
+            "modules": sorted(modules, key=lambda entry: entry[1], reverse=True)[:top],
+            "packages": list(group_by_package(modules).items())[:top]
+        },
+        "initialization": services.initialize()
+    }
+
+
+def run_profile(args):
+    """
+    Execute the --profile-startup option and print the report.
+
+    :param args: arguments parsed by cli.command.parse_cli
+    :return: process exit code
+    """
+    report = profile_startup()
+    imports = report["import"]
+
+    print(f'Interpreter and import of the server: {imports["wall"] * 1000:.1f} ms '
+          f'(imports {imports["total"] * 1000:.1f} ms)')
+
+    print('\nImport time per package (self):')
+    for package, seconds in imports["packages"]:
+        print(f'  {package:<40} {seconds * 1000:8.1f} ms')
+
+    print('\nImport time per module (self / cumulative):')
+    for module, self_time, cumulative in imports["modules"]:
+        print(f'  {module:<40} {self_time * 1000:8.1f} ms {cumulative * 1000:8.1f} ms')
+
+    print('\nImport time of the service modules (self / cumulative):')
+    for module, self_time, cumulative in imports["local"]:
+        print(f'  {module:<40} {self_time * 1000:8.1f} ms {cumulative * 1000:8.1f} ms')
+
+    print('\nInitialization per subsystem, on first use (includes its imports):')
+    for name, seconds in report["initialization"].items():
+        print(f'  {name:<40} {seconds * 1000:8.1f} ms')
+
+    print(f'  {"total":<40} {sum(report["initialization"].values()) * 1000:8.1f} ms')
+
+    return 0
+
+
+def run_dump(args):
+    """
+    Execute the dump subcommand against a running service: print the stalls of the event loop and the slowest
+    requests, the spans of a request trace with --trace, or a sampling profile of the service with --sample.
+
+    :param args: arguments parsed by cli.command.parse_cli
+    :return: process exit code
+    """
+    from httpx import Client, HTTPError
+    from json import dumps
+
+    try:
+        with Client(base_url=args['--url'], timeout=None) as client:
+            if args['--sample'] is not None:
+                responses = {"profile": client.post("/profile", json={"seconds": args['--sample']})}
+            elif args['--trace'] is not None:
+                responses = {"trace": client.get(f'/traces/{args["--trace"]}')}
+            else:
+                responses = {"stalls": client.get("/stalls"), "traces": client.get("/traces")}
+    except HTTPError as e:
+        print(f'The service {args["--url"]} could not be reached: {e}')
+        return 1
+
+    for response in responses.values():
+        if response.status_code != 200:
+            print(f'{response.request.method} {response.request.url.path} {response.status_code}: '
+                  f'{response.json().get("message", response.text)}')
+            return 1
+
+    data = {name: response.json() for name, response in responses.items()}
+
+    if args['--raw']:
+        print(dumps(data, indent=2))
+    elif "profile" in data:
+        print_profile(data["profile"])
+    elif "trace" in data:
+        print_trace(data["trace"])
+    else:
+        print_stalls(data["stalls"])
+        print_traces(data["traces"])
+
+    return 0
+
+
+def print_stalls(stalls):
+    print(f'Event loop stalls over {stalls["threshold"] * 1000:.0f} ms: {stalls["stalls_total"]}, '
+          f'maximum lag {stalls["max_lag"] * 1000:.1f} ms')
+
+    for stall in stalls["stalls"]:
+        requests = ', '.join(f'{x["method"]} {x["path"]} ({x["id"]})' for x in stall["requests"]) or 'none'
+        print(f'\n  {stall["at"]} blocked {stall["lag"] * 1000:.1f} ms, requests in flight: {requests}')
+
+        for frame in stall["stack"] or ['stack not captured, the stall ended before the watchdog check']:
+            print(f'    {frame}')
+
+
+def print_traces(traces, top=10):
+    print(f'\nRequests slower than {traces["slow"]:.1f}s, slowest first:')
+    for trace in traces["slow_requests"][:top]:
+        print(f'  {trace["duration"] * 1000:10.1f} ms  {trace["status"]}  {trace["method"]} {trace["path"]}  '
+              f'{trace["id"]}')
+
+    print(f'\nRequests in flight:')
+    for trace in traces["in_flight"]:
+        print(f'  {trace["duration"] * 1000:10.1f} ms  {trace["method"]} {trace["path"]}  {trace["id"]}')
+
+
+def print_trace(trace):
+    print(f'{trace["method"]} {trace["path"]} {trace["status"]} in {trace["duration"] * 1000:.1f} ms, '
+          f'{len(trace["spans"])} spans ({trace["dropped"]} dropped)\n')
+    print(f'  {"start":>10} {"duration":>10}  span')
+
+    for x in trace["spans"]:
+        error = f'  raised {x["error"]}' if x["error"] is not None else ''
+        print(f'  {x["start"] * 1000:7.1f} ms {x["duration"] * 1000:7.1f} ms  {"  " * x["depth"]}{x["name"]} '
+              f'[{x["thread"]}]{error}')
+
+    if trace["profile"] is not None:
+        print()
+        print_profile(trace["profile"])
+
+
+def print_profile(profile, top=20):
+    """
+    Print the functions where the samples were taken, and the most sampled stacks. The full stacks are in the
+    folded format of the flame graph tools with --raw.
+    """
+    samples = max(1, profile["samples"])
+    print(f'Sampling profile of {profile["duration"] * 1000:.0f} ms, {profile["samples"]} samples every '
+          f'{profile["interval"] * 1000:.1f} ms')
+
+    functions = dict()
+    for x in profile["stacks"]:
+        leaf = x["stack"].rsplit(';', 1)[-1]
+        functions[leaf] = functions.get(leaf, 0) + x["count"]
+
+    print('\nFunctions running (self):')
+    for function, count in sorted(functions.items(), key=lambda x: x[1], reverse=True)[:top]:
+        print(f'  {count / samples * 100:6.1f}%  {function}')
+
+    # The stacks are shortened to their innermost frames, those ending the same way are merged
+    stacks = dict()
+    for x in profile["stacks"]:
+        frames = x["stack"].split(';')
+        key = f'{" <- ".join(reversed(frames[-4:]))}  [{frames[0]}]'
+        stacks[key] = stacks.get(key, 0) + x["count"]
+
+    print('\nStacks, innermost frames first:')
+    for stack, count in sorted(stacks.items(), key=lambda x: x[1], reverse=True)[:top]:
+        print(f'  {count / samples * 100:6.1f}%  {stack}')
@@ -24,5 +24,27 @@ from json import load
 
 logging_config_path = Path.cwd().joinpath('common/config.json')
 
-with open(logging_config_path) as config_file:
-    config = load(config_file)
+
+class Config:
+    """
+    Configuration of the service, the file is read on the first access instead of at import time.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def get(self, key, default=None):
+        return self.load().get(key, default)
+
+    def load(self):
+        if self.data is None:
+            with open(self.path) as config_file:
+                self.data = load(config_file)
+
+        return self.data
+
+
+config = Config(logging_config_path)
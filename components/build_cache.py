@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from hashlib import sha256
+from json import load, dump, dumps
+from os import walk
+from pathlib import Path
+from threading import Lock
+
+
+class BuildCache:
+    """
+    Remember the fingerprint and the image of the last successful build of each service of a broker, so docker
+    compose build is only executed for the services whose build context, Dockerfile or build section, with the
+    .env values interpolated in it, changed. The images are named after the compose project, a new deployment tags the image already built by
+    another deployment of the broker instead of building it again.
+    """
+    def __init__(self, path="./deployments/build-cache.json"):
+        self.path = Path(path)
+        self.lock = Lock()
+
+        try:
+            # The entries of the previous format, a fingerprint per project and service, are built again
+            with open(self.path) as file:
+                self.entries = {key: value for key, value in load(file).items() if isinstance(value, dict)}
+        except (FileNotFoundError, ValueError):
+            self.entries = dict()
+
+    def plan(self, model, broker, project, exists=None):
+        """
+        Compare the fingerprints of the services with a build section against the last successful builds.
+
+        :param model: ComposeModel of the deployment
+        :param broker: context broker name
+        :param project: compose project name of the deployment, its images are named after it
+        :param exists: callable telling if an image is still in the engine, by default the images are trusted
+        :return: dict with the stale services and their new fingerprints, and dict with the cached services and
+                 the (built, wanted) image names
+        """
+        stale, cached = dict(), dict()
+
+        for service in model.services.values():
+            if service.build is None:
+                continue
+
+            fingerprint = self.fingerprint(directory=model.directory, build=service.build)
+
+            with self.lock:
+                entry = self.entries.get(self._key(broker, service.name))
+
+            if entry is not None and entry["fingerprint"] == fingerprint and \
+                    (exists is None or exists(entry["image"])):
+                cached[service.name] = (entry["image"], self.image(project, service))
+            else:
+                stale[service.name] = fingerprint
+
+        return stale, cached
+
+    def commit(self, model, broker, project, fingerprints):
+        with self.lock:
+            for service in model.services.values():
+                if service.name in fingerprints:
+                    self.entries[self._key(broker, service.name)] = {
+                        "fingerprint": fingerprints[service.name],
+                        "image": self.image(project, service)
+                    }
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'w') as file:
+                dump(self.entries, file, indent=2, sort_keys=True)
+
+    @staticmethod
+    def image(project, service):
+        # docker compose names the built image after the project and the service unless the image is given
+        return service.image if service.image is not None else f'{project}-{service.name}'
+
+    @staticmethod
+    def fingerprint(directory, build):
+        if isinstance(build, str):
+            build = {'context': build}
+
+        # The build section is already interpolated, the .env values it uses (e.g. in the args) are part of it.
+        # The whole .env is not hashed, the values of each deployment (CONTAINER_NAME_PREFIX) would never match
+        digest = sha256()
+        digest.update(dumps(build, sort_keys=True).encode())
+
+        context = Path(directory).joinpath(build.get('context', '.'))
+        dockerfile = context.joinpath(build.get('dockerfile', 'Dockerfile'))
+
+        # The Dockerfile can live outside of the context, the files of the context are walked in a stable order
+        files = [dockerfile] if dockerfile.is_file() else list()
+        for root, directories, names in walk(context):
+            directories.sort()
+            files.extend(Path(root).joinpath(name) for name in sorted(names))
+
+        for file in files:
+            digest.update(str(file.relative_to(context) if file.is_relative_to(context) else file).encode())
+            digest.update(file.read_bytes())
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def _key(broker, service):
+        return f'{broker}/{service}'
@@ -19,13 +19,20 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 ##
-from python_on_whales import DockerClient
+from contextlib import nullcontext
+from copy import copy
+from time import perf_counter, sleep
+from components.compose_model import ComposeModelCache
+from components.docker_backend import WhalesBackend
+from components.metrics import track, time_to_healthy
 from components.exceptions import ComposeInitialization, UnknownBroker, Unimplemented
-from utils.file_utils import get_container_names_from_compose_file
+from components.profiling import instrument
+from components.reset import reset_drivers, ComposeExecutor
 
 
+@instrument("compose")
 class Compose:
-    def __init__(self):
+    def __init__(self, build_cache=None, monitor=None, backend=None, volume_cache=None):
         self.brokers = {
             "Lepus": ["./composes/lepus.yml"],
             "Orion-LD": ["./composes/orionld.yml"],
@@ -33,13 +40,45 @@ class Compose:
             "Scorpio": ["./composes/scorpio.yml"],
             "YANB": ["./composes/yanb.yml"],
         }
-        self.container_names = { broker: get_container_names_from_compose_file(self.brokers[broker][0]) for broker in self.brokers.keys() }
+        # Expected memory (bytes) and cpus of each broker while it starts, used by the admission scheduler until
+        # the footprint is learned from a real deployment
+        self.footprints = {
+            "Lepus": {"memory": 1536 * 1024 ** 2, "cpus": 1.0},
+            "Orion-LD": {"memory": 1024 * 1024 ** 2, "cpus": 1.0},
+            "Stellio": {"memory": 4096 * 1024 ** 2, "cpus": 2.0},
+            "Scorpio": {"memory": 2560 * 1024 ** 2, "cpus": 1.5},
+            "YANB": {"memory": 512 * 1024 ** 2, "cpus": 0.5},
+        }
+        self.env_file = "./composes/.env"
+        self.build_cache = build_cache
+        self.volume_cache = volume_cache
+        self.models = ComposeModelCache()
+        self.monitor = monitor
+        self.backend = backend if backend is not None else WhalesBackend()
 
         self.dockerEngine = None
+        self.host = None
         self.broker = None
+        self.project = None
+        self.prefix = None
+        self.compose_files = list()
+        self.compose_env_file = None
         self.containers = list()
+        self.deployed_at = None
+        self.restored = False
+
+    def initialize(self, broker, project=None, prefix=None, env_file=None, override_files=None, host=None):
+        """
+        Select the broker and create the docker client for its compose files.
 
-    def initialize(self, broker):
+        :param broker: context broker name
+        :param project: compose project name, None to use the default one (name of the composes folder)
+        :param prefix: prefix added to the container names of the deployment, None for the original names
+        :param env_file: compose .env file, by default ./composes/.env
+        :param override_files: additional compose files merged after the broker compose files
+        :param host: DockerHost running the deployment, None for the local engine. The bind mounted folders of
+                     the compose files and the volume cache must exist at the same path on the host
+        """
         try:
             self.broker = broker
             compose_files = self.brokers[broker]
@@ -52,23 +91,240 @@ class Compose:
         if len(compose_files) == 0:
             raise Unimplemented(data=broker)
 
-        self.dockerEngine = DockerClient(compose_files=compose_files,
-                                         compose_env_file="./composes/.env")
+        self.project = project
+        self.prefix = prefix
+        self.compose_files = compose_files + list(override_files or [])
+        self.compose_env_file = env_file or self.env_file
+
+        # The status of the containers is read from the engine of the host, only the local one is monitored
+        if host is not None:
+            self.host = host
+            self.backend = host.backend
+            self.monitor = host.monitor
+
+        # python_on_whales is only imported once a broker is selected, it is not needed to start the service
+        from python_on_whales import DockerClient
+
+        self.dockerEngine = DockerClient(host=host.host if host is not None else None,
+                                         context=host.context if host is not None else None,
+                                         compose_files=self.compose_files,
+                                         compose_env_file=self.compose_env_file,
+                                         compose_project_name=project)
+
+    @property
+    def model(self):
+        """
+        Parsed and interpolated compose files of the selected broker, parsed again only when they change.
+        """
+        return self.models.get(files=self.compose_files, env_file=self.compose_env_file)
+
+    @property
+    def environment(self):
+        return self.model.environment
 
-    def up(self):
+    def session(self, broker, **kwargs):
+        """
+        Create an independent Compose instance initialized for the broker. The parsed compose information is
+        shared with this instance, but the docker engine and the list of containers belong to the new one, so
+        several sessions can be used at the same time from different threads.
+
+        :param broker: context broker name
+        :param kwargs: project, prefix, env_file and override_files passed to initialize
+        :return: the initialized Compose instance
+        """
+        engine = copy(self)
+        engine.dockerEngine = None
+        engine.containers = list()
+        engine.deployed_at = None
+        engine.restored = False
+        engine.initialize(broker=broker, **kwargs)
+
+        return engine
+
+    def up(self, progress=None):
+        """
+        Build the images of the broker and start the containers. With a build cache, only the services whose
+        fingerprint changed since the last successful build are built. With a volume cache, the named volumes
+        are restored from the snapshot of the broker before the containers start.
+
+        :param progress: callback receiving the name of each step
+        :return: the build decision, services built and services taken from the cache, and the volumes restored
+        """
         if self.dockerEngine is None:
             # Error, we need to call before the initialize operation to keep the broker and create the dockerEngine
             raise ComposeInitialization(data='')
         else:
-            self.dockerEngine.compose.build()
-            self.dockerEngine.compose.up(detach="True")
+            self._progress(progress, "build")
+            build = self.build()
+            volumes = self.restore_volumes(progress)
+            self._progress(progress, "up")
+            self.deployed_at = perf_counter()
+            with track("up", self.broker):
+                self.dockerEngine.compose.up(detach="True")
+
+            return {"build": build, "volumes": volumes}
+
+    def build(self):
+        if self.build_cache is None:
+            with track("build", self.broker):
+                self.dockerEngine.compose.build()
+
+            return {"built": "all", "cached": list()}
+
+        project = self.get_project_name()
+        stale, cached = self.build_cache.plan(model=self.model, broker=self.broker, project=project,
+                                              exists=lambda image: self.dockerEngine.image.exists(image))
+
+        # The image built for another deployment of the broker gets the name expected by this project
+        for built, wanted in cached.values():
+            if built != wanted:
+                self.dockerEngine.image.tag(built, wanted)
+
+        if len(stale) > 0:
+            with track("build", self.broker):
+                self.dockerEngine.compose.build(services=list(stale.keys()))
+            self.build_cache.commit(model=self.model, broker=self.broker, project=project, fingerprints=stale)
+
+        return {"built": list(stale.keys()), "cached": list(cached.keys())}
+
+    def restore_volumes(self, progress=None):
+        """
+        Create the containers without starting them and extract the snapshot of the broker in its named volumes.
+        Nothing is restored if any of the volumes already exists, its data is never overwritten.
+
+        :return: dict with the cache key and the volumes restored, None without snapshot
+        """
+        self.restored = False
+
+        if self.volume_cache is None or not self.volume_cache.supports(self.broker):
+            return None
+
+        key = self.volume_cache.key(self.broker, self.model)
+        entry = self.volume_cache.lookup(key)
+        volumes = self.model.volume_names(self.get_project_name())
+
+        if entry is None or len(volumes) == 0:
+            return None
+
+        existing = {x["name"] for x in self.backend.list_volumes()}
+        if any(name in existing for name in volumes.values()):
+            return None
+
+        self._progress(progress, "restore")
+        start = perf_counter()
+
+        with track("restore", self.broker):
+            self.dockerEngine.compose.up(detach=True, start=False)
+
+            for volume, file in entry["volumes"].items():
+                self._volume_helper(volumes[volume], f'tar xzf /cache/{file} -C /volume')
+
+        self.restored = True
+        self.volume_cache.observe(self.broker, "restore", perf_counter() - start)
+
+        return {"key": key, "restored": sorted(entry["volumes"].keys())}
+
+    def snapshot_volumes(self, progress=None, timeout=600, interval=5, deployment=None):
+        """
+        Save the named volumes of the broker in the volume cache the first time it becomes healthy with the
+        current images. The services mounting the volumes are paused while the tarballs are written, so the
+        snapshot is crash consistent (the databases recover it as after a power loss) and the containers keep
+        their healthy status.
+
+        :param progress: callback receiving the name of each step
+        :param timeout: maximum seconds to wait until the deployment is healthy
+        :param interval: seconds between health checks
+        :param deployment: Deployment of this session, it is only held while the tarballs are written, and the wait
+                           stops when it is released
+        :return: dict with the cache key, the volumes saved and the timings, None if no snapshot was needed
+        """
+        if self.volume_cache is None or not self.volume_cache.supports(self.broker) or self.restored:
+            return None
+
+        key = self.volume_cache.key(self.broker, self.model)
+        volumes = self.model.volume_names(self.get_project_name())
+
+        if len(volumes) == 0 or not self.volume_cache.claim(key):
+            return None
+
+        try:
+            self._progress(progress, "wait healthy")
+            deployed_at = self.deployed_at if self.deployed_at is not None else perf_counter()
+            deadline = perf_counter() + timeout
+
+            while self.check_health_status()["status"] != "healthy":
+                if deployment is not None and deployment.released:
+                    return {"key": key, "error": 'The deployment was cleaned before it was healthy'}
+                if perf_counter() > deadline:
+                    return {"key": key, "error": f'The deployment was not healthy after {timeout} seconds'}
+                sleep(interval)
+
+            fresh_init = perf_counter() - deployed_at
+            self.volume_cache.observe(self.broker, "fresh_init", fresh_init)
+
+            services = [service.name for service in self.model.services.values()
+                        if any(volume in volumes for volume, _ in service.named_volumes())]
+
+            files = {volume: self.volume_cache.file(key, volume) for volume in volumes}
+
+            with deployment.hold("snapshot") if deployment is not None else nullcontext():
+                self._progress(progress, "snapshot")
+                start = perf_counter()
+
+                with track("snapshot", self.broker):
+                    self.dockerEngine.compose.pause(services)
+                    try:
+                        # Written with a temporary name, a half written tarball is never restored
+                        for volume, file in files.items():
+                            self._volume_helper(volumes[volume], f'tar czf /cache/{file}.tmp -C /volume . && '
+                                                                    f'mv /cache/{file}.tmp /cache/{file}')
+                    finally:
+                        self.dockerEngine.compose.unpause(services)
 
-    def down(self):
+            self.volume_cache.commit(key=key, broker=self.broker, model=self.model, files=files)
+        finally:
+            self.volume_cache.unclaim(key)
+
+        elapsed = perf_counter() - start
+        self.volume_cache.observe(self.broker, "snapshot", elapsed)
+
+        return {"key": key, "saved": sorted(files.keys()), "fresh_init": fresh_init, "snapshot": elapsed}
+
+    def down(self, progress=None):
         if self.dockerEngine is None:
             # Error, we need to call before the initialize operation to keep the broker and create the dockerEngine
             raise ComposeInitialization(data='')
         else:
-            self.dockerEngine.compose.down(volumes="True")
+            self._progress(progress, "down")
+            self.deployed_at = None
+            with track("down", self.broker):
+                self.dockerEngine.compose.down(volumes="True")
+
+    def reset(self, progress=None, executor=None):
+        """
+        Wipe the data of the broker keeping the containers, networks and volumes, a faster alternative to
+        down and up. Each broker declares its reset drivers in components.reset.reset_drivers.
+
+        :param progress: callback receiving the name of each step
+        :param executor: object executing the commands of the drivers, by default docker compose exec
+        :return: the list of drivers applied
+        """
+        if self.dockerEngine is None:
+            # Error, we need to call before the initialize operation to keep the broker and create the dockerEngine
+            raise ComposeInitialization(data='')
+
+        drivers = reset_drivers.get(self.broker)
+        if drivers is None:
+            raise Unimplemented(data=self.broker, message='Unimplemented data reset for this broker')
+
+        executor = executor if executor is not None else ComposeExecutor(self.dockerEngine)
+
+        for driver in drivers:
+            self._progress(progress, f'reset {driver.service}')
+            with track("reset", self.broker):
+                driver.reset(executor=executor, environment=self.environment)
+
+        return [driver.to_dict() for driver in drivers]
 
     def check_health_status(self):
         """
@@ -78,32 +334,94 @@ class Compose:
             - healthy: The container will continue to run its Health Check at every specified interval
             - unhealthy: After a certain number of consecutive failures the container's status will be unhealthy
 
+        When a synchronized HealthMonitor is available, the status is answered from its state table instead of
+        running docker compose ps and docker inspect.
+
         :return:
         """
         if self.dockerEngine is None:
             # Error, we need to call before the initialize operation to keep the broker and create the dockerEngine
             raise ComposeInitialization(data='')
         else:
-            status = self.dockerEngine.compose.ps(all=True)
-            self.containers = [x.name for x in status if x.name in self.container_names[self.broker]]
-
-            status = self.dockerEngine.container.inspect(self.containers)
-            status = [{"name": x.name, "health": x.state.health.status if x.state.health is not None else "unknown", "status": x.state.status} for x in status]
-
-            health_status = [x['health'] if 'health' in x else "unknown" for x in status]
-            
-            if True in [ele == "unknown" for ele in health_status]:
-                res = "unknown"
-            elif True in [ele == "unhealthy" for ele in health_status] or True in [ele == "exited" for ele in health_status]:
-                res = "unhealthy"
-            elif True in [ele == "starting" for ele in health_status]:
-                res = "starting"
+            container_names = self.get_container_names()
+
+            if self.monitor is not None and self.monitor.synced:
+                status = [self.monitor.get(x) for x in container_names]
+                status = [{"name": x["name"], "health": x["health"], "status": x["status"]} for x in status if x is not None]
+                self.containers = [x["name"] for x in status]
             else:
-                res = "healthy"
+                label = f'com.docker.compose.project={self.get_project_name()}'
+                with track("ps", self.broker):
+                    status = self.backend.list_containers(all=True, filters={"label": label})
+                status = [{"name": x["name"], "health": x["health"], "status": x["status"]} for x in status if x["name"] in container_names]
+                self.containers = [x["name"] for x in status]
 
-            response = {
-                "status": res,
-                "containers": status
-            }
+            response = aggregate_health_status(status, expected=container_names)
+
+            if response["status"] == "healthy" and self.deployed_at is not None:
+                elapsed = perf_counter() - self.deployed_at
+                time_to_healthy.labels(broker=self.broker).observe(elapsed)
+                self.deployed_at = None
+
+                if self.restored:
+                    self.volume_cache.observe(self.broker, "restored_init", elapsed)
 
             return response
+
+    def get_container_names(self):
+        """
+        :return: dict container name -> service of the deployment, services without container_name get the
+                 name docker compose gives them (<project>-<service>-1)
+        """
+        project = self.get_project_name()
+
+        return {service.container_name or f'{project}-{service.name}-1': service
+                for service in self.model.services.values()}
+
+    def get_project_name(self):
+        # Without explicit project, docker compose names it after the folder of the first compose file
+        return self.project if self.project is not None else self.model.directory.resolve().name
+
+    def _volume_helper(self, volume, command):
+        self.dockerEngine.container.run(self.volume_cache.image, ["sh", "-c", command], remove=True,
+                                        volumes=[(volume, "/volume"), (str(self.volume_cache.path), "/cache")])
+
+    @staticmethod
+    def _progress(progress, step):
+        if progress is not None:
+            progress(step)
+
+
+def aggregate_health_status(status, expected=None):
+    """
+    Aggregate the health of the containers of a deployment in a single status. A deployment without containers
+    is "absent", e.g. never deployed or still building, and one with some of its containers not created yet is
+    still "starting".
+
+    :param status: list of dicts with the name, health and status of each container
+    :param expected: names of the containers of the deployment, None if they are unknown
+    :return: dict with the aggregated status, the list of containers and the names of the missing ones
+    """
+    health_status = [x['health'] if 'health' in x else "unknown" for x in status]
+    missing = [x for x in expected if x not in {y["name"] for y in status}] if expected is not None else list()
+
+    if len(status) == 0:
+        res = "absent"
+    elif True in [ele == "unknown" for ele in health_status]:
+        res = "unknown"
+    elif True in [ele == "unhealthy" for ele in health_status] or True in [ele == "exited" for ele in health_status]:
+        res = "unhealthy"
+    elif True in [ele == "starting" for ele in health_status]:
+        res = "starting"
+    elif len(missing) > 0:
+        res = "starting"
+    else:
+        res = "healthy"
+
+    response = {
+        "status": res,
+        "containers": status,
+        "missing": missing
+    }
+
+    return response
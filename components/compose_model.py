@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from os import environ, stat
+from pathlib import Path
+from re import compile
+from threading import Lock
+from yaml import load, SafeLoader, SafeDumper, MappingNode
+from utils.file_utils import read_env_file
+
+# ${VAR}, ${VAR:-default}, ${VAR-default}, ${VAR:?error}, ${VAR?error}, $VAR and the escaped $$
+interpolation = compile(r'\$(?:(?P<escaped>\$)|\{(?P<braced>[A-Za-z_][A-Za-z0-9_]*)'
+                        r'(?:(?P<operator>:?[-?])(?P<default>[^}]*))?}|(?P<named>[A-Za-z_][A-Za-z0-9_]*))')
+
+
+class OverrideList(list):
+    """
+    Sequence tagged with !override, it replaces the value of the previous compose files instead of merging.
+    """
+
+
+class OverrideDict(dict):
+    """
+    Mapping tagged with !override, it replaces the value of the previous compose files instead of merging.
+    """
+
+
+class Reset:
+    """
+    Value tagged with !reset, the key is removed from the result of the previous compose files.
+    """
+
+
+class ComposeLoader(SafeLoader):
+    pass
+
+
+class ComposeDumper(SafeDumper):
+    pass
+
+
+def construct_override(loader, node):
+    if isinstance(node, MappingNode):
+        return OverrideDict(loader.construct_mapping(node, deep=True))
+
+    return OverrideList(loader.construct_sequence(node, deep=True))
+
+
+ComposeLoader.add_constructor('!override', construct_override)
+ComposeLoader.add_constructor('!reset', lambda loader, node: Reset())
+ComposeDumper.add_representer(OverrideList, lambda dumper, data: dumper.represent_sequence('!override', data))
+ComposeDumper.add_representer(OverrideDict, lambda dumper, data: dumper.represent_mapping('!override', data))
+
+
+class ServiceModel:
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self.container_name = config.get('container_name')
+        self.image = config.get('image')
+        self.build = config.get('build')
+        self.healthcheck = config.get('healthcheck')
+        self.ports = config.get('ports') or list()
+        self.volumes = config.get('volumes') or list()
+
+        # depends_on is either a list of services or a mapping service -> condition
+        depends_on = config.get('depends_on') or list()
+        self.depends_on = list(depends_on.keys()) if isinstance(depends_on, dict) else list(depends_on)
+
+    def remap_ports(self, allocate):
+        """
+        :param allocate: callable returning the new host port for a (published, target) port
+        :return: the ports of the service with the published ports replaced, the other ones unchanged
+        """
+        result = list()
+
+        for port in self.ports:
+            if isinstance(port, dict):
+                if port.get('published') not in (None, ''):
+                    port = {**port, 'published': str(allocate(int(str(port['published']).split('-')[0]),
+                                                              int(str(port['target']).split('-')[0])))}
+                result.append(port)
+                continue
+
+            # [ip:]published:target[/protocol], the ip and the protocol are kept
+            mapping, _, protocol = str(port).partition('/')
+            parts = mapping.rsplit(':', 2)
+            if len(parts) > 1 and parts[-2] != '':
+                parts[-2] = str(allocate(int(parts[-2].split('-')[0]), int(parts[-1].split('-')[0])))
+                port = ':'.join(parts) + (f'/{protocol}' if protocol else '')
+            result.append(port)
+
+        return result
+
+    def published_ports(self):
+        """
+        :return: list of (published, target) ports of the service, ports without published port are skipped
+        """
+        result = list()
+
+        for port in self.ports:
+            if isinstance(port, dict):
+                published, target = port.get('published'), port.get('target')
+            else:
+                # [ip:]published:target[/protocol] or just the target port
+                parts = str(port).split('/')[0].rsplit(':', 2)
+                published, target = (parts[-2], parts[-1]) if len(parts) > 1 else (None, parts[0])
+
+            if published not in (None, ''):
+                result.append((int(str(published).split('-')[0]), int(str(target).split('-')[0])))
+
+        return result
+
+    def named_volumes(self):
+        """
+        :return: list of (volume, target) of the named volumes mounted by the service, bind mounts are skipped
+        """
+        result = list()
+
+        for volume in self.volumes:
+            if isinstance(volume, dict):
+                source, target = volume.get('source'), volume.get('target')
+                if volume.get('type', 'volume') != 'volume':
+                    continue
+            else:
+                # source:target[:mode], a source starting with . / or ~ is a bind mount
+                parts = str(volume).split(':')
+                source, target = (parts[0], parts[1]) if len(parts) > 1 else (None, parts[0])
+
+            if source and source[0] not in './~':
+                result.append((source, target))
+
+        return result
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "container_name": self.container_name,
+            "image": self.image,
+            "healthcheck": self.healthcheck,
+            "depends_on": self.depends_on
+        }
+
+
+class ComposeModel:
+    """
+    Compose files of a deployment parsed, merged in order and interpolated with the values of the .env file
+    and the shell environment, as docker compose does.
+    """
+    def __init__(self, files, environment, variables):
+        """
+        :param files: compose files, the later ones override the former ones
+        :param environment: values of the .env file
+        :param variables: values used for the interpolation (.env values overridden by the shell environment)
+        """
+        self.files = files
+        self.directory = Path(files[0]).parent
+        self.environment = environment
+
+        content = dict()
+        for file in files:
+            with open(file) as stream:
+                content = merge(content, interpolate(load(stream, Loader=ComposeLoader) or dict(), variables))
+
+        self.services = {name: ServiceModel(name, config or dict())
+                         for name, config in (content.get('services') or dict()).items()}
+        self.containers = {service.container_name: service
+                           for service in self.services.values() if service.container_name is not None}
+        self.volumes = content.get('volumes') or dict()
+        self.networks = content.get('networks') or dict()
+
+    def images(self):
+        return sorted({service.image for service in self.services.values() if service.image is not None})
+
+    def volume_names(self, project):
+        """
+        :param project: compose project name
+        :return: dict volume key -> name of the docker volume, external volumes are skipped
+        """
+        return {key: (config or dict()).get('name') or f'{project}_{key}'
+                for key, config in self.volumes.items() if not (config or dict()).get('external')}
+
+
+class ComposeModelCache:
+    """
+    Parse each combination of compose files and .env file once. An entry is parsed again when the modification
+    time of any of its files changes.
+    """
+    def __init__(self):
+        self.models = dict()
+        self.lock = Lock()
+
+    def get(self, files, env_file, variables=None):
+        """
+        :param files: compose files of the deployment
+        :param env_file: .env file of the deployment
+        :param variables: values overriding the .env file and the shell environment in the interpolation
+        :return: the ComposeModel
+        """
+        variables = variables or dict()
+        key = (tuple(files), env_file, tuple(sorted(variables.items())))
+        mtimes = tuple(modification_time(x) for x in list(files) + [env_file])
+
+        with self.lock:
+            entry = self.models.get(key)
+            if entry is not None and entry[0] == mtimes:
+                return entry[1]
+
+        environment = read_env_file(env_file)
+        model = ComposeModel(files=list(files), environment=environment,
+                             variables={**environment, **environ, **variables})
+
+        with self.lock:
+            self.models[key] = (mtimes, model)
+
+        return model
+
+
+def interpolate(value, variables):
+    # The type is kept, the values tagged with !override are still recognized by merge
+    if isinstance(value, dict):
+        return type(value)({key: interpolate(item, variables) for key, item in value.items()})
+    elif isinstance(value, list):
+        return type(value)([interpolate(item, variables) for item in value])
+    elif isinstance(value, str):
+        return interpolation.sub(lambda match: substitute(match, variables), value)
+
+    return value
+
+
+def substitute(match, variables):
+    if match.group('escaped') is not None:
+        return '$'
+
+    name = match.group('braced') or match.group('named')
+    value = variables.get(name)
+    operator = match.group('operator')
+
+    if operator is not None and operator[-1] == '-':
+        # :- uses the default when the variable is unset or empty, - only when it is unset
+        if value is None or (operator == ':-' and value == ''):
+            return match.group('default')
+
+    return value if value is not None else ''
+
+
+def merge(base, override):
+    result = dict(base)
+
+    for key, value in override.items():
+        if isinstance(value, Reset):
+            result.pop(key, None)
+        elif isinstance(value, dict) and not isinstance(value, OverrideDict) and isinstance(result.get(key), dict):
+            result[key] = merge(result[key], value)
+        else:
+            result[key] = value
+
+    return result
+
+
+def modification_time(file):
+    try:
+        return stat(file).st_mtime_ns
+    except (FileNotFoundError, TypeError):
+        return None
@@ -0,0 +1,498 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from logging import getLogger
+from pathlib import Path
+from re import compile, sub
+from shutil import rmtree
+from threading import Lock, RLock
+from yaml import dump
+from components.compose import aggregate_health_status
+from components.compose_model import ComposeDumper, OverrideList
+from components.exceptions import UnknownDeployment, InvalidDeployment, UnknownBroker
+from utils.file_utils import read_env_file, write_env_file
+
+logger = getLogger(__name__)
+
+valid_deployment_id = compile(r'^[a-zA-Z0-9][a-zA-Z0-9_.-]{0,62}$')
+
+# Labels of every container, volume and network created by the service, used by the orphan sweeper
+label_deployment = 'org.fiware.brokercleaner.deployment'
+label_created = 'org.fiware.brokercleaner.created'
+
+
+class Deployment:
+    def __init__(self, deployment_id, broker, project=None, prefix=None, path=None):
+        self.id = deployment_id
+        self.broker = broker
+        self.project = project
+        self.prefix = prefix
+        self.path = path
+        self.created = datetime.now()
+        self.engine = None
+        self.host = None
+        self.health = None
+        self.operation = None
+        self.released = False
+        self.ports = dict()
+        self.lock = RLock()
+
+    @contextmanager
+    def hold(self, operation):
+        """
+        Serialize the operations over the deployment, e.g. a clean waits until a running init finishes.
+
+        :param operation: name of the operation that holds the deployment
+        :return: the Compose session of the deployment
+        """
+        with self.lock:
+            if self.released:
+                raise InvalidDeployment(data=self.id, message='The deployment was cleaned while the operation was queued')
+
+            self.operation = operation
+            try:
+                yield self.engine
+            finally:
+                self.operation = None
+
+    @property
+    def isolated(self):
+        return self.project is not None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "broker": self.broker,
+            "project": self.project,
+            "prefix": self.prefix,
+            "host": self.host,
+            "created": self.created.isoformat(),
+            "ports": self.ports,
+            "health": self.health,
+            "operation": self.operation
+        }
+
+
+class DeploymentRegistry:
+    """
+    Registry of the deployments managed by the service. Each deployment owns its Compose session, so requests
+    for different deployments never share the docker client, the broker or the list of containers.
+
+    A request without deployment identifier uses the broker name as identifier and keeps the original compose
+    project and container names, as the service did before deployments existed. Any other identifier gets its own
+    compose project (brokercleaner-<id>) and the prefix <id>- in the container names and named volumes.
+
+    Every deployment gets a compose override file labelling its containers, volumes and networks with the
+    deployment identifier and the creation time, so the resources of deployments that are not alive anymore
+    can be found and removed.
+
+    With a PortAllocator, an isolated deployment can also get new host ports for all its published ports, so
+    several brokers publishing the same ports run at the same time.
+
+    With a HostPool, every new deployment is placed on one of the docker hosts and its Compose session talks to
+    that engine, so the later operations over the deployment are routed to its host. The host ports are then
+    allocated by the PortAllocator of that host instead.
+
+    With a DeploymentJournal, the registered deployments and their last known health are journaled, and the
+    deployments alive when the service stopped are registered again by restore.
+    """
+    def __init__(self, compose, path="./deployments", ports=None, hosts=None, journal=None):
+        self.compose = compose
+        self.path = Path(path)
+        self.ports = ports
+        self.hosts = hosts
+        self.journal = journal
+        self.deployments = dict()
+        self.alive = dict()
+        self.released = set()
+        self.lock = Lock()
+
+    def acquire(self, broker, deployment_id=None, remap_ports=False):
+        """
+        Return the deployment with this identifier, creating it if it does not exist.
+
+        :param broker: context broker name
+        :param deployment_id: deployment identifier, None for the default deployment of the broker
+        :param remap_ports: publish the ports of a new isolated deployment on free host ports
+        :return: the Deployment
+        """
+        deployment_id = broker if deployment_id is None else deployment_id
+
+        with self.lock:
+            deployment = self.deployments.get(deployment_id)
+
+            if deployment is None:
+                deployment = self._create(deployment_id=deployment_id, broker=broker, remap_ports=remap_ports)
+                self.deployments[deployment_id] = deployment
+                self.alive[deployment_id] = deployment
+                self.released.discard(deployment_id)
+
+                if self.journal is not None:
+                    self.journal.created(deployment)
+            elif deployment.broker != broker:
+                raise InvalidDeployment(data=deployment_id,
+                                        message=f'The deployment is already used by the broker {deployment.broker}')
+
+        return deployment
+
+    def create(self, broker, deployment_id, remap_ports=False):
+        """
+        Create an isolated deployment that is not registered, e.g. the standby deployments of the warm pool.
+
+        :param broker: context broker name
+        :param deployment_id: deployment identifier
+        :param remap_ports: publish the ports of the deployment on free host ports
+        :return: the Deployment
+        """
+        deployment = self._create(deployment_id=deployment_id, broker=broker, remap_ports=remap_ports)
+
+        with self.lock:
+            self.alive[deployment_id] = deployment
+            self.released.discard(deployment_id)
+
+        return deployment
+
+    def adopt(self, deployment, alias=None):
+        """
+        Register a deployment created outside the registry, optionally reachable with another identifier too.
+
+        :param deployment: the Deployment to register
+        :param alias: additional identifier, e.g. the broker name so requests without identifier use it
+        """
+        with self.lock:
+            self.deployments[deployment.id] = deployment
+            if alias is not None:
+                self.deployments[alias] = deployment
+
+        if self.journal is not None:
+            self.journal.created(deployment, aliases=[alias] if alias is not None else None)
+
+    def find(self, broker, deployment_id=None):
+        """
+        Return a registered deployment of the broker without creating it, for the operations over an existing
+        deployment.
+
+        :param broker: context broker name
+        :param deployment_id: deployment identifier, None for the default deployment of the broker
+        :return: the Deployment
+        """
+        if broker not in self.compose.brokers:
+            raise UnknownBroker(data=broker,
+                                message=f'Unknown Context Broker name. Valid values: {self.compose.brokers.keys()}')
+
+        deployment = self.get(broker if deployment_id is None else deployment_id)
+        if deployment.broker != broker:
+            raise InvalidDeployment(data=deployment.id,
+                                    message=f'The deployment is used by the broker {deployment.broker}')
+
+        return deployment
+
+    def get(self, deployment_id):
+        try:
+            return self.deployments[deployment_id]
+        except KeyError:
+            raise UnknownDeployment(data=deployment_id)
+
+    def release(self, deployment):
+        with self.lock:
+            keys = [key for key, value in self.deployments.items() if value is deployment]
+            for key in keys:
+                del self.deployments[key]
+
+            if self.alive.get(deployment.id) is deployment:
+                del self.alive[deployment.id]
+                self.released.add(deployment.id)
+
+        # Only the registered deployments are journaled, not the standby deployments of the warm pool
+        if self.journal is not None and len(keys) > 0:
+            self.journal.released(deployment.id)
+
+        deployment.released = True
+        self._release_ports(deployment)
+
+        if self.hosts is not None:
+            self.hosts.release(deployment.id)
+
+        if deployment.path is not None:
+            rmtree(deployment.path, ignore_errors=True)
+
+    def observe(self, deployment, status):
+        """
+        Keep the last known health of a deployment, the journal only records the changes.
+
+        :param status: aggregated health status, e.g. "healthy"
+        """
+        if status == deployment.health:
+            return
+
+        deployment.health = status
+        if self.journal is not None and not deployment.released:
+            self.journal.health(deployment.id, status)
+
+    def restore(self):
+        """
+        Register again the deployments of the journal that were not released, without touching their containers.
+        Their current health is taken from a single query per docker host of the containers labelled with a
+        deployment identifier. The deployments whose host is not configured anymore are skipped.
+
+        :return: dict with the deployments restored, their health, and the deployments skipped
+        """
+        if self.journal is None:
+            return None
+
+        records = self.journal.replay()
+        self.journal.compact()
+
+        containers = self._labelled_containers()
+        restored, skipped = dict(), list()
+
+        for deployment_id, record in records.items():
+            try:
+                deployment = self._restore(deployment_id, record)
+            except Exception as e:
+                logger.error(f'Unable to restore the deployment {deployment_id}: {e}')
+                skipped.append(deployment_id)
+                continue
+
+            # Without containers the stack was removed, or never started, while the service was stopped
+            if deployment.host in containers:
+                status = containers[deployment.host].get(deployment_id)
+                expected = deployment.engine.get_container_names()
+                self.observe(deployment, aggregate_health_status(status or list(), expected=expected)["status"])
+
+            with self.lock:
+                self.deployments[deployment_id] = deployment
+                self.alive[deployment_id] = deployment
+                for alias in record["aliases"]:
+                    self.deployments[alias] = deployment
+
+            restored[deployment_id] = deployment.health
+
+        if len(records) > 0:
+            logger.info(f'Restored {len(restored)} deployments from the journal, skipped {len(skipped)}')
+
+        return {"restored": restored, "skipped": skipped}
+
+    def list(self):
+        with self.lock:
+            deployments = {id(deployment): deployment for deployment in self.deployments.values()}
+
+            return [deployment.to_dict() for deployment in deployments.values()]
+
+    def live(self):
+        """
+        :return: identifiers of the deployments not released, registered or not (e.g. warm pool standby)
+        """
+        with self.lock:
+            return set(self.alive.keys())
+
+    def retired(self):
+        """
+        :return: identifiers of the deployments released in this run and not created again
+        """
+        with self.lock:
+            return set(self.released)
+
+    def _create(self, deployment_id, broker, remap_ports=False):
+        if deployment_id == broker:
+            deployment = Deployment(deployment_id=deployment_id, broker=broker, path=self.path.joinpath(deployment_id))
+
+            # Validate the broker before writing anything in the deployment folder
+            self.compose.session(broker=broker)
+
+            override_file = self._write_override_file(deployment)
+            deployment.engine = self.compose.session(broker=broker, override_files=[override_file],
+                                                     host=self._place(deployment))
+
+            return deployment
+
+        if valid_deployment_id.match(deployment_id) is None:
+            raise InvalidDeployment(data=deployment_id)
+
+        project = sub(r'[^a-z0-9_-]', '-', f'brokercleaner-{deployment_id.lower()}')
+        prefix = f'{deployment_id}-'
+        path = self.path.joinpath(deployment_id)
+
+        deployment = Deployment(deployment_id=deployment_id, broker=broker, project=project, prefix=prefix, path=path)
+
+        # Validate the broker before writing anything in the deployment folder
+        self.compose.session(broker=broker)
+
+        try:
+            # The host is selected first, the ports are allocated on it
+            host = self._place(deployment)
+            env_file = self._write_env_file(deployment)
+            override_file = self._write_override_file(
+                deployment, remap_ports=remap_ports and self._allocator(deployment) is not None)
+
+            deployment.engine = self.compose.session(broker=broker,
+                                                     project=project,
+                                                     prefix=prefix,
+                                                     env_file=env_file,
+                                                     override_files=[override_file],
+                                                     host=host)
+        except Exception:
+            # The ports allocated, the host reserved and the files written before the failure are given back
+            self._release_ports(deployment)
+            if self.hosts is not None:
+                self.hosts.release(deployment.id)
+            rmtree(path, ignore_errors=True)
+            raise
+
+        return deployment
+
+    def _restore(self, deployment_id, record):
+        broker = record["broker"]
+        deployment = Deployment(deployment_id=deployment_id, broker=broker, project=record["project"],
+                                prefix=record["prefix"], path=Path(record["path"]) if record["path"] else None)
+        deployment.created = datetime.fromtimestamp(record["created"])
+        deployment.ports = record["ports"]
+        deployment.health = record["health"]
+
+        host = None
+        if self.hosts is not None:
+            host = self.hosts.assign(deployment_id, record["host"], broker)
+            if host is None:
+                raise InvalidDeployment(data=deployment_id, message=f'Unknown docker host {record["host"]}')
+            deployment.host = host.name
+
+        allocator = self._allocator(deployment)
+        if allocator is not None:
+            allocator.reserve([port["published"] for ports in deployment.ports.values() for port in ports])
+
+        # The files are written again if the deployment folder was removed, the remapped ports are then lost
+        override_file = deployment.path.joinpath('docker-compose.override.yml')
+        if not override_file.is_file():
+            logger.warning(f'The files of the deployment {deployment_id} are missing, they are written again')
+            self._write_override_file(deployment)
+            if deployment.isolated:
+                self._write_env_file(deployment)
+
+        kwargs = dict(project=deployment.project, prefix=deployment.prefix,
+                      env_file=str(deployment.path.joinpath('.env'))) if deployment.isolated else dict()
+        deployment.engine = self.compose.session(broker=broker, override_files=[str(override_file)], host=host,
+                                                 **kwargs)
+
+        return deployment
+
+    def _labelled_containers(self):
+        """
+        :return: dict host name -> deployment identifier -> list of container status
+        """
+        hosts = list(self.hosts.hosts.values()) if self.hosts is not None else [None]
+        result = dict()
+
+        for host in hosts:
+            backend = host.backend if host is not None else self.compose.backend
+            name = host.name if host is not None else None
+            deployments = defaultdict(list)
+
+            try:
+                for container in backend.list_containers(all=True, filters={"label": label_deployment}, health=False):
+                    deployments[container["labels"].get(label_deployment)].append(container)
+            except Exception as e:
+                # The health of its deployments is unknown, they are restored anyway
+                logger.error(f'Unable to list the containers of the docker host {name}: {e}')
+                continue
+
+            result[name] = deployments
+
+        return result
+
+    def _place(self, deployment):
+        if self.hosts is None:
+            return None
+
+        host = self.hosts.place(deployment.id, deployment.broker)
+        deployment.host = host.name
+
+        return host
+
+    def _write_env_file(self, deployment):
+        values = read_env_file(self.compose.env_file)
+        values['CONTAINER_NAME_PREFIX'] = deployment.prefix
+
+        return write_env_file(deployment.path.joinpath('.env'), values)
+
+    def _write_override_file(self, deployment, remap_ports=False):
+        model = self.compose.models.get(files=self.compose.brokers[deployment.broker],
+                                        env_file=self.compose.env_file,
+                                        variables={'CONTAINER_NAME_PREFIX': ''})
+
+        labels = {label_deployment: deployment.id, label_created: str(int(deployment.created.timestamp()))}
+        services = {service.name: {'labels': dict(labels)} for service in model.services.values()}
+
+        # Rename every container of the broker, the compose files without ${CONTAINER_NAME_PREFIX} in the
+        # container_name would collide with the containers of other deployments of the same broker
+        if deployment.isolated:
+            for service in model.services.values():
+                if service.container_name is not None:
+                    services[service.name]['container_name'] = f'{deployment.prefix}{service.container_name}'
+
+        # The list of ports is replaced, compose would otherwise add the new ports to the original ones
+        if remap_ports:
+            for service in model.services.values():
+                if len(service.published_ports()) > 0:
+                    services[service.name]['ports'] = OverrideList(
+                        service.remap_ports(lambda published, target: self._allocate(deployment, service.name,
+                                                                                     target)))
+
+        # External volumes and networks are not created by the deployment, they are never labelled
+        networks = {name: {'labels': dict(labels)} for name, config in model.networks.items()
+                    if not (config or dict()).get('external')}
+        if any(service.config.get('networks') is None for service in model.services.values()):
+            networks['default'] = {'labels': dict(labels)}
+
+        volumes = {name: {'labels': dict(labels)} for name, config in model.volumes.items()
+                   if not (config or dict()).get('external')}
+
+        content = {'services': services, 'networks': networks, 'volumes': volumes}
+
+        override_file = deployment.path.joinpath('docker-compose.override.yml')
+        override_file.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(override_file, 'w') as file:
+            dump({key: value for key, value in content.items() if value}, file, Dumper=ComposeDumper,
+                 default_flow_style=False)
+
+        return str(override_file)
+
+    def _allocator(self, deployment):
+        # Without hosts the ports of the registry are used, otherwise the ports of the host of the deployment
+        if self.hosts is None:
+            return self.ports
+
+        host = self.hosts.get(deployment.host) if deployment.host is not None else None
+        return host.ports if host is not None else None
+
+    def _release_ports(self, deployment):
+        allocator = self._allocator(deployment)
+        if allocator is not None:
+            allocator.release([port["published"] for ports in deployment.ports.values() for port in ports])
+
+    def _allocate(self, deployment, service, target):
+        port = self._allocator(deployment).allocate()
+        deployment.ports.setdefault(service, list()).append({"published": port, "target": target})
+
+        return port
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from datetime import datetime
+from json import dump, load
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from time import time
+from components.exceptions import UnknownDiagnostics
+
+logger = getLogger(__name__)
+
+
+class DiagnosticsRecorder:
+    """
+    Bundles with the information needed to know why a deployment failed its health gate without access to the
+    docker host: the state of each container from the inspect output, its healthcheck history and the tail of
+    its logs, taken from the ring buffers of the LogCollector or read from the engine otherwise.
+
+    A deployment gets at most one bundle every min_interval seconds and only the last max_bundles are kept, so a
+    deployment failing in a loop does not fill the disk. The environment of the containers is never saved, it
+    holds the passwords of the databases.
+    """
+    def __init__(self, collector=None, path="./deployments/.diagnostics", max_bundles=50, tail=200, min_interval=60):
+        """
+        :param collector: LogCollector with the last lines of the containers, None to read them from the engine
+        :param path: folder of the bundles
+        :param max_bundles: bundles kept, the oldest ones are removed
+        :param tail: log lines saved per container
+        :param min_interval: minimum seconds between two bundles of the same deployment
+        """
+        self.collector = collector
+        self.path = Path(path)
+        self.max_bundles = max_bundles
+        self.tail = tail
+        self.min_interval = min_interval
+        self.last = dict()
+        self.lock = Lock()
+        self.index = dict()
+
+        for file in sorted(self.path.glob('*.json')):
+            try:
+                with open(file) as f:
+                    self.index[file.stem] = self._summary(load(f))
+            except (OSError, ValueError):
+                continue
+
+    def capture(self, deployment, reason, status=None):
+        """
+        :param deployment: the Deployment that failed
+        :param reason: why the bundle is captured, e.g. "failed" or "timeout"
+        :param status: last aggregated health status of the deployment
+        :return: summary of the bundle, None if the deployment got one less than min_interval seconds ago
+        """
+        now = time()
+        with self.lock:
+            if now - self.last.get(deployment.id, 0) < self.min_interval:
+                return None
+            self.last[deployment.id] = now
+
+        engine = deployment.engine
+        project = engine.get_project_name()
+        names = engine.get_container_names()
+        captured = datetime.now()
+
+        try:
+            containers = {x["name"]: x for x in engine.backend.list_containers(
+                all=True, filters={"label": f'com.docker.compose.project={project}'}, health=False)}
+        except Exception as e:
+            logger.error(f'Diagnostics could not list the containers of {deployment.id}: {e}')
+            containers = dict()
+
+        bundle = {
+            "id": f'{captured.strftime("%Y%m%dT%H%M%S")}-{deployment.id}',
+            "deployment": deployment.to_dict(),
+            "reason": reason,
+            "status": status,
+            "captured": captured.isoformat(),
+            "containers": {name: self._container(engine.backend, name, service.name, containers.get(name))
+                           for name, service in names.items()}
+        }
+
+        with self.lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(self.path.joinpath(f'{bundle["id"]}.json'), 'w') as file:
+                dump(bundle, file, indent=2)
+
+            self.index[bundle["id"]] = self._summary(bundle)
+            self._evict()
+
+        logger.info(f'Diagnostics bundle {bundle["id"]} captured, the deployment {deployment.id} is {reason}')
+
+        return self.index[bundle["id"]]
+
+    def capture_failure(self, deployment, reason):
+        """
+        Capture the bundle of a deployment whose operation failed, from the thread running the operation. The
+        errors are only logged, they never replace the failure of the operation.
+
+        :param reason: why the bundle is captured, e.g. "init" or "snapshot"
+        :return: identifier of the bundle, None if it was not captured
+        """
+        try:
+            status = deployment.engine.check_health_status()["status"] if deployment.engine is not None else None
+            bundle = self.capture(deployment, reason, status)
+        except Exception as e:
+            logger.error(f'Unable to capture the diagnostics of {deployment.id}: {e}')
+            return None
+
+        return bundle["id"] if bundle is not None else None
+
+    def list(self):
+        with self.lock:
+            return list(self.index.values())
+
+    def get(self, bundle_id):
+        with self.lock:
+            if bundle_id not in self.index:
+                raise UnknownDiagnostics(data=bundle_id)
+
+            with open(self.path.joinpath(f'{bundle_id}.json')) as file:
+                return load(file)
+
+    def _container(self, backend, name, service, container):
+        if container is None:
+            return {"service": service, "missing": True}
+
+        result = {"service": service, "status": container["status"], "health": container["health"]}
+
+        try:
+            inspect = backend.inspect_container(container["id"])
+            state = inspect.get("State") or dict()
+            config = {key: value for key, value in (inspect.get("Config") or dict()).items() if key != "Env"}
+
+            result["state"] = {key: value for key, value in state.items() if key != "Health"}
+            result["restart_count"] = inspect.get("RestartCount")
+            result["healthcheck"] = config.get("Healthcheck")
+            result["health_log"] = (state.get("Health") or dict()).get("Log") or list()
+            result["image"] = config.get("Image")
+        except Exception as e:
+            result["inspect_error"] = str(e)
+
+        logs = self.collector.tail(name, self.tail) if self.collector is not None else list()
+        if len(logs) == 0:
+            stream = None
+            try:
+                stream = backend.container_logs(container["id"], tail=self.tail)
+                logs = [{"time": at, "line": text} for at, text in stream]
+            except Exception as e:
+                result["logs_error"] = str(e)
+            finally:
+                if stream is not None:
+                    stream.close()
+
+        result["logs"] = logs
+
+        return result
+
+    def _evict(self):
+        for bundle_id in sorted(self.index)[:max(0, len(self.index) - self.max_bundles)]:
+            del self.index[bundle_id]
+            self.path.joinpath(f'{bundle_id}.json').unlink(missing_ok=True)
+
+    @staticmethod
+    def _summary(bundle):
+        return {
+            "id": bundle["id"],
+            "deployment": bundle["deployment"]["id"],
+            "broker": bundle["deployment"]["broker"],
+            "reason": bundle["reason"],
+            "status": bundle["status"],
+            "captured": bundle["captured"]
+        }
@@ -0,0 +1,676 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from abc import ABC, abstractmethod
+from datetime import datetime
+from http.client import HTTPConnection, HTTPException
+from json import loads, dumps
+from queue import LifoQueue, Empty
+from re import compile
+from socket import socket, AF_UNIX, SOCK_STREAM, SHUT_RDWR
+from subprocess import Popen, PIPE, STDOUT, DEVNULL
+from urllib.parse import urlencode, quote, urlparse
+from components.exceptions import DockerBackendError
+from components.profiling import instrument
+
+# Health reported by the docker engine in the Status column: "Up 2 minutes (healthy)", "Up 1 second (health: starting)"
+status_health = compile(r'\((?:health: )?(healthy|unhealthy|starting)\)')
+
+# Sizes printed by the docker CLI use decimal units
+size_format = compile(r'^\s*([0-9.]+)\s*([kKMGTP]?B)\s*$')
+size_units = {"B": 1, "KB": 10 ** 3, "MB": 10 ** 6, "GB": 10 ** 9, "TB": 10 ** 12, "PB": 10 ** 15}
+
+# A log line without newline is cut at this size, the lines of some JVM stack traces have no end
+max_log_line = 16 * 1024
+
+
+class DockerBackend(ABC):
+    """
+    Docker engine operations used outside of the compose orchestration. The containers are returned as dicts
+    with the keys id, name, status, health and labels, the events as dicts with the keys action, id and
+    attributes, whatever the implementation. Listing without health allows a single request to the engine, the
+    health of the stopped containers may then be reported as unknown.
+    """
+    @abstractmethod
+    def list_containers(self, all=True, filters=None, health=True):
+        pass
+
+    @abstractmethod
+    def inspect_containers(self, ids):
+        pass
+
+    @abstractmethod
+    def events(self, since=None, filters=None):
+        pass
+
+    @abstractmethod
+    def remove_container(self, container_id):
+        pass
+
+    @abstractmethod
+    def list_volumes(self, filters=None):
+        pass
+
+    @abstractmethod
+    def remove_volume(self, name):
+        pass
+
+    @abstractmethod
+    def volume_sizes(self):
+        """
+        :return: dict volume name -> bytes used, None when the engine did not compute it
+        """
+
+    @abstractmethod
+    def info(self):
+        """
+        :return: dict with the cpus and the bytes of memory of the docker host
+        """
+
+    @abstractmethod
+    def container_stats(self, container_id):
+        """
+        :return: dict with the bytes of memory and the cpus (1.0 is a full core) used by the container
+        """
+
+    @abstractmethod
+    def list_networks(self, filters=None):
+        pass
+
+    @abstractmethod
+    def remove_network(self, name):
+        pass
+
+    @abstractmethod
+    def inspect_container(self, container_id):
+        """
+        :return: the inspect output of the engine for the container, including the healthcheck history
+        """
+
+    @abstractmethod
+    def container_logs(self, container_id, tail=None, since=None, follow=False):
+        """
+        :param tail: number of last lines, None for all of them
+        :param since: unix time of the oldest line
+        :param follow: keep streaming the new lines until the stream is closed or the container stops
+        :return: LogStream of the stdout and stderr lines of the container
+        """
+
+    @abstractmethod
+    def inspect_image(self, image):
+        """
+        :return: dict with the id and the bytes of the image, None if the engine does not have it
+        """
+
+    @abstractmethod
+    def pull_image(self, image):
+        """
+        Pull an image from its registry, the layers already present in the engine are not downloaded again.
+
+        :return: bytes downloaded, None when the implementation cannot report them
+        """
+
+
+class LogStream:
+    """
+    Lines of the logs of a container as (time, text), the time is the docker timestamp in unix seconds. The
+    stream can be closed from another thread, e.g. to stop following the logs when the client goes away.
+    """
+    def __init__(self, chunks, close):
+        """
+        :param chunks: iterator of the bytes of the logs, stdout and stderr already merged
+        :param close: callable stopping the source of the chunks
+        """
+        self.chunks = chunks
+        self.closer = close
+        self.closed = False
+
+    def __iter__(self):
+        pending = b''
+
+        try:
+            for chunk in self.chunks:
+                pending += chunk
+
+                *lines, pending = pending.split(b'\n')
+                if len(pending) > max_log_line:
+                    lines.append(pending)
+                    pending = b''
+
+                for line in lines:
+                    yield parse_log_line(line)
+        except (HTTPException, OSError, ValueError):
+            # The stream was closed while reading
+            if not self.closed:
+                raise
+
+        if pending and not self.closed:
+            yield parse_log_line(pending)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.closer()
+
+
+@instrument("docker")
+class WhalesBackend(DockerBackend):
+    """
+    Implementation with python_on_whales, every operation runs the docker CLI in a new process.
+    """
+    def __init__(self, docker=None, host=None, context=None):
+        """
+        :param docker: DockerClient to use, by default one for the host or context
+        :param host: docker engine endpoint (DOCKER_HOST), e.g. tcp://10.0.0.2:2375 or ssh://user@node
+        :param context: docker context name, used instead of the host
+        """
+        if docker is None:
+            from python_on_whales import DockerClient
+
+            docker = DockerClient(host=host, context=context)
+
+        self.docker = docker
+
+    def list_containers(self, all=True, filters=None, health=True):
+        containers = self.docker.container.list(all=all, filters=self._filters(filters))
+
+        return self.inspect_containers([x.id for x in containers])
+
+    def inspect_containers(self, ids):
+        if len(ids) == 0:
+            return list()
+
+        return [self._container(x) for x in self.docker.container.inspect(list(ids))]
+
+    def events(self, since=None, filters=None):
+        for event in self.docker.system.events(since=since, filters=self._filters(filters)):
+            yield {"action": event.action, "id": event.actor.id, "attributes": event.actor.attributes or dict()}
+
+    def remove_container(self, container_id):
+        self.docker.container.remove(container_id, force=True, volumes=True)
+
+    def list_volumes(self, filters=None):
+        return [{"name": x.name, "labels": x.labels or dict(), "created": x.created_at}
+                for x in self.docker.volume.list(filters=self._filters(filters))]
+
+    def remove_volume(self, name):
+        self.docker.volume.remove(name)
+
+    def volume_sizes(self):
+        from python_on_whales.utils import run
+
+        # docker.system.disk_free() has no verbose mode, the CLI only reports human readable sizes
+        volumes = loads(run(self.docker.docker_cmd + ["system", "df", "-v", "--format", "{{json .Volumes}}"]))
+
+        return {x["Name"]: parse_size(x.get("Size")) for x in volumes or list()}
+
+    def info(self):
+        info = self.docker.system.info()
+
+        return {"cpus": info.n_cpu, "memory": info.mem_total}
+
+    def container_stats(self, container_id):
+        stats = self.docker.container.stats(container_id)[0]
+
+        # The CLI reports the cpu as a percentage of one core
+        return {"memory": stats.memory_used, "cpus": stats.cpu_percentage / 100}
+
+    def list_networks(self, filters=None):
+        return [{"name": x.name, "id": x.id, "labels": x.labels or dict(), "created": x.created}
+                for x in self.docker.network.list(filters=self._filters(filters))]
+
+    def remove_network(self, name):
+        self.docker.network.remove(name)
+
+    def inspect_container(self, container_id):
+        from python_on_whales.utils import run
+
+        # The python_on_whales models rename the fields, the raw output of the engine is kept instead
+        return loads(run(self.docker.docker_cmd + ["container", "inspect", container_id]))[0]
+
+    def container_logs(self, container_id, tail=None, since=None, follow=False):
+        command = self.docker.docker_cmd + ["container", "logs", "--timestamps"]
+        if tail is not None:
+            command += ["--tail", str(tail)]
+        if since is not None:
+            command += ["--since", f'{since:.9f}']
+        if follow:
+            command += ["--follow"]
+
+        # The CLI process is owned here so that closing the stream terminates it
+        process = Popen(command + [container_id], stdout=PIPE, stderr=STDOUT, stdin=DEVNULL)
+
+        def chunks():
+            try:
+                yield from iter(lambda: process.stdout.read1(65536), b'')
+            finally:
+                process.stdout.close()
+                process.wait()
+
+        return LogStream(chunks(), process.terminate)
+
+    def inspect_image(self, image):
+        from python_on_whales.exceptions import NoSuchImage
+
+        try:
+            data = self.docker.image.inspect(image)
+        except NoSuchImage:
+            return None
+
+        return {"id": data.id, "size": data.size}
+
+    def pull_image(self, image):
+        # The CLI only prints the progress on a terminal, the downloaded bytes are unknown
+        self.docker.image.pull(image, quiet=True)
+
+        return None
+
+    @staticmethod
+    def _filters(filters):
+        # python_on_whales accepts one value per filter key
+        return {key: value[0] if isinstance(value, list) else value for key, value in (filters or dict()).items()}
+
+    @staticmethod
+    def _container(container):
+        return {
+            "id": container.id,
+            "name": container.name,
+            "status": container.state.status,
+            "health": container.state.health.status if container.state.health is not None else "unknown",
+            "labels": container.config.labels or dict()
+        }
+
+
+class UnixHTTPConnection(HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket(AF_UNIX, SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+@instrument("docker")
+class NativeBackend(DockerBackend):
+    """
+    Implementation talking HTTP to the Docker Engine API over the unix socket, or over TCP without TLS for a
+    remote engine, with a pool of persistent connections. The events stream uses its own connection.
+    """
+    def __init__(self, socket_path="/var/run/docker.sock", pool_size=4, timeout=30, api_version=None, host=None):
+        """
+        :param host: docker engine endpoint, unix:///path or tcp://address:port, None for the socket path
+        """
+        url = urlparse(host) if host else None
+        if url is not None and url.scheme not in ("unix", "tcp"):
+            raise DockerBackendError(data=host, message='Only unix:// and tcp:// endpoints are supported')
+
+        self.socket_path = url.path if url is not None and url.scheme == "unix" else socket_path
+        self.address = (url.hostname, url.port or 2375) if url is not None and url.scheme == "tcp" else None
+        self.timeout = timeout
+        self.prefix = f'/v{api_version}' if api_version else ''
+        self.pool = LifoQueue(maxsize=pool_size)
+
+    def request(self, method, path, query=None):
+        """
+        Execute a request with a pooled connection, a stale connection is replaced and the request retried once.
+
+        :return: the decoded JSON body, None for empty bodies
+        """
+        url = f'{self.prefix}{path}' + (f'?{urlencode(query)}' if query else '')
+
+        for attempt in range(2):
+            connection = self._acquire()
+            try:
+                connection.request(method, url)
+                response = connection.getresponse()
+                body = response.read()
+            except (HTTPException, OSError) as e:
+                connection.close()
+                if attempt == 1:
+                    raise DockerBackendError(data=url, message=f'Docker engine request failed: {e}')
+                continue
+
+            self._release(connection)
+
+            if response.status >= 400:
+                raise DockerBackendError(data=url, message=f'{response.status} {body.decode(errors="replace")}')
+
+            return loads(body) if body else None
+
+    def list_containers(self, all=True, filters=None, health=True):
+        query = {"all": "1" if all else "0"}
+        if filters:
+            query["filters"] = dumps(self._filters(filters))
+
+        containers = [self._container(x) for x in self.request("GET", "/containers/json", query)]
+
+        if not health:
+            return containers
+
+        # The listing does not report the last health of stopped containers, only those are inspected
+        stopped = [x["id"] for x in containers if x["status"] != "running" and x["health"] == "unknown"]
+        if len(stopped) > 0:
+            inspected = {x["id"]: x for x in self.inspect_containers(stopped)}
+            containers = [inspected.get(x["id"], x) for x in containers]
+
+        return containers
+
+    def inspect_containers(self, ids):
+        result = list()
+
+        for container_id in ids:
+            data = self.request("GET", f'/containers/{quote(container_id)}/json')
+            health = (data["State"].get("Health") or dict()).get("Status", "unknown")
+            result.append({
+                "id": data["Id"],
+                "name": data["Name"].lstrip('/'),
+                "status": data["State"]["Status"],
+                "health": health,
+                "labels": data["Config"].get("Labels") or dict()
+            })
+
+        return result
+
+    def events(self, since=None, filters=None):
+        query = dict()
+        if since is not None:
+            query["since"] = str(int(since.timestamp()))
+        if filters:
+            query["filters"] = dumps(self._filters(filters))
+
+        connection = self._connect(timeout=None)
+        try:
+            connection.request("GET", f'{self.prefix}/events' + (f'?{urlencode(query)}' if query else ''))
+            response = connection.getresponse()
+
+            if response.status >= 400:
+                raise DockerBackendError(data='/events', message=f'{response.status} {response.read().decode()}')
+
+            while True:
+                line = response.readline()
+                if not line:
+                    return
+                if line.strip():
+                    event = loads(line)
+                    actor = event.get("Actor") or dict()
+                    yield {"action": event.get("Action", event.get("status", "")),
+                           "id": actor.get("ID", event.get("id")),
+                           "attributes": actor.get("Attributes") or dict()}
+        finally:
+            connection.close()
+
+    def remove_container(self, container_id):
+        self.request("DELETE", f'/containers/{quote(container_id)}', {"force": "1", "v": "1"})
+
+    def inspect_container(self, container_id):
+        return self.request("GET", f'/containers/{quote(container_id)}/json')
+
+    def container_logs(self, container_id, tail=None, since=None, follow=False):
+        query = {"stdout": "1", "stderr": "1", "timestamps": "1", "follow": "1" if follow else "0"}
+        if tail is not None:
+            query["tail"] = str(tail)
+        if since is not None:
+            query["since"] = f'{since:.9f}'
+
+        url = f'{self.prefix}/containers/{quote(container_id)}/logs?{urlencode(query)}'
+
+        # Own connection, a followed stream is never returned to the pool
+        connection = self._connect(timeout=None if follow else self.timeout)
+        try:
+            connection.request("GET", url)
+            response = connection.getresponse()
+        except (HTTPException, OSError) as e:
+            connection.close()
+            raise DockerBackendError(data=url, message=f'Docker engine request failed: {e}')
+
+        if response.status >= 400:
+            body = response.read().decode(errors="replace")
+            connection.close()
+            raise DockerBackendError(data=url, message=f'{response.status} {body}')
+
+        def close():
+            # Unblock a read waiting for new lines in another thread
+            try:
+                connection.sock.shutdown(SHUT_RDWR)
+            except (AttributeError, OSError):
+                pass
+            connection.close()
+
+        return LogStream(self._demultiplex(response, connection), close)
+
+    def inspect_image(self, image):
+        try:
+            data = self.request("GET", f'/images/{quote(image)}/json')
+        except DockerBackendError as e:
+            if e.message.startswith('404 '):
+                return None
+            raise
+
+        return {"id": data["Id"], "size": data.get("Size")}
+
+    def pull_image(self, image):
+        repository, tag = parse_image_reference(image)
+        if not tag:
+            # An empty tag pulls every tag of the repository
+            raise DockerBackendError(data=image, message='Image reference without tag')
+
+        url = f'{self.prefix}/images/create?{urlencode({"fromImage": repository, "tag": tag})}'
+
+        # The progress is streamed until the pull ends, the connection is not returned to the pool
+        connection = self._connect(timeout=self.timeout)
+        try:
+            connection.request("POST", url)
+            response = connection.getresponse()
+
+            if response.status >= 400:
+                raise DockerBackendError(data=url, message=f'{response.status} {response.read().decode()}')
+
+            # Size of each downloaded layer, the layers already present only report "Already exists"
+            layers = dict()
+            for line in response:
+                if not line.strip():
+                    continue
+
+                progress = loads(line)
+                if "error" in progress:
+                    raise DockerBackendError(data=image, message=progress["error"])
+
+                total = (progress.get("progressDetail") or dict()).get("total")
+                if progress.get("status") == "Downloading" and total:
+                    layers[progress.get("id")] = total
+
+            return sum(layers.values())
+        except (HTTPException, OSError) as e:
+            raise DockerBackendError(data=url, message=f'Docker engine request failed: {e}')
+        finally:
+            connection.close()
+
+    def list_volumes(self, filters=None):
+        query = {"filters": dumps(self._filters(filters))} if filters else None
+        volumes = self.request("GET", "/volumes", query).get("Volumes") or list()
+
+        return [{"name": x["Name"], "labels": x.get("Labels") or dict(), "created": x.get("CreatedAt")}
+                for x in volumes]
+
+    def remove_volume(self, name):
+        self.request("DELETE", f'/volumes/{quote(name)}')
+
+    def volume_sizes(self):
+        sizes = dict()
+
+        for volume in self.request("GET", "/system/df", {"type": "volume"}).get("Volumes") or list():
+            # The engine reports -1 when the usage was not computed
+            size = (volume.get("UsageData") or dict()).get("Size", -1)
+            sizes[volume["Name"]] = size if size >= 0 else None
+
+        return sizes
+
+    def info(self):
+        info = self.request("GET", "/info")
+
+        return {"cpus": info["NCPU"], "memory": info["MemTotal"]}
+
+    def container_stats(self, container_id):
+        stats = self.request("GET", f'/containers/{quote(container_id)}/stats', {"stream": "false"})
+        memory = stats.get("memory_stats") or dict()
+        cpu, precpu = stats.get("cpu_stats") or dict(), stats.get("precpu_stats") or dict()
+
+        # Same computation as docker stats, the page cache is not counted as used memory
+        used = memory.get("usage", 0) - (memory.get("stats") or dict()).get("inactive_file", 0)
+        cpu_delta = (cpu.get("cpu_usage") or dict()).get("total_usage", 0) - \
+            (precpu.get("cpu_usage") or dict()).get("total_usage", 0)
+        system_delta = cpu.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+        cpus = cpu_delta / system_delta * cpu.get("online_cpus", 1) if system_delta > 0 and cpu_delta > 0 else 0.0
+
+        return {"memory": max(0, used), "cpus": cpus}
+
+    def list_networks(self, filters=None):
+        query = {"filters": dumps(self._filters(filters))} if filters else None
+
+        return [{"name": x["Name"], "id": x["Id"], "labels": x.get("Labels") or dict(), "created": x.get("Created")}
+                for x in self.request("GET", "/networks", query)]
+
+    def remove_network(self, name):
+        self.request("DELETE", f'/networks/{quote(name)}')
+
+    def close(self):
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except Empty:
+                return
+
+    def _acquire(self):
+        try:
+            return self.pool.get_nowait()
+        except Empty:
+            return self._connect(timeout=self.timeout)
+
+    def _connect(self, timeout):
+        if self.address is not None:
+            return HTTPConnection(*self.address, timeout=timeout)
+
+        return UnixHTTPConnection(self.socket_path, timeout=timeout)
+
+    def _release(self, connection):
+        try:
+            self.pool.put_nowait(connection)
+        except Exception:
+            connection.close()
+
+    @staticmethod
+    def _demultiplex(response, connection):
+        """
+        Without TTY the engine frames the logs with an 8 bytes header: stream type, 3 zero bytes and the size of
+        the payload. With TTY the logs are sent as they are, they start with the timestamp instead.
+        """
+        try:
+            header = response.read(8)
+            if len(header) == 8 and header[0] in (0, 1, 2) and header[1:4] == b'\0\0\0':
+                while len(header) == 8:
+                    yield response.read(int.from_bytes(header[4:8], "big"))
+                    header = response.read(8)
+            else:
+                yield header
+                yield from iter(lambda: response.read1(65536), b'')
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _filters(filters):
+        # The Engine API expects a list of values per filter key
+        return {key: value if isinstance(value, list) else [value] for key, value in filters.items()}
+
+    @staticmethod
+    def _container(container):
+        match = status_health.search(container.get("Status") or '')
+
+        return {
+            "id": container["Id"],
+            "name": (container.get("Names") or ['/'])[0].lstrip('/'),
+            "status": container.get("State"),
+            "health": match.group(1) if match is not None else "unknown",
+            "labels": container.get("Labels") or dict()
+        }
+
+
+def parse_log_line(line):
+    """
+    :param line: bytes of a log line with the docker timestamp, e.g. b"2023-10-18T09:45:34.760958123Z message"
+    :return: (unix time, text), the time is None when the line has no timestamp
+    """
+    text = line.decode(errors="replace").rstrip('\r')
+    stamp, _, message = text.partition(' ')
+
+    try:
+        return datetime.fromisoformat(stamp).timestamp(), message
+    except ValueError:
+        return None, text
+
+
+def parse_image_reference(image):
+    """
+    :param image: image reference, e.g. "mongo:4.4", "quay.io/fiware/orion-ld" or "postgis/postgis@sha256:..."
+    :return: (repository, tag or digest), the tag is latest when the reference has none
+    """
+    name, at, digest = image.partition('@')
+    if at:
+        return name, digest
+
+    # The colon of a registry port is followed by a path, the one of a tag is not
+    repository, colon, tag = name.rpartition(':')
+    if not colon or '/' in tag:
+        return name, "latest"
+
+    return repository, tag
+
+
+def parse_size(value):
+    """
+    :param value: size printed by the docker CLI, e.g. "12.5MB", "0B" or "N/A"
+    :return: bytes, None if the size is unknown
+    """
+    match = size_format.match(value or '')
+    if match is None:
+        return None
+
+    return int(float(match.group(1)) * size_units[match.group(2).upper()])
+
+
+def create_backend(settings):
+    """
+    :param settings: docker section of the configuration, optionally with the host or context of the engine
+    :return: the DockerBackend selected in the configuration
+    """
+    host, context = settings.get('host'), settings.get('context')
+
+    # The docker contexts and the ssh endpoints are only resolved by the docker CLI
+    if settings.get('backend', 'whales') == 'native' and context is None and not (host or '').startswith('ssh://'):
+        return NativeBackend(socket_path=settings.get('socket', '/var/run/docker.sock'),
+                             pool_size=settings.get('pool_size', 4),
+                             timeout=settings.get('timeout', 30),
+                             api_version=settings.get('api_version'),
+                             host=host)
+
+    return WhalesBackend(host=host, context=context)
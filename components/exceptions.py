@@ -67,3 +67,120 @@ class Unimplemented(CommonException):
 
     def __init__(self, data, message="Unimplemented deployment for this broker"):
         super().__init__(data=data, message=message)
+
+
+class UnknownJob(CommonException):
+    """Raised when the job identifier is not registered in the job manager"""
+    """Exception raised for unknown job identifier.
+
+    Attributes:
+        data -- job identifier received
+        message -- explanation of the error
+    """
+
+    def __init__(self, data, message="Unknown job identifier"):
+        super().__init__(data=data, message=message)
+
+
+class UnknownDeployment(CommonException):
+    """Raised when the deployment identifier is not registered"""
+    """Exception raised for unknown deployment identifier.
+
+    Attributes:
+        data -- deployment identifier received
+        message -- explanation of the error
+    """
+
+    def __init__(self, data, message="Unknown deployment identifier"):
+        super().__init__(data=data, message=message)
+
+
+class InvalidDeployment(CommonException):
+    """Raised when the deployment identifier cannot be used"""
+    """Exception raised for invalid deployment identifier.
+
+    Attributes:
+        data -- deployment identifier received
+        message -- explanation of the error
+    """
+
+    def __init__(self, data, message="Invalid deployment identifier, allowed characters: [a-zA-Z0-9_.-]"):
+        super().__init__(data=data, message=message)
+
+
+class DockerBackendError(CommonException):
+    """Raised when a request to the docker engine fails"""
+    """Exception raised for failed docker engine requests.
+
+    Attributes:
+        data -- docker engine resource requested
+        message -- explanation of the error
+    """
+
+    def __init__(self, data, message="Docker engine request failed"):
+        super().__init__(data=data, message=message)
+
+
+class AdmissionRejected(CommonException):
+    """Raised when the scheduler cannot admit a deployment"""
+    """Exception raised for deployments rejected by the admission control.
+
+    Attributes:
+        data -- deployment identifier received
+        message -- explanation of the error
+    """
+
+    def __init__(self, data, message="The deployment does not fit in the resources of the host"):
+        super().__init__(data=data, message=message)
+
+
+class NoHealthyHost(CommonException):
+    """Raised when no docker host can take a new deployment"""
+    """Exception raised for deployments without healthy docker host.
+
+    Attributes:
+        data -- deployment identifier received
+        message -- explanation of the error
+    """
+
+    def __init__(self, data, message="There is no healthy docker host for the deployment"):
+        super().__init__(data=data, message=message)
+
+
+class NoFreePort(CommonException):
+    """Raised when every host port of the range is allocated or in use"""
+    """Exception raised for remapped deployments without free host ports.
+
+    Attributes:
+        data -- range of host ports
+        message -- explanation of the error
+    """
+
+    def __init__(self, data, message="There is no free host port for the deployment"):
+        super().__init__(data=data, message=message)
+
+
+class UnknownDiagnostics(CommonException):
+    """Raised when the diagnostics bundle identifier is not found"""
+    """Exception raised for unknown diagnostics bundle identifier.
+
+    Attributes:
+        data -- bundle identifier received
+        message -- explanation of the error
+    """
+
+    def __init__(self, data, message="Unknown diagnostics bundle identifier"):
+        super().__init__(data=data, message=message)
+
+
+class UnknownTrace(CommonException):
+    """Raised when the request trace identifier is not found"""
+    """Exception raised for unknown request trace identifier.
+
+    Attributes:
+        data -- trace identifier received
+        message -- explanation of the error
+    """
+
+    def __init__(self, data, message="Unknown request trace identifier, it may have been discarded"):
+        super().__init__(data=data, message=message)
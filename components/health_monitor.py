@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from asyncio import Queue, QueueFull, get_running_loop, wait_for
+from datetime import datetime, timezone
+from logging import getLogger
+from threading import Thread, Event, Lock
+from components.docker_backend import WhalesBackend
+from components.metrics import track
+
+logger = getLogger(__name__)
+
+
+class Subscription:
+    """
+    Queue of container transitions delivered from the monitor thread to a coroutine of the event loop.
+    """
+    def __init__(self, names=None, size=1000):
+        self.loop = get_running_loop()
+        self.names = set(names) if names is not None else None
+        self.queue = Queue(maxsize=size)
+
+    def publish(self, transition):
+        if self.names is None or transition["name"] in self.names:
+            self.loop.call_soon_threadsafe(self._put, transition)
+
+    async def get(self, timeout):
+        """
+        :param timeout: seconds to wait for the next transition
+        :return: the transition or None if the timeout expired
+        """
+        try:
+            return await wait_for(self.queue.get(), timeout=timeout)
+        except TimeoutError:
+            return None
+
+    def _put(self, transition):
+        try:
+            self.queue.put_nowait(transition)
+        except QueueFull:
+            # A slow consumer loses transitions, it still reads the current state from the monitor
+            pass
+
+
+class HealthMonitor:
+    """
+    Keep the state and health of every container of the docker engine in memory, fed by the docker events
+    stream (start, die, health_status, destroy...). The table is rebuilt with a full inspect when the
+    monitor starts and every time the events stream has to be reconnected.
+    """
+    actions = {"create", "start", "restart", "die", "stop", "kill", "pause", "unpause", "destroy", "health_status"}
+
+    def __init__(self, backend=None, backoff=1, max_backoff=30):
+        self.backend = backend if backend is not None else WhalesBackend()
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.containers = dict()
+        self.synced = False
+        self.subscribers = set()
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = Thread(target=self._run, name="health-monitor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.synced = False
+
+    def get(self, name):
+        return self.containers.get(name)
+
+    def subscribe(self, names=None):
+        """
+        Receive the transitions of the containers from a coroutine, must be called from the event loop.
+
+        :param names: container names to follow, None for all the containers
+        :return: the Subscription
+        """
+        subscription = Subscription(names=names)
+
+        with self.lock:
+            self.subscribers.add(subscription)
+
+        return subscription
+
+    def attach(self, listener):
+        """
+        Register an object with a publish(transition) method, it is called from the monitor thread.
+        """
+        with self.lock:
+            self.subscribers.add(listener)
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def reconcile(self):
+        """
+        Replace the state table with the result of a full inspect of the containers.
+        """
+        containers = self.backend.list_containers(all=True)
+        table = {container["name"]: self._state(container) for container in containers}
+
+        with self.lock:
+            previous, self.containers = self.containers, table
+
+            for name in set(previous) | set(table):
+                self._publish(table.get(name), previous.get(name), name)
+
+    def refresh(self, container_id):
+        """
+        Inspect one container, used on start events to know whether the container has a healthcheck.
+        """
+        with track("inspect", None):
+            containers = self.backend.inspect_containers([container_id])
+
+        for container in containers:
+            state = self._state(container)
+
+            with self.lock:
+                previous = self.containers.get(container["name"])
+                self.containers[container["name"]] = state
+                self._publish(state, previous, container["name"])
+
+    def apply(self, action, name, attributes):
+        """
+        Update the state table with one docker event.
+
+        :param action: event action, e.g. "start" or "health_status: healthy"
+        :param name: container name
+        :param attributes: attributes of the event actor (labels of the container)
+        """
+        action, _, detail = action.partition(':')
+        action, detail = action.strip(), detail.strip()
+
+        if action not in self.actions:
+            return
+
+        with self.lock:
+            if action == "destroy":
+                previous = self.containers.pop(name, None)
+                self._publish(None, previous, name)
+                return
+
+            previous = dict(self.containers[name]) if name in self.containers else None
+            state = self.containers.setdefault(name, {"name": name, "health": "unknown", "status": "created"})
+            state["project"] = attributes.get("com.docker.compose.project", state.get("project"))
+            state["updated"] = datetime.now(timezone.utc).isoformat()
+
+            if action == "health_status":
+                state["health"] = detail
+            elif action in ("start", "restart", "unpause"):
+                state["status"] = "running"
+                # A container with a healthcheck starts again in the starting health status
+                if state["health"] != "unknown":
+                    state["health"] = "starting"
+            elif action in ("die", "stop", "kill"):
+                state["status"] = "exited"
+            elif action == "pause":
+                state["status"] = "paused"
+            elif action == "create":
+                state["status"] = "created"
+
+            self._publish(state, previous, name)
+
+    def _refresh(self, container_id):
+        try:
+            self.refresh(container_id)
+        except Exception as e:
+            # The container can be removed before the inspect, the next events keep the table updated
+            logger.debug(f'Health monitor could not inspect {container_id}: {e}')
+
+    def _publish(self, state, previous, name):
+        # Called with the lock held, only changes of health or status are transitions
+        health, status = (state["health"], state["status"]) if state is not None else (None, "removed")
+        previous_health, previous_status = (previous["health"], previous["status"]) \
+            if previous is not None else (None, None)
+
+        if (health, status) == (previous_health, previous_status):
+            return
+
+        transition = {
+            "name": name,
+            "health": health,
+            "status": status,
+            "previous_health": previous_health,
+            "previous_status": previous_status,
+            "at": datetime.now(timezone.utc).isoformat()
+        }
+
+        for subscriber in self.subscribers:
+            subscriber.publish(transition)
+
+    @staticmethod
+    def _state(container):
+        return {
+            "name": container["name"],
+            "health": container["health"],
+            "status": container["status"],
+            "project": container["labels"].get("com.docker.compose.project"),
+            "updated": datetime.now(timezone.utc).isoformat()
+        }
+
+    def _run(self):
+        backoff = self.backoff
+
+        while not self.stopped.is_set():
+            try:
+                # Subscribe from the moment before the inspect, the events received meanwhile are replayed
+                since = datetime.now(timezone.utc)
+                self.reconcile()
+                self.synced = True
+                backoff = self.backoff
+                logger.info(f'Health monitor synchronized with {len(self.containers)} containers')
+
+                for event in self.backend.events(since=since, filters={"type": "container"}):
+                    if self.stopped.is_set():
+                        break
+
+                    attributes = event["attributes"]
+                    self.apply(action=event["action"], name=attributes.get("name", event["id"]), attributes=attributes)
+
+                    if event["action"] in ("start", "restart"):
+                        self._refresh(event["id"])
+
+                logger.warning(f'Health monitor events stream finished, reconnecting')
+            except Exception as e:
+                logger.error(f'Health monitor events stream failed, reconnecting in {backoff} seconds: {e}')
+
+            self.synced = False
+            self.stopped.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
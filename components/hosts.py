@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from logging import getLogger
+from threading import Lock, Event, Thread
+from components.exceptions import NoHealthyHost
+from components.metrics import host_healthy, host_deployments
+
+logger = getLogger(__name__)
+
+
+class DockerHost:
+    """
+    Docker engine where deployments are placed. The compose commands of its deployments run against the host or
+    context, and their health is read with its own backend. Only the local engine has a health monitor, the
+    deployments of the other hosts are polled.
+    """
+    def __init__(self, name, backend, host=None, context=None, address=None, monitor=None, ports=None):
+        """
+        :param name: identifier of the host, reported in the deployments
+        :param backend: DockerBackend of the engine
+        :param host: docker engine endpoint (DOCKER_HOST), None for the local engine
+        :param context: docker context name, used instead of the host
+        :param address: address where the published ports of the host are reached, None for the probes host
+        :param monitor: HealthMonitor following the containers of the engine
+        :param ports: PortAllocator of the host ports, None to keep the published ports of the compose files
+        """
+        self.name = name
+        self.backend = backend
+        self.host = host
+        self.context = context
+        self.address = address
+        self.monitor = monitor
+        self.ports = ports
+        self.healthy = True
+        self.failures = 0
+        self.error = None
+        self.checked = None
+        self.memory = None
+        self.cpus = None
+        self.deployments = dict()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "host": self.host,
+            "context": self.context,
+            "address": self.address,
+            "healthy": self.healthy,
+            "failures": self.failures,
+            "error": self.error,
+            "checked": self.checked.isoformat() if self.checked is not None else None,
+            "memory": self.memory,
+            "cpus": self.cpus,
+            "deployments": sorted(self.deployments.keys())
+        }
+
+
+class HostPool:
+    """
+    Docker hosts of the service. A new deployment is placed on the healthy host with the lowest share of its
+    memory reserved by the footprints of the deployments it already runs, and stays there until it is released,
+    so every later operation over the deployment goes to the same engine.
+
+    The engines are checked every interval seconds. A host is not used for new deployments after failures
+    consecutive failed checks, and it is used again as soon as a check succeeds.
+    """
+    def __init__(self, hosts, footprints=None, interval=15, failures=3):
+        """
+        :param hosts: list of DockerHost, the first one is used when the load of the hosts is unknown
+        :param footprints: dict broker -> {"memory", "cpus"} expected for each broker
+        :param interval: seconds between health checks, 0 to check only on demand
+        :param failures: consecutive failed checks before a host is not used anymore
+        """
+        self.hosts = {host.name: host for host in hosts}
+        self.footprints = footprints or dict()
+        self.interval = interval
+        self.failures = failures
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+
+        for host in hosts:
+            host_healthy.labels(host=host.name).set(1)
+            host_deployments.labels(host=host.name).set(0)
+
+    def start(self):
+        self.check()
+
+        if self.interval > 0:
+            self.thread = Thread(target=self._run, name="host-pool", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def get(self, name):
+        return self.hosts.get(name)
+
+    def place(self, deployment_id, broker):
+        """
+        Select the host of a new deployment and reserve the footprint of the broker on it.
+
+        :return: the DockerHost
+        """
+        needed = self.footprints.get(broker, dict()).get("memory", 0)
+
+        with self.lock:
+            candidates = [host for host in self.hosts.values() if host.healthy]
+            if len(candidates) == 0:
+                raise NoHealthyHost(data=deployment_id)
+
+            # Stable order, the hosts of equal load are used in the configured order
+            host = min(candidates, key=lambda x: self._load(x, needed))
+            host.deployments[deployment_id] = needed
+            host_deployments.labels(host=host.name).set(len(host.deployments))
+
+        logger.debug(f'Deployment {deployment_id} ({broker}) placed on the host {host.name}')
+
+        return host
+
+    def assign(self, deployment_id, name, broker=None):
+        """
+        Register a deployment already running on a host, e.g. restored from a previous run of the service.
+
+        :return: the DockerHost, None if the host is not configured anymore
+        """
+        with self.lock:
+            host = self.hosts.get(name)
+            if host is not None:
+                host.deployments[deployment_id] = self.footprints.get(broker, dict()).get("memory", 0)
+                host_deployments.labels(host=host.name).set(len(host.deployments))
+
+        return host
+
+    def release(self, deployment_id):
+        with self.lock:
+            for host in self.hosts.values():
+                if host.deployments.pop(deployment_id, None) is not None:
+                    host_deployments.labels(host=host.name).set(len(host.deployments))
+
+    def owner(self, deployment_id):
+        with self.lock:
+            return next((host for host in self.hosts.values() if deployment_id in host.deployments), None)
+
+    def check(self):
+        """
+        Ask every engine for its resources in parallel and update the health of the hosts.
+        """
+        def task(host):
+            try:
+                return host, host.backend.info(), None
+            except Exception as e:
+                return host, None, e
+
+        with ThreadPoolExecutor(max_workers=len(self.hosts), thread_name_prefix="host-check") as executor:
+            results = list(executor.map(task, list(self.hosts.values())))
+
+        for host, info, error in results:
+            self.record(host, info=info, error=error)
+
+    def record(self, host, info=None, error=None):
+        """
+        Update the health of a host with the result of a check.
+        """
+        with self.lock:
+            host.checked = datetime.now()
+
+            if error is None:
+                if not host.healthy:
+                    logger.info(f'Docker host {host.name} is healthy again')
+
+                host.healthy, host.failures, host.error = True, 0, None
+                host.memory, host.cpus = info.get("memory"), info.get("cpus")
+            else:
+                host.failures += 1
+                host.error = str(error)
+
+                if host.healthy and host.failures >= self.failures:
+                    host.healthy = False
+                    logger.error(f'Docker host {host.name} is not used after {host.failures} failed checks: '
+                                 f'{error}')
+
+            host_healthy.labels(host=host.name).set(1 if host.healthy else 0)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "interval": self.interval,
+                "failures": self.failures,
+                "hosts": [host.to_dict() for host in self.hosts.values()]
+            }
+
+    @staticmethod
+    def _load(host, needed):
+        # Without the memory of the host the deployments are only counted
+        if not host.memory:
+            return len(host.deployments) + 1
+
+        return (sum(host.deployments.values()) + needed) / host.memory
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f'Docker host check failed: {e}')
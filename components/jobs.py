@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import datetime
+from enum import Enum
+from logging import getLogger
+from threading import Lock
+from uuid import uuid4
+from components.exceptions import UnknownJob
+from components.metrics import handled
+
+logger = getLogger(__name__)
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class Job:
+    def __init__(self, operation, broker, deployment=None):
+        self.id = uuid4().hex
+        self.operation = operation
+        self.broker = broker
+        self.deployment = deployment
+        self.status = JobStatus.PENDING
+        self.created = datetime.now()
+        self.started = None
+        self.finished = None
+        self.steps = list()
+        self.result = None
+        self.error = None
+
+    def step(self, name):
+        """
+        Record a progress step of the job, it is passed as callback to the Compose operations.
+
+        :param name: name of the step that is starting (e.g. "build", "up")
+        """
+        self.steps.append({"step": name, "at": datetime.now().isoformat()})
+
+    @property
+    def duration(self):
+        if self.started is None:
+            return None
+
+        end = self.finished if self.finished is not None else datetime.now()
+
+        return (end - self.started).total_seconds()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "operation": self.operation,
+            "broker": self.broker,
+            "deployment": self.deployment,
+            "status": self.status.value,
+            "created": self.created.isoformat(),
+            "started": self.started.isoformat() if self.started is not None else None,
+            "finished": self.finished.isoformat() if self.finished is not None else None,
+            "duration": self.duration,
+            "steps": self.steps,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobManager:
+    def __init__(self, workers=4, history=100):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compose-job")
+        self.history = history
+        self.jobs = OrderedDict()
+        self.lock = Lock()
+
+    def submit(self, operation, broker, function, *args, deployment=None, admission=None, on_reject=None, **kwargs):
+        """
+        Queue a blocking compose operation in the worker pool.
+
+        :param operation: name of the operation, e.g. "init" or "clean"
+        :param broker: context broker name the operation is applied to
+        :param function: callable executed in the worker, it receives the job as first argument
+        :param deployment: identifier of the deployment the operation is applied to
+        :param admission: callable receiving the on_admit and on_reject callbacks, e.g. AdmissionScheduler.request,
+                          the job stays queued until it is admitted and it is not registered if the call raises
+        :param on_reject: callable without arguments executed when the queued job is rejected later, e.g. to release
+                          the deployment created for it
+        :return: the created Job
+        """
+        job = Job(operation=operation, broker=broker, deployment=deployment)
+
+        def start():
+            if job.status == JobStatus.QUEUED:
+                job.status = JobStatus.PENDING
+                job.step("admitted")
+            self.executor.submit(self._run, job, function, *args, **kwargs)
+
+        if admission is not None:
+            job.status = JobStatus.QUEUED
+            admission(on_admit=start, on_reject=lambda reason: self._reject(job, reason, on_reject))
+
+        with self.lock:
+            self.jobs[job.id] = job
+            self._purge()
+
+        if admission is None:
+            start()
+
+        return job
+
+    def get(self, job_id):
+        try:
+            return self.jobs[job_id]
+        except KeyError:
+            raise UnknownJob(data=job_id)
+
+    def list(self):
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def shutdown(self, wait=False):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+    @staticmethod
+    def _run(job, function, *args, **kwargs):
+        job.status = JobStatus.RUNNING
+        job.started = datetime.now()
+
+        try:
+            job.result = function(job, *args, **kwargs)
+            job.status = JobStatus.SUCCEEDED
+        except Exception as e:
+            handled(e)
+            job.error = {"type": type(e).__name__, "message": str(e)}
+            job.status = JobStatus.FAILED
+            logger.error(f'Job {job.id} ({job.operation} {job.broker}) failed: {e}')
+        finally:
+            job.finished = datetime.now()
+
+    @staticmethod
+    def _reject(job, reason, on_reject=None):
+        job.error = {"type": "AdmissionRejected", "message": reason}
+        job.status = JobStatus.FAILED
+        job.finished = datetime.now()
+
+        if on_reject is not None:
+            try:
+                on_reject()
+            except Exception as e:
+                logger.error(f'Job {job.id} ({job.operation} {job.broker}) rejected, its clean up failed: {e}')
+
+    def _purge(self):
+        # Keep only the last finished jobs, pending and running jobs are never discarded
+        finished = [key for key, job in self.jobs.items() if job.finished is not None]
+
+        for key in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[key]
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from json import dumps, loads
+from pathlib import Path
+from sqlite3 import connect
+from threading import Lock
+from time import time
+
+schema = '''
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    at REAL NOT NULL,
+    deployment TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS journal_deployment ON journal (deployment);
+'''
+
+
+class DeploymentJournal:
+    """
+    Append-only journal of the deployments in a SQLite database: their creation with the compose project, host
+    and ports, the changes of their health, and their release. Every entry is committed on its own in WAL mode,
+    so an entry is either complete or absent after a crash of the service, and the readers never block it.
+
+    The deployments alive when the service stopped are those created and not released. The journal is
+    compacted when it is replayed, keeping only the creation and the last health of those deployments. The
+    identifier of a released deployment can be used again (the default deployment of a broker always is), so
+    each life cycle ends at its release and only the rows of the ended life cycles are removed.
+    """
+    def __init__(self, path="./deployments/journal.db"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = Lock()
+
+        # Autocommit, each statement is its own transaction
+        self.connection = connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(schema)
+
+    def created(self, deployment, aliases=None):
+        self._append(deployment.id, "created", {
+            "broker": deployment.broker,
+            "project": deployment.project,
+            "prefix": deployment.prefix,
+            "path": str(deployment.path) if deployment.path is not None else None,
+            "host": deployment.host,
+            "ports": deployment.ports,
+            "created": deployment.created.timestamp(),
+            "aliases": list(aliases or list())
+        })
+
+    def health(self, deployment_id, status):
+        self._append(deployment_id, "health", {"status": status})
+
+    def released(self, deployment_id):
+        self._append(deployment_id, "released", None)
+
+    def replay(self):
+        """
+        :return: dict deployment identifier -> creation data with the last known "health" and its "checked" time,
+                 for the deployments not released
+        """
+        with self.lock:
+            rows = self.connection.execute('SELECT at, deployment, kind, data FROM journal ORDER BY seq').fetchall()
+
+        deployments = dict()
+        for at, deployment_id, kind, data in rows:
+            if kind == "created":
+                deployments[deployment_id] = {**loads(data), "health": None, "checked": None}
+            elif kind == "health" and deployment_id in deployments:
+                deployments[deployment_id].update(health=loads(data)["status"], checked=at)
+            elif kind == "released":
+                deployments.pop(deployment_id, None)
+
+        return deployments
+
+    def compact(self):
+        """
+        Remove the entries of the ended life cycles, up to the last release of each deployment, and the superseded
+        creations and health changes of the current ones.
+
+        :return: number of entries removed
+        """
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute('BEGIN')
+            try:
+                cursor.execute("DELETE FROM journal WHERE seq <= (SELECT MAX(released.seq) FROM journal released "
+                               "WHERE released.deployment = journal.deployment AND released.kind = 'released')")
+                removed = cursor.rowcount
+                cursor.execute("DELETE FROM journal WHERE seq NOT IN "
+                               "(SELECT MAX(seq) FROM journal GROUP BY deployment, kind)")
+                removed += cursor.rowcount
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+
+        return removed
+
+    def stats(self):
+        with self.lock:
+            entries, = self.connection.execute('SELECT COUNT(*) FROM journal').fetchone()
+
+        return {"path": str(self.path), "entries": entries}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def _append(self, deployment_id, kind, data):
+        with self.lock:
+            self.connection.execute('INSERT INTO journal (at, deployment, kind, data) VALUES (?, ?, ?, ?)',
+                                    (time(), deployment_id, kind, dumps(data) if data is not None else None))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from threading import Lock, Event, Thread
+from components.deployments import label_deployment
+
+logger = getLogger(__name__)
+
+
+class LogCollector:
+    """
+    Last lines of the logs of every container of the deployments, kept in a ring buffer per container so that
+    they are available when a deployment fails, even if its containers were restarted since.
+
+    The logs are not followed: every interval seconds each container is asked for its lines since the last one
+    collected, with a tail of the buffer size. A chatty container (Kafka, JVM brokers) therefore costs at most
+    lines per interval, whatever it writes, and the memory is bounded by containers x lines x max_line.
+    """
+    def __init__(self, backends, lines=200, max_line=2048, interval=10, workers=4):
+        """
+        :param backends: dict docker host name -> DockerBackend whose labelled containers are collected
+        :param lines: lines kept per container
+        :param max_line: characters kept per line, the rest is cut
+        :param interval: seconds between collections, 0 to collect only on demand
+        :param workers: containers collected in parallel
+        """
+        self.backends = backends
+        self.lines = lines
+        self.max_line = max_line
+        self.interval = interval
+        self.workers = workers
+        self.buffers = dict()
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self):
+        if self.interval > 0:
+            self.thread = Thread(target=self._run, name="log-collector", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def collect(self):
+        """
+        Collect the new lines of every labelled container, the buffers of the containers gone are discarded.
+
+        :return: number of lines collected
+        """
+        containers, failed = list(), False
+        for host, backend in self.backends.items():
+            try:
+                found = backend.list_containers(all=True, filters={"label": label_deployment}, health=False)
+                containers += [(backend, x) for x in found]
+            except Exception as e:
+                logger.error(f'Log collector could not list the containers of the docker host {host}: {e}')
+                failed = True
+
+        # The buffers of an unreachable host are kept, its containers may still exist
+        if not failed:
+            names = {x["name"] for _, x in containers}
+            with self.lock:
+                for name in [x for x in self.buffers if x not in names]:
+                    del self.buffers[name]
+
+        if len(containers) == 0:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="log-collector") as executor:
+            return sum(executor.map(lambda x: self._collect(*x), containers))
+
+    def tail(self, name, lines=None):
+        """
+        :param name: container name
+        :param lines: number of last lines, by default the whole buffer
+        :return: list of {"time", "line"}, empty if the container logs were never collected
+        """
+        with self.lock:
+            buffer = self.buffers.get(name)
+            entries = list(buffer["lines"]) if buffer is not None else list()
+
+        entries = entries[-lines:] if lines else entries
+
+        return [{"time": at, "line": text} for at, text in entries]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "containers": len(self.buffers),
+                "lines": sum(len(x["lines"]) for x in self.buffers.values()),
+                "max_lines": self.lines,
+                "max_line": self.max_line,
+                "interval": self.interval
+            }
+
+    def _collect(self, backend, container):
+        name = container["name"]
+
+        with self.lock:
+            buffer = self.buffers.setdefault(name, {"since": None, "lines": deque(maxlen=self.lines)})
+            since = buffer["since"]
+
+        count = 0
+        stream = None
+        try:
+            stream = backend.container_logs(container["id"], tail=self.lines, since=since)
+            for at, text in stream:
+                # The since filter of the engine is inclusive, the last line kept is returned again
+                if at is not None and since is not None and at <= since:
+                    continue
+
+                with self.lock:
+                    buffer["lines"].append((at, text[:self.max_line]))
+                    buffer["since"] = at if at is not None else buffer["since"]
+                count += 1
+        except Exception as e:
+            logger.debug(f'Log collector could not read the logs of {name}: {e}')
+        finally:
+            if stream is not None:
+                stream.close()
+
+        return count
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.collect()
+            except Exception as e:
+                logger.error(f'Log collector failed: {e}')
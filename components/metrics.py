@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from contextlib import contextmanager
+from time import perf_counter
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# Docker and compose operations take from milliseconds (inspect) to minutes (build, up of Stellio)
+operation_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+request_duration = Histogram('brokercleaner_http_request_duration_seconds',
+                             'Latency of the HTTP requests per route',
+                             ['method', 'route', 'status'])
+
+docker_operation_duration = Histogram('brokercleaner_docker_operation_duration_seconds',
+                                      'Duration of the docker operations (build, up, down, ps, inspect, reset)',
+                                      ['operation', 'broker'],
+                                      buckets=operation_buckets)
+
+time_to_healthy = Histogram('brokercleaner_time_to_healthy_seconds',
+                            'Time from the start of the up until the deployment is reported healthy',
+                            ['broker'],
+                            buckets=operation_buckets)
+
+container_starting_duration = Histogram('brokercleaner_container_starting_seconds',
+                                        'Time the containers stay in the starting health status',
+                                        ['result'],
+                                        buckets=operation_buckets)
+
+exceptions_total = Counter('brokercleaner_exceptions_total',
+                           'Exceptions handled by the service per type',
+                           ['type'])
+
+operations_in_flight = Gauge('brokercleaner_operations_in_flight',
+                             'Docker operations currently running',
+                             ['operation'])
+
+swept_resources = Counter('brokercleaner_swept_resources_total',
+                          'Orphan containers, volumes and networks removed by the sweeper',
+                          ['type'])
+
+reclaimed_bytes = Counter('brokercleaner_reclaimed_bytes_total',
+                          'Bytes of volume space reclaimed by the sweeper')
+
+admission_queue_depth = Gauge('brokercleaner_admission_queue_depth',
+                              'Deployments waiting in the admission queue',
+                              ['host'])
+
+admission_wait = Histogram('brokercleaner_admission_wait_seconds',
+                           'Time the deployments wait in the admission queue',
+                           ['broker'],
+                           buckets=operation_buckets)
+
+admission_decisions = Counter('brokercleaner_admission_decisions_total',
+                              'Admission decisions of the scheduler',
+                              ['result'])
+
+host_healthy = Gauge('brokercleaner_host_healthy',
+                     'Docker hosts used for new deployments (1) or excluded after failed checks (0)',
+                     ['host'])
+
+host_deployments = Gauge('brokercleaner_host_deployments',
+                         'Deployments placed on each docker host',
+                         ['host'])
+
+image_pull_duration = Histogram('brokercleaner_image_pull_seconds',
+                                'Duration of the image pulls of the prefetcher',
+                                ['result'],
+                                buckets=operation_buckets)
+
+image_pull_bytes = Counter('brokercleaner_image_pull_bytes_total',
+                           'Bytes of image layers downloaded by the prefetcher')
+
+
+event_loop_lag = Histogram('brokercleaner_event_loop_lag_seconds',
+                           'Delay of the event loop wake ups, the time the loop was blocked',
+                           buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+
+event_loop_stalls = Counter('brokercleaner_event_loop_stalls_total',
+                            'Event loop blockings longer than the stall threshold')
+
+
+@contextmanager
+def track(operation, broker):
+    """
+    Measure a docker operation and count it as in flight while it runs, and record it in the trace of the
+    current request.
+    """
+    # The profiling module imports the metrics, it is imported once both are loaded
+    from components.profiling import span
+
+    operations_in_flight.labels(operation=operation).inc()
+    start = perf_counter()
+
+    try:
+        with span(f'compose-cli.{operation}'):
+            yield
+    finally:
+        docker_operation_duration.labels(operation=operation, broker=broker or "none").observe(perf_counter() - start)
+        operations_in_flight.labels(operation=operation).dec()
+
+
+class StartingTimeCollector:
+    """
+    Listener of the HealthMonitor transitions observing how long each container stays in starting.
+    """
+    def __init__(self):
+        self.starting = dict()
+
+    def publish(self, transition):
+        name = transition["name"]
+
+        if transition["health"] == "starting":
+            self.starting.setdefault(name, perf_counter())
+        elif name in self.starting:
+            elapsed = perf_counter() - self.starting.pop(name)
+            container_starting_duration.labels(result=transition["health"] or "removed").observe(elapsed)
+
+
+def handled(exception):
+    """
+    Count an exception where it is handled, e.g. turned into an error response or a failed job.
+    """
+    exceptions_total.labels(type=type(exception).__name__).inc()
+
+
+def export():
+    """
+    :return: the metrics in the Prometheus text format and its content type
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from socket import socket, AF_INET, SOCK_STREAM
+from threading import Lock
+from components.exceptions import NoFreePort
+
+
+class PortAllocator:
+    """
+    Host ports for the deployments whose published ports are remapped, so several brokers publishing the same
+    ports (1026, 27017, 5432...) run at the same time. A port is handed out once until it is released, and only
+    if nothing is listening on it. The range is kept out of the ephemeral range of the host, whose ports can be
+    taken at any moment by outgoing connections.
+
+    A port is known to be free by binding it, which only works for the docker host running the service. The
+    allocator of a remote docker host is created without check and only keeps track of the ports handed out.
+    """
+    def __init__(self, host="0.0.0.0", start=20000, end=29999, check=True):
+        self.host = host
+        self.check = check
+        self.start = start
+        self.end = end
+        self.next = start
+        self.allocated = set()
+        self.lock = Lock()
+
+    def allocate(self):
+        """
+        :return: a free host port
+        """
+        with self.lock:
+            for _ in range(self.end - self.start + 1):
+                port = self.next
+                self.next = self.start if port >= self.end else port + 1
+
+                if port not in self.allocated and self._free(port):
+                    self.allocated.add(port)
+                    return port
+
+        raise NoFreePort(data=f'{self.start}-{self.end}', message=f'No free port between {self.start} and {self.end}')
+
+    def reserve(self, ports):
+        """
+        Mark as allocated the ports of the deployments restored after a restart.
+        """
+        with self.lock:
+            self.allocated.update(ports)
+
+    def release(self, ports):
+        with self.lock:
+            self.allocated.difference_update(ports)
+
+    def _free(self, port):
+        if not self.check:
+            return True
+
+        with socket(AF_INET, SOCK_STREAM) as probe:
+            try:
+                probe.bind((self.host, port))
+                return True
+            except OSError:
+                return False
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from logging import getLogger
+from threading import RLock, Event, Thread
+from time import perf_counter
+from components.exceptions import UnknownBroker
+from components.metrics import image_pull_duration, image_pull_bytes
+
+logger = getLogger(__name__)
+
+
+class ImagePrefetcher:
+    """
+    Pull in the background the images of the compose files of every broker, so that the up of the first
+    deployment after a tag change in the .env file does not pull them one service after another. The images
+    shared by several brokers (e.g. mongo for Lepus and Orion-LD) are pulled once per docker host, and a pull
+    already running is joined instead of started again. Only workers pulls run at the same time.
+
+    The images present in the engine are not pulled again unless forced, therefore a periodic prefetch only costs
+    an inspect per image and host until the .env file changes.
+    """
+    def __init__(self, compose, hosts, workers=4, interval=600, on_start=True):
+        """
+        :param compose: Compose with the compose files of the brokers
+        :param hosts: HostPool, the images are pulled on its healthy hosts
+        :param workers: images pulled in parallel
+        :param interval: seconds between background prefetches, 0 to prefetch only on demand
+        :param on_start: prefetch once when the service starts
+        """
+        self.compose = compose
+        self.hosts = hosts
+        self.workers = workers
+        self.interval = interval
+        self.on_start = on_start
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-prefetch")
+        self.entries = dict()
+        self.pending = dict()
+        self.last = None
+        self.lock = RLock()
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self):
+        if self.on_start or self.interval > 0:
+            self.thread = Thread(target=self._run, name="image-prefetcher", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def images(self, brokers=None):
+        """
+        :param brokers: context broker names, by default all of them
+        :return: dict image -> brokers using it, the images built by the compose files are skipped
+        """
+        images = dict()
+
+        for broker in brokers or self.compose.brokers.keys():
+            if broker not in self.compose.brokers:
+                raise UnknownBroker(data=broker,
+                                    message=f'Unknown Context Broker name. Valid values: {self.compose.brokers.keys()}')
+
+            files = self.compose.brokers[broker]
+            if len(files) == 0:
+                continue
+
+            try:
+                model = self.compose.models.get(files=files, env_file=self.compose.env_file)
+            except Exception as e:
+                logger.error(f'Image prefetch could not read the compose files of {broker}: {e}')
+                continue
+
+            for service in model.services.values():
+                if service.image is not None and service.build is None:
+                    images.setdefault(service.image, set()).add(broker)
+
+        return {image: sorted(users) for image, users in sorted(images.items())}
+
+    def prefetch(self, brokers=None, force=False, progress=None):
+        """
+        Pull the images of the brokers on every healthy host and wait until all of them are available.
+
+        :param brokers: context broker names, by default all of them
+        :param force: pull the images even if the engine already has them, e.g. to update a moving tag
+        :param progress: callable receiving a message each time an image is available or failed
+        :return: report with the result of each image and host
+        """
+        images = self.images(brokers)
+        hosts = [host for host in self.hosts.hosts.values() if host.healthy]
+        started, start = datetime.now(), perf_counter()
+
+        futures = list()
+        with self.lock:
+            for host in hosts:
+                for image, users in images.items():
+                    key = (host.name, image)
+
+                    future = self.pending.get(key)
+                    if future is None:
+                        future = self.executor.submit(self._pull, host, image, users, force)
+                        self.pending[key] = future
+                        future.add_done_callback(lambda x, key=key: self._done(key, x))
+                    futures.append(future)
+
+        results = list()
+        for future in as_completed(futures):
+            entry = future.result()
+            results.append(entry)
+
+            if progress is not None:
+                progress(f'{entry["status"]} {entry["image"]} on {entry["host"]}')
+
+        report = {
+            "started": started.isoformat(),
+            "hosts": [host.name for host in hosts],
+            "references": sum(len(users) for users in images.values()),
+            "images": len(images),
+            "pulled": sum(1 for x in results if x["status"] == "pulled"),
+            "present": sum(1 for x in results if x["status"] == "present"),
+            "failed": sum(1 for x in results if x["status"] == "failed"),
+            "bytes": sum(x.get("bytes") or 0 for x in results),
+            "wall_time": perf_counter() - start,
+            "sequential_time": sum(x["seconds"] for x in results)
+        }
+
+        with self.lock:
+            self.last = report
+
+        logger.info(f'Image prefetch of {report["images"]} images on {len(hosts)} hosts: {report["pulled"]} pulled, '
+                    f'{report["failed"]} failed in {report["wall_time"]:.1f}s')
+
+        return {**report, "results": sorted(results, key=lambda x: (x["image"], x["host"]))}
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "interval": self.interval,
+                "running": len(self.pending),
+                "last": self.last,
+                "images": [self.entries[key] for key in sorted(self.entries)]
+            }
+
+    def _pull(self, host, image, users, force):
+        key, start = (host.name, image), perf_counter()
+        entry = {"image": image, "host": host.name, "brokers": users}
+
+        try:
+            present = None if force else host.backend.inspect_image(image)
+
+            if present is not None:
+                entry.update(status="present", id=present["id"], size=present["size"], bytes=0,
+                             seconds=perf_counter() - start)
+
+                # The time and bytes of the last pull are kept while the image does not change
+                with self.lock:
+                    previous = self.entries.get(key)
+                if previous is not None and previous.get("id") == present["id"] and "pull" in previous:
+                    entry["pull"] = previous["pull"]
+            else:
+                downloaded = host.backend.pull_image(image)
+                seconds = perf_counter() - start
+                pulled = host.backend.inspect_image(image) or dict()
+
+                entry.update(status="pulled", id=pulled.get("id"), size=pulled.get("size"), bytes=downloaded,
+                             seconds=seconds)
+                entry["pull"] = {"seconds": seconds, "bytes": downloaded, "at": datetime.now().isoformat()}
+
+                image_pull_duration.labels(result="pulled").observe(seconds)
+                if downloaded:
+                    image_pull_bytes.inc(downloaded)
+
+                logger.info(f'Image {image} pulled on the host {host.name} in {seconds:.1f}s, '
+                            f'{downloaded if downloaded is not None else "unknown"} bytes downloaded')
+        except Exception as e:
+            entry.update(status="failed", error=str(e), seconds=perf_counter() - start)
+            image_pull_duration.labels(result="failed").observe(entry["seconds"])
+            logger.error(f'Image {image} could not be pulled on the host {host.name}: {e}')
+
+        entry["checked"] = datetime.now().isoformat()
+
+        with self.lock:
+            self.entries[key] = entry
+
+        return entry
+
+    def _done(self, key, future):
+        # Called in the submitting thread if the pull already ended, the lock is reentrant
+        with self.lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+
+    def _run(self):
+        run = self.on_start
+
+        while not self.stopped.is_set():
+            if run:
+                try:
+                    self.prefetch()
+                except Exception as e:
+                    logger.error(f'Image prefetch failed: {e}')
+
+            if self.interval <= 0 or self.stopped.wait(self.interval):
+                return
+            run = True
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from asyncio import gather
+from time import perf_counter
+from httpx import AsyncClient, Limits, HTTPError
+
+
+class HttpProbe:
+    """
+    Active readiness check of a broker: a GET to one of its NGSI-LD endpoints through the published port.
+    """
+    def __init__(self, service, path, target=None, expected=(200,)):
+        """
+        :param service: compose service answering the request
+        :param path: path requested
+        :param target: container port, None to use the first published port of the service
+        :param expected: status codes meaning the broker is ready
+        """
+        self.service = service
+        self.path = path
+        self.target = target
+        self.expected = expected
+
+    def url(self, model, host):
+        service = model.services.get(self.service)
+        ports = service.published_ports() if service is not None else list()
+        ports = [published for published, target in ports if self.target is None or target == self.target]
+
+        return f'http://{host}:{ports[0]}{self.path}' if ports else None
+
+    async def run(self, client, model, host):
+        url = self.url(model, host)
+        result = {"service": self.service, "url": url, "ready": False}
+
+        if url is None:
+            result["error"] = "No published port"
+            return result
+
+        start = perf_counter()
+        try:
+            response = await client.get(url)
+            result["status_code"] = response.status_code
+            result["ready"] = response.status_code in self.expected
+        except HTTPError as e:
+            result["error"] = f'{type(e).__name__}: {e}'
+
+        result["latency_ms"] = round((perf_counter() - start) * 1000, 3)
+
+        return result
+
+
+readiness_probes = {
+    "Lepus": [HttpProbe(service="lepus", path="/ngsi-ld/v1/types")],
+    "Orion-LD": [HttpProbe(service="orion", path="/ngsi-ld/v1/types")],
+    "Stellio": [HttpProbe(service="stellio-api-gateway", path="/ngsi-ld/v1/types", target=8080)],
+    "Scorpio": [HttpProbe(service="scorpio", path="/ngsi-ld/v1/types", target=9090)],
+    "YANB": [HttpProbe(service="yanb", path="/ngsi-ld/v1/types")],
+}
+
+
+class ReadinessProber:
+    """
+    Run the readiness probes of the brokers concurrently with a shared keep-alive connection pool.
+    """
+    def __init__(self, host="localhost", timeout=2, max_connections=50, initial_backoff=0.05, max_backoff=1):
+        self.host = host
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.client = AsyncClient(timeout=timeout,
+                                  limits=Limits(max_connections=max_connections,
+                                                max_keepalive_connections=max_connections))
+
+    def supports(self, broker):
+        return broker in readiness_probes
+
+    async def probe(self, engine):
+        """
+        :param engine: Compose session of the deployment
+        :return: dict with the overall readiness and the result of each probe
+        """
+        model = engine.model
+        probes = readiness_probes.get(engine.broker, list())
+
+        # The published ports of a deployment placed on a remote docker host are reached at its address
+        host = engine.host.address if engine.host is not None and engine.host.address else self.host
+        results = await gather(*[x.run(self.client, model, host) for x in probes])
+
+        return {"ready": len(results) > 0 and all(x["ready"] for x in results), "probes": list(results)}
+
+    def backoff(self, attempt):
+        """
+        Delay before the next probe, it grows from initial_backoff up to max_backoff.
+        """
+        return min(self.initial_backoff * (2 ** attempt), self.max_backoff)
+
+    async def close(self):
+        await self.client.aclose()
@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from asyncio import get_running_loop, sleep
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from inspect import isfunction, isgeneratorfunction
+from logging import getLogger
+from sys import _current_frames
+from threading import Lock, Event, Thread, get_ident, current_thread, enumerate as threads
+from time import perf_counter
+from traceback import extract_stack
+from uuid import uuid4
+from components.exceptions import UnknownTrace
+from components.metrics import event_loop_lag, event_loop_stalls
+
+logger = getLogger(__name__)
+
+# Trace of the HTTP request being served, copied to the threadpool by run_in_threadpool
+current_trace = ContextVar("current_trace", default=None)
+span_depth = ContextVar("span_depth", default=0)
+
+# Modules where a thread waits without doing any work, those samples are not reported
+idle_modules = ("threading", "queue", "selectors", "concurrent.futures.thread", "asyncio.base_events")
+
+# Name of the threads of the threadpool where starlette runs the sync handlers and run_in_threadpool
+threadpool_prefix = "AnyIO worker"
+
+
+class RequestTrace:
+    """
+    Timing spans of the Compose operations and docker calls made while serving an HTTP request, whether they run
+    in the event loop or in the threadpool.
+    """
+    def __init__(self, method, path, max_spans=500):
+        self.id = uuid4().hex
+        self.method = method
+        self.path = path
+        self.route = None
+        self.status = None
+        self.started = datetime.now()
+        self.start = perf_counter()
+        self.duration = None
+        self.max_spans = max_spans
+        self.spans = list()
+        self.dropped = 0
+        self.profile = None
+        self.lock = Lock()
+
+        # Threads working for the request, sampled when the request is profiled
+        self.loop_thread = get_ident()
+        self.workers = dict()
+
+    def enter(self):
+        with self.lock:
+            ident = get_ident()
+            self.workers[ident] = self.workers.get(ident, 0) + 1
+
+    def leave(self, name, start, duration, depth, error):
+        with self.lock:
+            ident = get_ident()
+            self.workers[ident] -= 1
+            if self.workers[ident] == 0:
+                del self.workers[ident]
+
+            if len(self.spans) >= self.max_spans:
+                self.dropped += 1
+                return
+
+            self.spans.append({"name": name, "start": start - self.start, "duration": duration, "depth": depth,
+                               "thread": current_thread().name, "error": error})
+
+    def threads(self):
+        """
+        :return: identifiers of the event loop thread, of the threads running spans of the request, and of the
+                 threadpool threads running the sync handlers, which may also serve other requests
+        """
+        with self.lock:
+            working = set(self.workers.keys())
+
+        return {self.loop_thread, *working, *(x.ident for x in threads() if x.name.startswith(threadpool_prefix))}
+
+    def finish(self, status, route=None):
+        self.status = status
+        self.route = route
+        self.duration = perf_counter() - self.start
+
+    def to_dict(self, spans=False):
+        result = {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started": self.started.isoformat(),
+            "duration": self.duration if self.duration is not None else perf_counter() - self.start,
+            "spans": len(self.spans),
+            "profiled": self.profile is not None
+        }
+
+        if spans:
+            with self.lock:
+                result.update(spans=sorted(self.spans, key=lambda x: x["start"]), dropped=self.dropped,
+                              profile=self.profile)
+
+        return result
+
+
+@contextmanager
+def span(name):
+    """
+    Record the duration of the enclosed block in the trace of the current request, nothing without a request.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    depth = span_depth.get()
+    token = span_depth.set(depth + 1)
+    error = None
+    trace.enter()
+    start = perf_counter()
+
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        trace.leave(name, start, perf_counter() - start, depth, error)
+        span_depth.reset(token)
+
+
+def instrument(prefix):
+    """
+    Class decorator recording a span around every public method of the class, named prefix.method. Generator
+    methods, properties and static methods are left as they are.
+    """
+    def decorator(cls):
+        for name, member in list(vars(cls).items()):
+            if name.startswith('_') or not isfunction(member) or isgeneratorfunction(member):
+                continue
+
+            setattr(cls, name, traced(f'{prefix}.{name}', member))
+
+        return cls
+
+    return decorator
+
+
+def traced(name, function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        # Checked before entering the context manager, the calls outside of a request pay only the lookup
+        if current_trace.get() is None:
+            return function(*args, **kwargs)
+
+        with span(name):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+class TraceRecorder:
+    """
+    Traces of the last HTTP requests, and separately of the last ones slower than slow seconds, so that a stall
+    is still found after many fast requests.
+    """
+    def __init__(self, max_traces=200, slow=1.0, max_spans=500):
+        """
+        :param max_traces: traces kept of the last requests and of the last slow requests
+        :param slow: seconds from which a request is kept as slow
+        :param max_spans: spans kept per trace, e.g. the polling of /wait, the next ones are only counted
+        """
+        self.slow = slow
+        self.max_spans = max_spans
+        self.recent = deque(maxlen=max_traces)
+        self.slowest = deque(maxlen=max_traces)
+        self.active = dict()
+        self.lock = Lock()
+
+    def begin(self, method, path):
+        trace = RequestTrace(method, path, max_spans=self.max_spans)
+
+        with self.lock:
+            self.active[trace.id] = trace
+
+        return trace
+
+    def end(self, trace, status, route=None):
+        trace.finish(status, route)
+
+        with self.lock:
+            self.active.pop(trace.id, None)
+            self.recent.append(trace)
+            if trace.duration >= self.slow:
+                self.slowest.append(trace)
+
+    def in_flight(self):
+        with self.lock:
+            return [trace.to_dict() for trace in self.active.values()]
+
+    def get(self, trace_id):
+        with self.lock:
+            trace = self.active.get(trace_id) or next((x for x in list(self.recent) + list(self.slowest)
+                                                       if x.id == trace_id), None)
+
+        if trace is None:
+            raise UnknownTrace(data=trace_id)
+
+        return trace.to_dict(spans=True)
+
+    def list(self):
+        with self.lock:
+            recent, slowest = list(self.recent), list(self.slowest)
+
+        return {
+            "slow": self.slow,
+            "in_flight": self.in_flight(),
+            "recent": [trace.to_dict() for trace in reversed(recent)],
+            "slow_requests": [trace.to_dict() for trace in sorted(slowest, key=lambda x: x.duration, reverse=True)]
+        }
+
+
+class LoopLagMonitor:
+    """
+    Measure how late the event loop wakes up from a sleep of interval seconds. A wake up later than threshold
+    seconds is a stall, e.g. a blocking docker call made from an async handler, and it is recorded with the
+    requests in flight and the stack of the event loop thread.
+
+    The stack is taken by a watchdog thread while the loop is still blocked, the loop itself can only report
+    the stall once it is over.
+    """
+    def __init__(self, threshold=0.25, interval=0.05, max_stalls=100, recorder=None, limit=40):
+        """
+        :param threshold: seconds of lag from which the loop is considered stalled
+        :param interval: seconds between two measures of the lag
+        :param max_stalls: last stalls kept
+        :param recorder: TraceRecorder with the requests in flight
+        :param limit: frames kept of the blocking stack, the innermost ones
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.recorder = recorder
+        self.limit = limit
+        self.stalls = deque(maxlen=max_stalls)
+        self.total = 0
+        self.max_lag = 0.0
+        self.beat = None
+        self.blocked = None
+        self.loop_thread = None
+        self.task = None
+        self.stopped = Event()
+        self.lock = Lock()
+
+    def start(self):
+        """
+        Start measuring the lag of the running event loop, it must be called from the loop thread.
+        """
+        self.loop_thread = get_ident()
+        self.beat = perf_counter()
+        self.task = get_running_loop().create_task(self._measure())
+
+        Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.task is not None:
+            self.task.cancel()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "threshold": self.threshold,
+                "interval": self.interval,
+                "max_lag": self.max_lag,
+                "stalls_total": self.total,
+                "stalls": list(reversed(self.stalls))
+            }
+
+    async def _measure(self):
+        while not self.stopped.is_set():
+            beat = perf_counter()
+            self.beat = beat
+            await sleep(self.interval)
+
+            lag = max(0.0, perf_counter() - beat - self.interval)
+            event_loop_lag.observe(lag)
+
+            with self.lock:
+                self.max_lag = max(self.max_lag, lag)
+                if lag < self.threshold:
+                    continue
+
+                # The watchdog only knows the stack if the loop stayed blocked during one of its checks
+                blocked = self.blocked if self.blocked is not None and self.blocked["beat"] == beat else dict()
+                self.blocked = None
+                self.total += 1
+                self.stalls.append({
+                    "at": datetime.now().isoformat(),
+                    "lag": lag,
+                    "requests": blocked.get("requests", list()),
+                    "stack": blocked.get("stack")
+                })
+
+            event_loop_stalls.inc()
+            logger.warning(f'Event loop blocked during {lag:.3f}s')
+
+    def _watch(self):
+        while not self.stopped.wait(self.threshold / 2):
+            beat = self.beat
+            if perf_counter() - beat - self.interval < self.threshold:
+                continue
+
+            with self.lock:
+                if self.blocked is not None and self.blocked["beat"] == beat:
+                    continue
+
+            frame = _current_frames().get(self.loop_thread)
+            blocked = {
+                "beat": beat,
+                "stack": format_frames(frame, self.limit) if frame is not None else None,
+                "requests": self.recorder.in_flight() if self.recorder is not None else list()
+            }
+
+            with self.lock:
+                self.blocked = blocked
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler reading the stacks of the selected threads every interval seconds, without tracing
+    every call as cProfile does, so it can run in production. The stacks are aggregated in the folded format
+    of the flame graph tools, one line per distinct stack with the thread name as root frame.
+    """
+    def __init__(self, interval=0.005, threads=None, top=50):
+        """
+        :param interval: seconds between two samples
+        :param threads: callable returning the identifiers of the threads to sample, None for all of them
+        :param top: stacks reported, the most sampled ones
+        """
+        self.interval = interval
+        self.selector = threads
+        self.top = top
+        self.stacks = dict()
+        self.samples = 0
+        self.started = None
+        self.duration = None
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self):
+        self.started = perf_counter()
+        self.thread = Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        """
+        :return: the report of the profile
+        """
+        self.stopped.set()
+        self.thread.join()
+        self.duration = perf_counter() - self.started
+
+        return self.report()
+
+    def report(self):
+        stacks = sorted(self.stacks.items(), key=lambda x: x[1], reverse=True)
+
+        return {
+            "interval": self.interval,
+            "duration": self.duration,
+            "samples": self.samples,
+            "stacks": [{"stack": stack, "count": count} for stack, count in stacks[:self.top]],
+            "discarded": sum(count for _, count in stacks[self.top:])
+        }
+
+    def _run(self):
+        own = get_ident()
+
+        while not self.stopped.wait(self.interval):
+            selected = self.selector() if self.selector is not None else None
+            names = {thread.ident: thread.name for thread in threads()}
+            self.samples += 1
+
+            for ident, frame in _current_frames().items():
+                if ident == own or (selected is not None and ident not in selected):
+                    continue
+                if frame.f_globals.get("__name__") in idle_modules:
+                    continue
+
+                frames = list()
+                while frame is not None:
+                    frames.append(f'{frame.f_globals.get("__name__", "?")}.{frame.f_code.co_qualname}')
+                    frame = frame.f_back
+
+                stack = ';'.join([names.get(ident, str(ident))] + frames[::-1])
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+
+def format_frames(frame, limit):
+    """
+    :return: the innermost limit frames of the stack as "file:line in function: code"
+    """
+    return [f'{x.filename}:{x.lineno} in {x.name}: {x.line}' for x in extract_stack(frame)[-limit:]]
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from abc import ABC, abstractmethod
+from re import escape
+
+
+class ComposeExecutor:
+    """
+    Execute the commands of the reset drivers inside the services of a deployment. Any object with the same
+    execute and restart methods can replace it, e.g. to point the drivers at local stand-in databases.
+    """
+    def __init__(self, docker):
+        self.docker = docker
+
+    def execute(self, service, command):
+        return self.docker.compose.execute(service, command, tty=False)
+
+    def restart(self, service):
+        self.docker.compose.restart([service])
+
+
+class ResetDriver(ABC):
+    """
+    Wipe the state of one service of a deployment while its container keeps running.
+    """
+    def __init__(self, service):
+        self.service = service
+
+    @abstractmethod
+    def reset(self, executor, environment):
+        """
+        :param executor: ComposeExecutor, or any object with the same methods, running the commands in the service
+        :param environment: variables of the deployment, used to resolve the ${VARIABLE} values of the driver
+        :return: output of the commands
+        """
+
+    def to_dict(self):
+        return {"driver": type(self).__name__, "service": self.service}
+
+
+class MongoReset(ResetDriver):
+    system_databases = ['admin', 'config', 'local']
+
+    script = ("db.getMongo().getDBNames()"
+              ".filter(function (name) {{ return {system}.indexOf(name) < 0; }})"
+              ".forEach(function (name) {{ db.getSiblingDB(name).dropDatabase(); }})")
+
+    def reset(self, executor, environment):
+        script = self.script.format(system=self.system_databases)
+
+        # Recent mongo images only provide mongosh, the old ones only the legacy mongo shell
+        command = f'mongosh --quiet --eval "{script}" 2>/dev/null || mongo --quiet --eval "{script}"'
+
+        return executor.execute(self.service, ["sh", "-c", command])
+
+
+class PostgresReset(ResetDriver):
+    sql = ("DO $$ DECLARE r record; BEGIN "
+           "FOR r IN SELECT schemaname, tablename FROM pg_tables "
+           "WHERE schemaname NOT IN ('pg_catalog', 'information_schema', 'tiger', 'tiger_data', 'topology') "
+           "AND schemaname NOT LIKE '%timescaledb%' "
+           "AND tablename NOT IN ('flyway_schema_history', 'spatial_ref_sys') "
+           "LOOP EXECUTE format('TRUNCATE TABLE %I.%I CASCADE', r.schemaname, r.tablename); END LOOP; END $$;")
+
+    def __init__(self, service, user, databases):
+        """
+        :param service: compose service of the postgres database
+        :param user: user name or ${VARIABLE} resolved from the environment of the deployment
+        :param databases: database names or ${VARIABLE} resolved from the environment of the deployment
+        """
+        super().__init__(service=service)
+        self.user = user
+        self.databases = databases
+
+    def reset(self, executor, environment):
+        user = resolve(self.user, environment)
+        output = list()
+
+        # The schema and the migrations history are kept, only the rows are removed
+        for database in [resolve(x, environment) for x in self.databases]:
+            command = ["psql", "-U", user, "-d", database, "-v", "ON_ERROR_STOP=1", "-c", self.sql]
+            output.append(executor.execute(self.service, command))
+
+        return '\n'.join(x for x in output if x)
+
+    def to_dict(self):
+        return {**super().to_dict(), "databases": self.databases}
+
+
+class KafkaReset(ResetDriver):
+    def __init__(self, service, bootstrap_server="localhost:29092"):
+        super().__init__(service=service)
+        self.bootstrap_server = bootstrap_server
+
+    def reset(self, executor, environment):
+        topics = executor.execute(self.service, ["kafka-topics", "--bootstrap-server", self.bootstrap_server, "--list"])
+        topics = [x.strip() for x in (topics or '').splitlines() if x.strip() and not x.startswith('__')]
+
+        if len(topics) == 0:
+            return ''
+
+        # A single delete with a regular expression, every kafka-topics call starts a new JVM
+        pattern = '|'.join(escape(x) for x in topics)
+
+        return executor.execute(self.service, ["kafka-topics", "--bootstrap-server", self.bootstrap_server,
+                                               "--delete", "--topic", pattern])
+
+
+class RestartReset(ResetDriver):
+    """
+    For brokers keeping the state in memory, the state is lost restarting the container.
+    """
+    def reset(self, executor, environment):
+        executor.restart(self.service)
+
+        return ''
+
+
+reset_drivers = {
+    "Lepus": [MongoReset(service="mongo-for-orion-v2")],
+    "Orion-LD": [MongoReset(service="mongo-db")],
+    "Stellio": [
+        KafkaReset(service="stellio-kafka"),
+        PostgresReset(service="stellio-postgres",
+                      user="${POSTGRES_USER}",
+                      databases=["${STELLIO_SEARCH_DB_DATABASE}", "${STELLIO_SUBSCRIPTION_DB_DATABASE}"])
+    ],
+    "Scorpio": [PostgresReset(service="scorpio-postgres", user="ngb", databases=["ngb"])],
+    "YANB": [RestartReset(service="yanb")],
+}
+
+
+def resolve(value, environment):
+    if value.startswith('${') and value.endswith('}'):
+        return environment.get(value[2:-1], '')
+
+    return value
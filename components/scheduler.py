@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from concurrent.futures import ThreadPoolExecutor
+from json import load, dump
+from logging import getLogger
+from pathlib import Path
+from threading import Lock, Event, Thread
+from time import monotonic
+from components.deployments import label_deployment
+from components.exceptions import AdmissionRejected
+from components.metrics import admission_queue_depth, admission_wait, admission_decisions
+
+logger = getLogger(__name__)
+
+
+class Ticket:
+    """
+    Request of a deployment to run on the host, it reserves the footprint of the broker once admitted.
+    """
+    def __init__(self, deployment, broker, footprint, priority=0, on_admit=None, on_reject=None):
+        self.deployment = deployment
+        self.broker = broker
+        self.footprint = footprint
+        self.priority = priority
+        self.on_admit = on_admit
+        self.on_reject = on_reject
+        self.status = "queued"
+        self.created = monotonic()
+        self.admitted = None
+        self.peak = {"memory": 0, "cpus": 0.0}
+        self.admitted_event = Event()
+
+    @property
+    def wait(self):
+        return (self.admitted if self.admitted is not None else monotonic()) - self.created
+
+    @property
+    def reserved(self):
+        # Once the deployment runs, a usage above the expected footprint is reserved too
+        return {key: max(self.footprint[key], self.peak[key]) for key in ("memory", "cpus")}
+
+    def to_dict(self):
+        return {
+            "deployment": self.deployment,
+            "broker": self.broker,
+            "status": self.status,
+            "priority": self.priority,
+            "footprint": self.footprint,
+            "peak": self.peak,
+            "wait": round(self.wait, 3)
+        }
+
+
+class AdmissionScheduler:
+    """
+    Admission control of the deployments against the cpus and memory of the docker host. Each broker has an
+    expected footprint, declared in Compose.footprints and replaced by the peak usage learned from previous
+    deployments. A deployment is admitted when its footprint fits in the capacity not reserved by the admitted
+    deployments, otherwise it waits in the queue, or it is rejected when it can never fit or the queue is full.
+
+    The queue is ordered by priority, and the priority of a request grows with the time it waits (one level every
+    aging seconds), so the requests of low priority are not starved. Only the head of the queue is admitted, a
+    big deployment is not overtaken indefinitely by smaller ones.
+    """
+    def __init__(self, backend, footprints, path="./deployments/footprints.json", reserve=0.1, cpu_overcommit=1.0,
+                 max_queue=20, max_wait=1800, aging=60, interval=15, alpha=0.5, workers=4, name="local"):
+        """
+        :param backend: DockerBackend giving the host resources and the usage of the containers
+        :param footprints: dict broker -> declared footprint {"memory": bytes, "cpus": cores}
+        :param path: file where the learned footprints are kept between restarts
+        :param reserve: ratio of the host memory kept free for the service and the system
+        :param cpu_overcommit: ratio of the host cpus that can be reserved, the brokers mostly idle once started
+        :param max_queue: maximum number of queued requests, the next ones are rejected
+        :param max_wait: seconds a request waits in the queue before it is rejected
+        :param aging: seconds of wait that increase the priority of a queued request in one
+        :param interval: seconds between samples of the usage of the admitted deployments
+        :param alpha: weight of the last peak in the learned footprint of a broker
+        :param workers: containers sampled in parallel
+        :param name: name of the docker host, used in the thread name and the metrics
+        """
+        self.name = name
+        self.backend = backend
+        self.declared = footprints
+        self.path = Path(path)
+        self.reserve = reserve
+        self.cpu_overcommit = cpu_overcommit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.aging = aging
+        self.interval = interval
+        self.alpha = alpha
+        self.workers = workers
+        self.host = None
+        self.queue = list()
+        self.admitted = dict()
+        self.waits = dict()
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+
+        try:
+            with open(self.path) as file:
+                self.learned = load(file)
+        except (FileNotFoundError, ValueError):
+            self.learned = dict()
+
+    def start(self):
+        self.thread = Thread(target=self._run, name=f'admission-scheduler-{self.name}', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+        with self.lock:
+            queued, self.queue = self.queue, list()
+
+        for ticket in queued:
+            self._reject(ticket, "The service is stopping")
+
+    def footprint(self, broker):
+        """
+        :return: expected footprint of the broker, the learned one when it was already deployed
+        """
+        declared = self.declared.get(broker) or {"memory": 0, "cpus": 0.0}
+        learned = self.learned.get(broker)
+
+        if learned is None:
+            return {"memory": declared["memory"], "cpus": declared["cpus"], "source": "declared"}
+
+        # A resource never observed in the samples keeps the declared value
+        return {key: learned[key] or declared[key] for key in ("memory", "cpus")} | {"source": "learned"}
+
+    def capacity(self):
+        """
+        :return: memory and cpus of the host that can be reserved, None if the host resources are unknown
+        """
+        if self.host is None:
+            try:
+                self.host = self.backend.info()
+            except Exception as e:
+                logger.error(f'Admission scheduler could not read the host resources: {e}')
+                return None
+
+        return {"memory": self.host["memory"] * (1 - self.reserve), "cpus": self.host["cpus"] * self.cpu_overcommit}
+
+    def request(self, broker, deployment_id, priority=0, on_admit=None, on_reject=None):
+        """
+        Admit the deployment or queue it until it fits. The callbacks are called once the request is decided,
+        on_admit immediately in the calling thread when the deployment fits.
+
+        :param broker: context broker name
+        :param deployment_id: identifier of the deployment, an admitted deployment is not reserved twice
+        :param priority: requests with a higher priority are admitted first
+        :param on_admit: callable without arguments executed when the deployment is admitted
+        :param on_reject: callable receiving the reason when a queued request is rejected
+        :return: the Ticket
+        """
+        capacity = self.capacity()
+        footprint = self.footprint(broker)
+
+        with self.lock:
+            ticket = self.admitted.get(deployment_id)
+
+            if ticket is None:
+                if capacity is not None and any(footprint[x] > capacity[x] for x in ("memory", "cpus")):
+                    admission_decisions.labels(result="rejected").inc()
+                    raise AdmissionRejected(data=deployment_id,
+                                            message=f'The footprint of {broker} exceeds the capacity of the host')
+
+                if len(self.queue) >= self.max_queue:
+                    admission_decisions.labels(result="rejected").inc()
+                    raise AdmissionRejected(data=deployment_id,
+                                            message=f'The admission queue is full ({self.max_queue} requests)')
+
+                ticket = Ticket(deployment=deployment_id, broker=broker,
+                                footprint={"memory": footprint["memory"], "cpus": footprint["cpus"]},
+                                priority=priority, on_admit=on_admit, on_reject=on_reject)
+                self.queue.append(ticket)
+                admitted = self._schedule(capacity)
+            else:
+                ticket.on_admit = on_admit
+                admitted = [ticket]
+
+        if ticket.status == "queued":
+            admission_decisions.labels(result="queued").inc()
+            logger.info(f'Admission of {deployment_id} queued, {len(self.queue)} requests waiting')
+
+        self._admit(admitted)
+
+        return ticket
+
+    def acquire(self, broker, deployment_id, priority=0, timeout=None):
+        """
+        Blocking version of request, for the callers with their own threads, e.g. the warm pool.
+
+        :return: True if the deployment was admitted before the timeout
+        """
+        ticket = self.request(broker=broker, deployment_id=deployment_id, priority=priority)
+
+        if ticket.admitted_event.wait(timeout):
+            return True
+
+        with self.lock:
+            if ticket in self.queue:
+                self.queue.remove(ticket)
+                ticket.status = "rejected"
+                admission_queue_depth.labels(host=self.name).set(len(self.queue))
+
+        return ticket.admitted_event.is_set()
+
+    def release(self, deployment_id):
+        """
+        Free the resources reserved by the deployment, learning its peak usage, and admit the queued requests.
+        """
+        capacity = self.capacity()
+
+        with self.lock:
+            ticket = self.admitted.pop(deployment_id, None)
+
+            if ticket is not None and ticket.peak["memory"] > 0:
+                self._learn(ticket)
+
+            admitted = self._schedule(capacity)
+
+        self._admit(admitted)
+
+    def stats(self):
+        capacity = self.capacity()
+
+        with self.lock:
+            reserved = self._reserved()
+
+            return {
+                "host": self.host,
+                "capacity": capacity,
+                "reserved": reserved,
+                "free": {key: capacity[key] - reserved[key] for key in reserved} if capacity is not None else None,
+                "queue_depth": len(self.queue),
+                "queue": [ticket.to_dict() for ticket in self._ordered()],
+                "admitted": [ticket.to_dict() for ticket in self.admitted.values()],
+                "waits": {broker: {"last": values[-1], "avg": sum(values) / len(values), "max": max(values),
+                                   "count": len(values)}
+                          for broker, values in self.waits.items()},
+                "footprints": {broker: self.footprint(broker)
+                               for broker in sorted(set(self.declared) | set(self.learned))}
+            }
+
+    def _schedule(self, capacity):
+        # Called with the lock held, returns the tickets admitted so their callbacks run once it is released
+        admitted = list()
+
+        for ticket in self._ordered():
+            reserved = self._reserved()
+            fits = capacity is None or all(reserved[x] + ticket.footprint[x] <= capacity[x] for x in ("memory", "cpus"))
+
+            if not fits:
+                break
+
+            self.queue.remove(ticket)
+            ticket.status = "admitted"
+            ticket.admitted = monotonic()
+            self.admitted[ticket.deployment] = ticket
+            self.waits[ticket.broker] = self.waits.get(ticket.broker, list())[-99:] + [ticket.wait]
+            admission_wait.labels(broker=ticket.broker).observe(ticket.wait)
+            admitted.append(ticket)
+
+        admission_queue_depth.labels(host=self.name).set(len(self.queue))
+
+        return admitted
+
+    def _ordered(self):
+        now = monotonic()
+
+        return sorted(self.queue, key=lambda x: (-(x.priority + (now - x.created) / self.aging), x.created))
+
+    def _reserved(self):
+        reserved = {"memory": 0, "cpus": 0.0}
+
+        for ticket in self.admitted.values():
+            for key, value in ticket.reserved.items():
+                reserved[key] += value
+
+        return reserved
+
+    def _learn(self, ticket):
+        previous = self.learned.get(ticket.broker)
+        peak = {"memory": int(ticket.peak["memory"]), "cpus": round(ticket.peak["cpus"], 3)}
+
+        if previous is not None:
+            peak = {"memory": int(self.alpha * peak["memory"] + (1 - self.alpha) * previous["memory"]),
+                    "cpus": round(self.alpha * peak["cpus"] + (1 - self.alpha) * previous["cpus"], 3)}
+
+        self.learned[ticket.broker] = peak
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'w') as file:
+                dump(self.learned, file, indent=2, sort_keys=True)
+        except OSError as e:
+            logger.error(f'Admission scheduler could not save the learned footprints: {e}')
+
+    def _admit(self, tickets):
+        for ticket in tickets:
+            admission_decisions.labels(result="admitted").inc()
+            ticket.admitted_event.set()
+
+            if ticket.on_admit is not None:
+                ticket.on_admit()
+
+    def _reject(self, ticket, reason):
+        ticket.status = "rejected"
+        admission_decisions.labels(result="rejected").inc()
+        logger.error(f'Admission of {ticket.deployment} rejected: {reason}')
+
+        if ticket.on_reject is not None:
+            ticket.on_reject(reason)
+
+    def _sample(self):
+        with self.lock:
+            tickets = dict(self.admitted)
+
+        if len(tickets) == 0:
+            return
+
+        containers = [x for x in self.backend.list_containers(all=False, filters={"label": label_deployment},
+                                                              health=False)
+                      if x["labels"].get(label_deployment) in tickets]
+
+        def stats(container):
+            try:
+                return container["labels"][label_deployment], self.backend.container_stats(container["id"])
+            except Exception as e:
+                logger.error(f'Admission scheduler could not sample {container["name"]}: {e}')
+                return container["labels"][label_deployment], {"memory": 0, "cpus": 0.0}
+
+        usage = {deployment: {"memory": 0, "cpus": 0.0} for deployment in tickets}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="admission-sample") as executor:
+            for deployment, sample in executor.map(stats, containers):
+                usage[deployment]["memory"] += sample["memory"]
+                usage[deployment]["cpus"] += sample["cpus"]
+
+        with self.lock:
+            for deployment, ticket in tickets.items():
+                for key in ("memory", "cpus"):
+                    ticket.peak[key] = max(ticket.peak[key], usage[deployment][key])
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                with self.lock:
+                    expired = [x for x in self.queue if x.wait > self.max_wait]
+                    for ticket in expired:
+                        self.queue.remove(ticket)
+                    admission_queue_depth.labels(host=self.name).set(len(self.queue))
+
+                for ticket in expired:
+                    self._reject(ticket, f'Not admitted after {self.max_wait} seconds in the queue')
+
+                self._sample()
+
+                # The aging may reorder the queue, and the peaks may change the reserved resources
+                capacity = self.capacity()
+                with self.lock:
+                    admitted = self._schedule(capacity)
+                self._admit(admitted)
+            except Exception as e:
+                logger.error(f'Admission scheduler failed: {e}')
+
+
+class HostAdmission:
+    """
+    Admission control of every docker host, each host has its own AdmissionScheduler reading the resources and
+    the usage of the containers of its engine. A request goes to the scheduler of the host where the deployment
+    was placed.
+    """
+    def __init__(self, hosts, factory):
+        """
+        :param hosts: HostPool where the deployments are placed
+        :param factory: callable receiving a DockerHost and returning its AdmissionScheduler
+        """
+        self.hosts = hosts
+        self.schedulers = {name: factory(host) for name, host in hosts.hosts.items()}
+
+    def start(self):
+        for scheduler in self.schedulers.values():
+            scheduler.start()
+
+    def stop(self):
+        for scheduler in self.schedulers.values():
+            scheduler.stop()
+
+    def request(self, broker, deployment_id, priority=0, on_admit=None, on_reject=None):
+        return self._scheduler(deployment_id).request(broker=broker, deployment_id=deployment_id,
+                                                      priority=priority, on_admit=on_admit, on_reject=on_reject)
+
+    def acquire(self, broker, deployment_id, priority=0, timeout=None):
+        return self._scheduler(deployment_id).acquire(broker=broker, deployment_id=deployment_id,
+                                                      priority=priority, timeout=timeout)
+
+    def release(self, deployment_id):
+        # The deployment may be already released from its host, only the scheduler that admitted it has a ticket
+        for scheduler in self.schedulers.values():
+            scheduler.release(deployment_id)
+
+    def stats(self):
+        return {name: scheduler.stats() for name, scheduler in self.schedulers.items()}
+
+    def _scheduler(self, deployment_id):
+        host = self.hosts.owner(deployment_id)
+        if host is None:
+            raise AdmissionRejected(data=deployment_id, message='The deployment is not placed on a docker host')
+
+        return self.schedulers[host.name]
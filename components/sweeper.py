@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from logging import getLogger
+from threading import Lock, Event, Thread
+from time import time, perf_counter
+from components.deployments import label_deployment, label_created
+from components.metrics import swept_resources, reclaimed_bytes
+
+logger = getLogger(__name__)
+
+
+class OrphanSweeper:
+    """
+    Remove the containers, volumes and networks labelled by the service whose deployment is not alive anymore,
+    e.g. those left behind by a crashed run or by a previous instance of the service. Each resource type is
+    found with a single query filtered by the deployment label, and the resources are removed in parallel.
+
+    A resource is only removed when it is older than the TTL, so the resources of a deployment that is being
+    created, or that was created by another instance of the service a moment ago, are kept.
+
+    Every docker host is swept with its own backend. Without a journal the registry does not know the deployments
+    of the previous runs, e.g. a default deployment still running, so only the resources of the deployments
+    released in this run are removed.
+    """
+    def __init__(self, hosts, registry, ttl=3600, interval=600, workers=4):
+        """
+        :param hosts: HostPool with the docker hosts whose resources are swept
+        :param registry: DeploymentRegistry with the deployments alive
+        :param ttl: minimum age in seconds of the orphan resources to remove
+        :param interval: seconds between background sweeps, 0 to sweep only on demand
+        :param workers: resources removed in parallel
+        """
+        self.hosts = hosts
+        self.registry = registry
+        self.ttl = ttl
+        self.interval = interval
+        self.workers = workers
+        self.last = None
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self):
+        if self.interval > 0:
+            self.thread = Thread(target=self._run, name="orphan-sweeper", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def sweep(self, ttl=None, dry_run=False):
+        """
+        :param ttl: minimum age in seconds, by default the configured one
+        :param dry_run: only report the orphan resources without removing them
+        :return: dict with the resources reclaimed per type, the bytes of volume space, the failures and the
+                 hosts that could not be listed
+        """
+        ttl = self.ttl if ttl is None else ttl
+
+        # One sweep at a time, the background sweep and a request would try to remove the same resources
+        with self.lock:
+            start = perf_counter()
+            alive = self.registry.live()
+            released = None if self.registry.journal is not None else self.registry.retired()
+            now = time()
+
+            orphans = {"containers": list(), "volumes": list(), "networks": list()}
+            failed, unreachable = list(), dict()
+
+            for host in list(self.hosts.hosts.values()):
+                try:
+                    found = self._sweep_host(host, alive, released, now, ttl, dry_run, failed)
+                except Exception as e:
+                    logger.error(f'Orphan sweeper could not list the resources of the docker host {host.name}: {e}')
+                    unreachable[host.name] = str(e)
+                    continue
+
+                for kind, resources in found.items():
+                    orphans[kind] += resources
+
+            failures = {(x["host"], x["type"], x["id"]) for x in failed}
+            removed = {kind: [x for x in resources if (x["host"], kind, x["id"]) not in failures]
+                       for kind, resources in orphans.items()}
+            reclaimed = sum(x.get("bytes") or 0 for x in removed["volumes"])
+
+            if not dry_run:
+                reclaimed_bytes.inc(reclaimed)
+
+            self.last = {
+                "date": datetime.now().isoformat(),
+                "dry_run": dry_run,
+                "ttl": ttl,
+                **removed,
+                "reclaimed_bytes": reclaimed,
+                "failed": failed,
+                "unreachable": unreachable,
+                "duration": perf_counter() - start
+            }
+
+            return self.last
+
+    def _sweep_host(self, host, alive, released, now, ttl, dry_run, failed):
+        backend = host.backend
+        selector = {"label": label_deployment}
+
+        resources = {
+            "containers": backend.list_containers(all=True, filters=selector, health=False),
+            "volumes": backend.list_volumes(filters=selector),
+            "networks": backend.list_networks(filters=selector)
+        }
+        orphans = {kind: [{**x, "host": host.name} for x in self._orphans(items, alive, released, now, ttl)]
+                   for kind, items in resources.items()}
+
+        if len(orphans["volumes"]) > 0:
+            sizes = self._volume_sizes(backend)
+            for volume in orphans["volumes"]:
+                volume["bytes"] = sizes.get(volume["name"])
+
+        if not dry_run:
+            # The volumes and networks are in use until their containers are removed
+            failed += self._remove("containers", orphans["containers"],
+                                   lambda x: backend.remove_container(x["id"]))
+            failed += self._remove("volumes", orphans["volumes"],
+                                   lambda x: backend.remove_volume(x["name"]))
+            failed += self._remove("networks", orphans["networks"],
+                                   lambda x: backend.remove_network(x["id"]))
+
+        return orphans
+
+    def _remove(self, kind, resources, remove):
+        if len(resources) == 0:
+            return list()
+
+        def task(resource):
+            try:
+                remove(resource)
+                swept_resources.labels(type=kind).inc()
+                return None
+            except Exception as e:
+                logger.error(f'Orphan sweeper failed removing {resource["name"]}: {e}')
+                return {**resource, "type": kind, "error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="orphan-sweeper") as executor:
+            return [x for x in executor.map(task, resources) if x is not None]
+
+    @staticmethod
+    def _volume_sizes(backend):
+        try:
+            return backend.volume_sizes()
+        except Exception as e:
+            logger.error(f'Orphan sweeper could not compute the size of the volumes: {e}')
+            return dict()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                report = self.sweep()
+                count = sum(len(report[kind]) for kind in ("containers", "volumes", "networks"))
+                if count > 0:
+                    logger.info(f'Orphan sweeper removed {count} resources, {report["reclaimed_bytes"]} bytes')
+            except Exception as e:
+                logger.error(f'Orphan sweeper failed: {e}')
+
+    @staticmethod
+    def _orphans(resources, alive, released, now, ttl):
+        orphans = list()
+
+        for resource in resources:
+            labels = resource.get("labels") or dict()
+            deployment = labels.get(label_deployment)
+
+            try:
+                age = now - int(labels.get(label_created))
+            except (TypeError, ValueError):
+                # Without a valid creation time the resource is kept, its age cannot be checked against the TTL
+                continue
+
+            # Without journal, a deployment that is not alive may belong to a previous run and still be used
+            if deployment in alive or (released is not None and deployment not in released):
+                continue
+
+            if age >= ttl:
+                orphans.append({"name": resource["name"], "id": resource.get("id", resource["name"]),
+                                "deployment": deployment, "age": int(age)})
+
+        return orphans
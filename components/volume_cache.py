@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from hashlib import sha256
+from json import load, dump, dumps
+from pathlib import Path
+from threading import Lock
+from time import time
+
+# Timings kept per broker, fresh_init and restored_init measure the up until the deployment is healthy
+phases = ("snapshot", "restore", "fresh_init", "restored_init")
+
+
+class VolumeCache:
+    """
+    Compressed snapshots of the named volumes of a broker taken once it is healthy for the first time, e.g. the
+    Postgres data of Stellio and Scorpio after the schemas and extensions are created. The next deployments with
+    the same images restore the volumes before the up instead of initializing the databases again.
+
+    The tarballs are written and read by a helper container mounting the volume and the cache folder, therefore
+    the cache folder must be a path of the docker host. Entries not used during max_age seconds are evicted, and
+    the least recently used ones while the cache is bigger than max_bytes.
+    """
+    def __init__(self, path="./deployments/.volume-cache", brokers=None, image="alpine:3.18",
+                 max_bytes=5 * 1024 ** 3, max_age=7 * 24 * 3600):
+        self.path = Path(path).resolve()
+        self.brokers = set(brokers or list())
+        self.image = image
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.index_file = self.path.joinpath('index.json')
+        self.lock = Lock()
+        self.claims = set()
+        self.timings = {broker: {phase: list() for phase in phases} for broker in self.brokers}
+
+        try:
+            with open(self.index_file) as file:
+                self.entries = load(file)
+        except (FileNotFoundError, ValueError):
+            self.entries = dict()
+
+        self.evict()
+
+    def supports(self, broker):
+        return broker in self.brokers
+
+    @staticmethod
+    def key(broker, model):
+        """
+        :param broker: context broker name
+        :param model: ComposeModel of the deployment, its images are interpolated with the .env values
+        :return: the cache key, it changes when any image tag of the broker changes
+        """
+        digest = sha256(dumps({"broker": broker, "images": model.images(), "volumes": sorted(model.volumes)},
+                              sort_keys=True).encode())
+
+        return f'{broker.lower()}-{digest.hexdigest()[:16]}'
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and all(self.path.joinpath(x).is_file() for x in entry["volumes"].values()):
+                entry["used"] = time()
+                return entry
+
+        return None
+
+    def claim(self, key):
+        """
+        Reserve the snapshot of a key, the concurrent first deployments of a broker would write the same tarballs.
+
+        :return: True if the caller takes the snapshot, False if it exists or another deployment is taking it
+        """
+        with self.lock:
+            if key in self.entries or key in self.claims:
+                return False
+
+            self.claims.add(key)
+            return True
+
+    def unclaim(self, key):
+        with self.lock:
+            self.claims.discard(key)
+
+    @staticmethod
+    def file(key, volume):
+        return f'{key}-{volume}.tar.gz'
+
+    def commit(self, key, broker, model, files):
+        """
+        Register the tarballs of a snapshot and evict the entries over the limits.
+
+        :param files: dict volume key -> tarball written in the cache folder
+        """
+        with self.lock:
+            now = time()
+            self.entries[key] = {
+                "broker": broker,
+                "images": model.images(),
+                "volumes": files,
+                "bytes": sum(self.path.joinpath(x).stat().st_size for x in files.values()),
+                "created": now,
+                "used": now
+            }
+
+        self.evict()
+
+    def evict(self):
+        with self.lock:
+            now = time()
+            expired = [key for key, entry in self.entries.items() if now - entry["used"] > self.max_age]
+
+            # Least recently used first while the cache is too big
+            entries = sorted((x for x in self.entries.items() if x[0] not in expired), key=lambda x: x[1]["used"])
+            size = sum(entry["bytes"] for _, entry in entries)
+            for key, entry in entries:
+                if size <= self.max_bytes:
+                    break
+                expired.append(key)
+                size -= entry["bytes"]
+
+            for key in expired:
+                for file in self.entries.pop(key)["volumes"].values():
+                    self.path.joinpath(file).unlink(missing_ok=True)
+
+            self._write()
+
+            return expired
+
+    def observe(self, broker, phase, seconds):
+        """
+        :param phase: snapshot, restore, fresh_init (up to healthy without snapshot) or restored_init
+        """
+        with self.lock:
+            timings = self.timings.setdefault(broker, {x: list() for x in phases})
+            timings[phase] = timings[phase][-99:] + [seconds]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "path": str(self.path),
+                "bytes": sum(entry["bytes"] for entry in self.entries.values()),
+                "max_bytes": self.max_bytes,
+                "max_age": self.max_age,
+                "entries": {key: dict(entry) for key, entry in self.entries.items()},
+                "timings": {broker: {phase: {"last": values[-1], "avg": sum(values) / len(values),
+                                             "count": len(values)} if values else None
+                                     for phase, values in timings.items()}
+                            for broker, timings in self.timings.items()}
+            }
+
+    def _write(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        with open(self.index_file, 'w') as file:
+            dump(self.entries, file, indent=2, sort_keys=True)
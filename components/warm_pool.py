@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from logging import getLogger
+from threading import Lock, Event
+from uuid import uuid4
+
+logger = getLogger(__name__)
+
+
+class WarmPool:
+    """
+    Keep a number of healthy isolated deployments per broker on standby, so an init request without deployment
+    identifier is served with an already running broker instead of a cold deployment. The replacement of a
+    deployment handed out is started in background right away.
+
+    The standby deployments publish their ports on free host ports, so several of them run next to the default
+    deployment of the broker.
+    """
+    def __init__(self, registry, sizes, workers=2, timeout=600, interval=5, scheduler=None, diagnostics=None):
+        self.registry = registry
+        self.scheduler = scheduler
+        self.diagnostics = diagnostics
+        self.sizes = {broker: size for broker, size in sizes.items() if size > 0}
+        self.timeout = timeout
+        self.interval = interval
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="warm-pool")
+        self.standby = {broker: list() for broker in self.sizes}
+        self.filling = {broker: 0 for broker in self.sizes}
+        self.statistics = {broker: {"hits": 0, "misses": 0, "refills": 0, "failures": 0, "refill_times": list()}
+                           for broker in self.sizes}
+        self.lock = Lock()
+        self.stopped = Event()
+
+    def start(self):
+        for broker in self.sizes:
+            self.refill(broker)
+
+    def take(self, broker):
+        """
+        Hand out a healthy standby deployment of the broker and start its replacement in background.
+
+        :param broker: context broker name
+        :return: the Deployment or None if the pool of the broker is empty
+        """
+        if broker not in self.sizes:
+            return None
+
+        with self.lock:
+            if len(self.standby[broker]) > 0:
+                deployment = self.standby[broker].pop(0)
+                self.statistics[broker]["hits"] += 1
+            else:
+                deployment = None
+                self.statistics[broker]["misses"] += 1
+
+        if deployment is not None:
+            logger.info(f'Warm pool hit for {broker}, deployment {deployment.id}')
+            self.refill(broker)
+
+        return deployment
+
+    def refill(self, broker):
+        if broker not in self.sizes or self.stopped.is_set():
+            return
+
+        with self.lock:
+            missing = self.sizes[broker] - len(self.standby[broker]) - self.filling[broker]
+            self.filling[broker] += max(0, missing)
+
+        for _ in range(missing):
+            self.executor.submit(self._fill, broker)
+
+    def stats(self):
+        with self.lock:
+            result = dict()
+            for broker, statistics in self.statistics.items():
+                refill_times = statistics["refill_times"]
+                result[broker] = {
+                    "size": self.sizes[broker],
+                    "standby": [deployment.id for deployment in self.standby[broker]],
+                    "filling": self.filling[broker],
+                    "hits": statistics["hits"],
+                    "misses": statistics["misses"],
+                    "refills": statistics["refills"],
+                    "failures": statistics["failures"],
+                    "refill_time_last": refill_times[-1] if refill_times else None,
+                    "refill_time_avg": sum(refill_times) / len(refill_times) if refill_times else None
+                }
+
+            return result
+
+    def shutdown(self):
+        """
+        Stop refilling and tear down the deployments that were never handed out.
+        """
+        self.stopped.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+        with self.lock:
+            deployments = [deployment for standby in self.standby.values() for deployment in standby]
+            for standby in self.standby.values():
+                standby.clear()
+
+        for deployment in deployments:
+            self._discard(deployment)
+
+    def _fill(self, broker):
+        start = datetime.now()
+        deployment = None
+
+        try:
+            deployment = self.registry.create(broker=broker, deployment_id=f'pool-{broker.lower()}-{uuid4().hex[:8]}',
+                                              remap_ports=True)
+
+            # The standby deployments have the lowest priority, they never delay the requested ones
+            if self.scheduler is not None and \
+                    not self.scheduler.acquire(broker=broker, deployment_id=deployment.id, priority=-1,
+                                               timeout=self.timeout):
+                raise TimeoutError(f'The deployment {deployment.id} was not admitted in {self.timeout} seconds')
+
+            with deployment.hold("warm-up") as engine:
+                engine.up()
+                healthy = self._wait_healthy(engine)
+
+            if not healthy:
+                raise TimeoutError(f'The deployment {deployment.id} did not reach healthy in {self.timeout} seconds')
+
+            elapsed = (datetime.now() - start).total_seconds()
+
+            with self.lock:
+                self.standby[broker].append(deployment)
+                self.statistics[broker]["refills"] += 1
+                self.statistics[broker]["refill_times"] = self.statistics[broker]["refill_times"][-99:] + [elapsed]
+
+            logger.info(f'Warm pool refilled {broker} with {deployment.id} in {elapsed:.1f} seconds')
+        except Exception as e:
+            logger.error(f'Warm pool failed refilling {broker}: {e}')
+
+            with self.lock:
+                self.statistics[broker]["failures"] += 1
+
+            if deployment is not None:
+                # The containers are inspected before the deployment is torn down
+                if self.diagnostics is not None and not self.stopped.is_set():
+                    self.diagnostics.capture_failure(deployment, "warm-up")
+                self._discard(deployment)
+        finally:
+            with self.lock:
+                self.filling[broker] -= 1
+
+    def _wait_healthy(self, engine):
+        deadline = datetime.now().timestamp() + self.timeout
+
+        while datetime.now().timestamp() < deadline:
+            if engine.check_health_status()["status"] == "healthy":
+                return True
+
+            if self.stopped.wait(self.interval):
+                return False
+
+        return False
+
+    def _discard(self, deployment):
+        try:
+            with deployment.hold("clean") as engine:
+                engine.down()
+        except Exception as e:
+            logger.error(f'Warm pool failed cleaning {deployment.id}: {e}')
+        finally:
+            self.registry.release(deployment)
+
+            if self.scheduler is not None:
+                self.scheduler.release(deployment.id)
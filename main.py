@@ -19,13 +19,29 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 ##
-from api.server import launch
 from cli.command import parse_cli
 
 
 if __name__ == "__main__":
     args = parse_cli()
 
+    if args['bench']:
+        from cli.benchmark import run_benchmark
+
+        exit(run_benchmark(args))
+
+    if args['dump']:
+        from cli.profile import run_dump
+
+        exit(run_dump(args))
+
+    if args['--profile-startup']:
+        from cli.profile import run_profile
+
+        exit(run_profile(args))
+
+    from api.server import launch
+
     launch(app="api.server:application",
            host=args['--host'],
            port=args['--port'])
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from os.path import join
+from pathlib import Path
+from shutil import rmtree
+from tempfile import mkdtemp
+import pytest
+from utils.fake_docker import FakeDocker
+
+# The compose files of the brokers are referenced from the root of the repository
+root = Path(__file__).parents[1]
+
+
+@pytest.fixture
+def fake_docker():
+    # Short folder, the path of a unix socket is limited to about 100 characters
+    directory = mkdtemp(prefix="fake-docker-")
+    docker = FakeDocker(join(directory, "docker.sock")).start()
+
+    yield docker
+
+    docker.stop()
+    rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def repository(monkeypatch):
+    monkeypatch.chdir(root)
+
+    return root
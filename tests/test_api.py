@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import sleep
+import pytest
+from fastapi.testclient import TestClient
+from common.config import config
+from components.compose import Compose
+from components.exceptions import NoFreePort
+from utils.fake_docker import FakeDocker, FakeDockerClient
+from tests.conftest import root
+
+
+@pytest.fixture(scope="module")
+def service():
+    """
+    The service against a fake docker engine, the compose commands of the deployments create its containers.
+    The server and its subsystems are module globals, therefore a single instance serves all the tests.
+    """
+    directory = mkdtemp(prefix="api-")
+    docker = FakeDocker(join(directory, "docker.sock")).start()
+    initialize = Compose.initialize
+
+    def fake_initialize(self, *args, **kwargs):
+        initialize(self, *args, **kwargs)
+        self.dockerEngine = FakeDockerClient(docker=docker, engine=self, health_delay=0.2)
+
+    settings = {
+        "docker": {"socket": docker.socket_path, "backend": "native"},
+        "deployments": {"path": join(directory, "deployments")},
+        "journal": {"path": join(directory, "journal.db")},
+        "diagnostics": {"path": join(directory, "diagnostics"), "min_interval": 0},
+        "logger": {"path": join(directory, "access.log")},
+        "logs": {"interval": 0},
+        "pool": {"sizes": {"YANB": 1}, "interval": 0.1},
+        "wait": {"interval": 0.1},
+        "scheduler": {"enabled": False},
+        "sweeper": {"enabled": False},
+        "prefetch": {"enabled": False},
+        "volume_cache": {"enabled": False}
+    }
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(root)
+        # The .env file of the composes is not part of the repository
+        patch.setenv("YANB_PORT", "1026")
+        patch.setattr(Compose, "initialize", fake_initialize)
+        for section, values in settings.items():
+            for key, value in values.items():
+                patch.setitem(config[section], key, value)
+
+        from api import server
+
+        with TestClient(server.application) as client:
+            for _ in range(100):
+                if client.get("/ready").status_code == 200:
+                    break
+                sleep(0.1)
+
+            yield client, docker
+
+    docker.stop()
+    rmtree(directory, ignore_errors=True)
+
+
+def deploy(client, deployment):
+    response = client.post("/init", json={"broker": "Orion-LD", "deployment": deployment})
+    assert response.status_code == 202
+
+    for _ in range(100):
+        if client.get(f'/jobs/{response.json()["job"]["id"]}').json()["status"] == "succeeded":
+            return
+        sleep(0.05)
+
+    raise AssertionError(f'The deployment {deployment} was not deployed')
+
+
+def container(docker, name):
+    return next(key for key, value in docker.containers.items() if value["Name"] == name)
+
+
+def wait(client, deployment, timeout=10):
+    return client.post("/wait", json={"broker": "Orion-LD", "deployment": deployment, "timeout": timeout})
+
+
+def test_wait_for_an_unknown_deployment_is_not_found(service):
+    client, _ = service
+
+    assert wait(client, "unknown").status_code == 404
+    assert "unknown" not in [x["id"] for x in client.get("/deployments").json()]
+    # The exception is counted where the handler turned it into the response
+    assert 'brokercleaner_exceptions_total{type="UnknownDeployment"} 1.0' in client.get("/metrics").text
+
+
+def test_wait_until_every_container_is_healthy(service):
+    client, _ = service
+    deploy(client, "healthy")
+
+    response = wait(client, "healthy")
+
+    assert response.status_code == 200
+    assert response.json()["result"] == "reached"
+    assert sorted((x["name"], x["health"]) for x in response.json()["containers"]) == \
+        [("healthy-db-mongo", "healthy"), ("healthy-fiware-orion", "healthy")]
+
+    client.post("/clean", json={"broker": "Orion-LD", "deployment": "healthy"})
+
+
+def test_wait_fails_fast_when_a_container_is_unhealthy(service):
+    client, docker = service
+    deploy(client, "unhealthy")
+    assert wait(client, "unhealthy").json()["result"] == "reached"
+
+    docker.set_state(container(docker, "unhealthy-db-mongo"), "health_status: unhealthy", health="unhealthy")
+    response = wait(client, "unhealthy")
+
+    assert response.json()["result"] == "failed"
+    assert response.json()["status"] == "unhealthy"
+    assert response.json()["diagnostics"] is not None
+
+    client.post("/clean", json={"broker": "Orion-LD", "deployment": "unhealthy"})
+
+
+def test_wait_times_out_while_a_container_is_missing(service):
+    client, docker = service
+    deploy(client, "missing")
+    assert wait(client, "missing").json()["result"] == "reached"
+
+    container_id = container(docker, "missing-fiware-orion")
+    docker.set_state(container_id, "die", status="exited")
+    docker.emit("destroy", container_id)
+    del docker.containers[container_id]
+    response = wait(client, "missing", timeout=0.5)
+
+    assert response.status_code == 408
+    assert response.json()["status"] == "starting"
+    assert response.json()["missing"] == ["missing-fiware-orion"]
+
+    client.post("/clean", json={"broker": "Orion-LD", "deployment": "missing"})
+
+
+def test_a_warm_pool_hit_returns_the_ports_and_containers_of_the_standby(service):
+    client, _ = service
+
+    for _ in range(100):
+        if len(client.get("/pool").json()["YANB"]["standby"]) > 0:
+            break
+        sleep(0.05)
+
+    response = client.post("/init", json={"broker": "YANB"})
+    deployment = response.json()["deployment"]
+
+    assert response.status_code == 201
+    assert response.json()["containers"] == [f'{deployment}-yanb']
+    assert 20000 <= response.json()["ports"]["yanb"][0]["published"] <= 29999
+
+    client.post("/clean", json={"broker": "YANB"})
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/wait", {"broker": "Orion-LD", "deployment": "invalid", "timeout": "soon"}),
+    ("/wait", {"broker": "Orion-LD", "deployment": "invalid", "timeout": None}),
+    ("/wait", {"broker": "Orion-LD", "deployment": "invalid", "timeout": -1}),
+    ("/init", {"broker": "Orion-LD", "deployment": "invalid", "priority": "high"}),
+    ("/batch/init", {"brokers": ["Orion-LD"], "timeout": "soon"}),
+    ("/batch/init", {"brokers": ["Orion-LD"], "priority": [1]})
+])
+def test_invalid_numbers_of_the_body_are_bad_requests(service, path, body):
+    client, _ = service
+    response = client.post(path, json=body)
+
+    assert response.status_code == 400 and "should be" in response.json()["message"]
+    assert "invalid" not in [x["id"] for x in client.get("/deployments").json()]
+
+
+def test_a_batch_is_rolled_back_when_a_broker_cannot_be_created(service, monkeypatch):
+    from api.server import services
+    client, _ = service
+    acquire, created = services.registry.acquire, list()
+
+    def failing_acquire(broker, deployment_id=None, remap_ports=False):
+        if broker == "YANB":
+            raise NoFreePort(data="20000-29999")
+
+        created.append(acquire(broker=broker, deployment_id=deployment_id, remap_ports=remap_ports))
+        return created[-1]
+
+    monkeypatch.setattr(services.registry, "acquire", failing_acquire)
+    response = client.post("/batch/init", json={"batch": "rollback", "brokers": ["Orion-LD", "YANB"]})
+
+    assert response.status_code == 503
+    assert [x.id for x in created] == ["rollback-orion-ld"] and created[0].released
+    assert "rollback-orion-ld" not in services.registry.live()
+    assert "rollback-orion-ld" not in [x["id"] for x in client.get("/deployments").json()]
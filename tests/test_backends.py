@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from shutil import which
+import pytest
+from components.docker_backend import DockerBackend, NativeBackend, WhalesBackend
+
+labels = {"org.fiware.brokercleaner.deployment": "a", "com.docker.compose.project": "brokercleaner-a"}
+
+
+@pytest.fixture
+def engine(fake_docker):
+    fake_docker.add_container("a-orion", health="healthy", labels=labels)
+    fake_docker.add_container("a-mongo", status="exited", labels=labels)
+    fake_docker.add_container("other", labels={"com.docker.compose.project": "other"})
+    fake_docker.add_volume("a-mongo-data", labels=labels, size=1024)
+    fake_docker.add_network("a-default", labels=labels)
+
+    return fake_docker
+
+
+def containers(backend, **kwargs):
+    return sorted((x["name"], x["status"], x["health"], x["labels"].get("org.fiware.brokercleaner.deployment"))
+                  for x in backend.list_containers(**kwargs))
+
+
+def test_docker_backend_is_abstract():
+    with pytest.raises(TypeError):
+        DockerBackend()
+
+
+def test_native_backend_lists_the_resources_of_the_engine(engine):
+    backend = NativeBackend(socket_path=engine.socket_path)
+    selector = {"label": "org.fiware.brokercleaner.deployment"}
+
+    assert containers(backend, all=True, filters=selector) == [("a-mongo", "exited", "unknown", "a"),
+                                                               ("a-orion", "running", "healthy", "a")]
+    assert containers(backend, all=False, filters=selector) == [("a-orion", "running", "healthy", "a")]
+    assert [x["name"] for x in backend.list_volumes(filters=selector)] == ["a-mongo-data"]
+    assert [x["name"] for x in backend.list_networks(filters=selector)] == ["a-default"]
+    assert backend.volume_sizes() == {"a-mongo-data": 1024}
+    assert backend.info() == {"cpus": 8, "memory": 16 * 1024 ** 3}
+
+
+@pytest.mark.skipif(which("docker") is None, reason="the docker CLI used by python_on_whales is not installed")
+def test_native_and_whales_backends_agree(engine):
+    from python_on_whales import DockerClient
+
+    native = NativeBackend(socket_path=engine.socket_path)
+    whales = WhalesBackend(docker=DockerClient(host=f'unix://{engine.socket_path}', client_call=["docker"]))
+    selector = {"label": "org.fiware.brokercleaner.deployment"}
+
+    for kwargs in ({"all": True, "filters": selector}, {"all": False, "filters": selector}, {"all": True}):
+        assert containers(native, **kwargs) == containers(whales, **kwargs)
+
+    assert sorted(x["name"] for x in native.list_volumes(filters=selector)) == \
+        sorted(x["name"] for x in whales.list_volumes(filters=selector))
+    assert sorted(x["name"] for x in native.list_networks(filters=selector)) == \
+        sorted(x["name"] for x in whales.list_networks(filters=selector))
+    assert native.info() == whales.info()
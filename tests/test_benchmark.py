@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+import pytest
+from cli.benchmark import LifecycleBenchmark, run_benchmark
+from common.config import config
+
+
+@pytest.fixture
+def settings(repository, monkeypatch, tmp_path):
+    # The .env file of the composes is not part of the repository
+    monkeypatch.setenv("YANB_PORT", "1026")
+    monkeypatch.setitem(config['build_cache'], 'path', str(tmp_path / "build-cache.json"))
+    monkeypatch.setitem(config['volume_cache'], 'path', str(tmp_path / "volume-cache"))
+
+
+def test_a_fake_cycle_goes_through_the_up_of_the_service(settings):
+    results = LifecycleBenchmark(brokers=["YANB"], cycles=2, interval=0.01, fake=True).run()
+
+    assert results["mode"] == "fake"
+    assert results["brokers"]["YANB"]["statuses"] == ["healthy", "healthy"]
+    assert set(results["brokers"]["YANB"]["phases"]) == {"build", "up", "healthy", "down"}
+    assert list(results["brokers"]["YANB"]["containers"]) == ["yanb"]
+
+
+def test_an_unknown_broker_is_a_usage_error(settings, tmp_path):
+    args = {'--broker': ["YANB", "Unknown"], '--cycles': 1, '--timeout': 1.0, '--interval': 0.0, '--fake': True,
+            '--baseline': None, '--tolerance': 0.2, '--output': str(tmp_path / "benchmark.json")}
+
+    with pytest.raises(SystemExit, match="--broker NAME should be one of .*, unknown Unknown"):
+        run_benchmark(args)
+
+    assert not (tmp_path / "benchmark.json").exists()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from json import dumps
+import pytest
+from components.build_cache import BuildCache
+from components.compose_model import ComposeModel, ComposeModelCache
+from utils.file_utils import write_env_file
+
+
+@pytest.fixture
+def model(tmp_path):
+    tmp_path.joinpath("app").mkdir()
+    tmp_path.joinpath("app", "Dockerfile").write_text("FROM alpine\n")
+    tmp_path.joinpath("compose.yml").write_text(
+        "services:\n"
+        "  app:\n"
+        "    build: ./app\n"
+        "  db:\n"
+        "    image: mongo:6.0\n")
+
+    return ComposeModel(files=[str(tmp_path.joinpath("compose.yml"))], environment=dict(), variables=dict())
+
+
+def test_a_new_project_reuses_the_image_built_for_the_broker(model, tmp_path):
+    cache = BuildCache(path=tmp_path.joinpath("build-cache.json"))
+
+    stale, cached = cache.plan(model=model, broker="YANB", project="first")
+    assert list(stale) == ["app"] and cached == dict()
+    cache.commit(model=model, broker="YANB", project="first", fingerprints=stale)
+
+    # The entries survive a restart of the service
+    cache = BuildCache(path=tmp_path.joinpath("build-cache.json"))
+    stale, cached = cache.plan(model=model, broker="YANB", project="second")
+
+    assert stale == dict() and cached == {"app": ("first-app", "second-app")}
+
+
+def test_a_changed_context_or_a_removed_image_is_built_again(model, tmp_path):
+    cache = BuildCache(path=tmp_path.joinpath("build-cache.json"))
+    stale, _ = cache.plan(model=model, broker="YANB", project="first")
+    cache.commit(model=model, broker="YANB", project="first", fingerprints=stale)
+
+    assert list(cache.plan(model=model, broker="YANB", project="second", exists=lambda x: False)[0]) == ["app"]
+
+    tmp_path.joinpath("app", "Dockerfile").write_text("FROM alpine:3.19\n")
+    assert list(cache.plan(model=model, broker="YANB", project="second")[0]) == ["app"]
+
+
+def test_entries_of_the_previous_format_are_built_again(model, tmp_path):
+    tmp_path.joinpath("build-cache.json").write_text(dumps({"first/app": "0" * 64}))
+    cache = BuildCache(path=tmp_path.joinpath("build-cache.json"))
+
+    assert list(cache.plan(model=model, broker="YANB", project="first")[0]) == ["app"]
+
+
+def test_deployments_of_a_broker_with_different_prefixes_share_the_build(tmp_path):
+    tmp_path.joinpath("app").mkdir()
+    tmp_path.joinpath("app", "Dockerfile").write_text("ARG VERSION\nFROM alpine:${VERSION}\n")
+    tmp_path.joinpath("compose.yml").write_text(
+        "services:\n"
+        "  app:\n"
+        "    container_name: ${CONTAINER_NAME_PREFIX}app\n"
+        "    build:\n"
+        "      context: ./app\n"
+        "      args:\n"
+        "        VERSION: ${APP_VERSION}\n")
+
+    def deployment(prefix, version="3.19"):
+        # Each isolated deployment has its own .env with the values of the broker and its prefix
+        env_file = tmp_path.joinpath(f'{prefix}.env')
+        write_env_file(env_file, {"APP_VERSION": version, "CONTAINER_NAME_PREFIX": prefix})
+        return ComposeModelCache().get(files=[str(tmp_path.joinpath("compose.yml"))], env_file=str(env_file))
+
+    cache = BuildCache(path=tmp_path.joinpath("build-cache.json"))
+    stale, _ = cache.plan(model=deployment("first-"), broker="YANB", project="first")
+    cache.commit(model=deployment("first-"), broker="YANB", project="first", fingerprints=stale)
+
+    assert cache.plan(model=deployment("second-"), broker="YANB", project="second") == \
+        (dict(), {"app": ("first-app", "second-app")})
+    assert list(cache.plan(model=deployment("third-", version="3.20"), broker="YANB", project="third")[0]) == ["app"]
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from os import utime
+import pytest
+from components.compose_model import ComposeModel, ComposeModelCache, ServiceModel, interpolate
+from utils.file_utils import write_env_file
+
+
+def model(tmp_path, *contents, variables=None):
+    files = list()
+    for index, content in enumerate(contents):
+        files.append(str(tmp_path / f'compose-{index}.yml'))
+        (tmp_path / f'compose-{index}.yml').write_text(content)
+
+    return ComposeModel(files=files, environment=dict(), variables=variables or dict())
+
+
+def stat_ns(path):
+    return path.stat().st_mtime_ns
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("${TAG}", "1.0"),
+    ("$TAG-$$TAG", "1.0-$TAG"),
+    ("${MISSING:-latest}", "latest"),
+    ("${EMPTY:-latest}", "latest"),
+    ("${EMPTY-latest}", ""),
+    ("${TAG:-latest}", "1.0"),
+    ("${MISSING}", "")
+])
+def test_interpolation_defaults(value, expected):
+    assert interpolate(value, {"TAG": "1.0", "EMPTY": ""}) == expected
+
+
+def test_interpolation_keeps_the_types_of_the_values():
+    result = interpolate({"ports": ["${PORT}:1026", 27017], "replicas": 1}, {"PORT": "8080"})
+
+    assert result == {"ports": ["8080:1026", 27017], "replicas": 1}
+
+
+def test_the_later_files_take_precedence(tmp_path):
+    result = model(tmp_path,
+                   "services:\n"
+                   "  broker:\n"
+                   "    image: broker:${TAG}\n"
+                   "    environment: {LEVEL: info, DB: mongo}\n"
+                   "    ports: ['1026:1026']\n"
+                   "    healthcheck: {test: curl}\n"
+                   "    labels: {team: a}\n",
+                   "services:\n"
+                   "  broker:\n"
+                   "    image: broker:2.0\n"
+                   "    environment: {LEVEL: debug}\n"
+                   "    ports: ['1027:1026']\n"
+                   "    healthcheck: !reset null\n"
+                   "    labels: !override {owner: b}\n",
+                   variables={"TAG": "1.0"})
+    broker = result.services["broker"]
+
+    assert broker.image == "broker:2.0"
+    # The mappings are merged, the sequences and the !override values replace the previous ones
+    assert broker.config["environment"] == {"LEVEL": "debug", "DB": "mongo"}
+    assert broker.ports == ["1027:1026"]
+    assert broker.config["labels"] == {"owner": "b"}
+    assert broker.healthcheck is None and "healthcheck" not in broker.config
+
+
+def test_the_cache_parses_again_a_modified_file(tmp_path):
+    compose, env_file = tmp_path / "compose.yml", tmp_path / ".env"
+    compose.write_text("services:\n  broker:\n    image: broker:${TAG}\n")
+    write_env_file(env_file, {"TAG": "1.0"})
+    cache = ComposeModelCache()
+
+    first = cache.get(files=[str(compose)], env_file=str(env_file))
+    assert cache.get(files=[str(compose)], env_file=str(env_file)) is first
+    assert cache.get(files=[str(compose)], env_file=str(env_file), variables={"TAG": "3.0"}) \
+        .services["broker"].image == "broker:3.0"
+
+    # The modification time decides, not the content, so it is moved forward explicitly
+    write_env_file(env_file, {"TAG": "2.0"})
+    utime(env_file, ns=(stat_ns(env_file) + 10 ** 9,) * 2)
+    second = cache.get(files=[str(compose)], env_file=str(env_file))
+
+    assert second is not first and second.services["broker"].image == "broker:2.0"
+
+    compose.write_text("services:\n  broker:\n    image: other:${TAG}\n")
+    utime(compose, ns=(stat_ns(compose) + 10 ** 9,) * 2)
+
+    assert cache.get(files=[str(compose)], env_file=str(env_file)).services["broker"].image == "other:2.0"
+
+
+def test_remap_ports_replaces_only_the_published_ports():
+    service = ServiceModel("broker", {"ports": ["1026:1026", "127.0.0.1:9090:9090/udp", "8080",
+                                                {"target": 27017, "published": "27017"},
+                                                {"target": 5432}]})
+    allocated = iter(range(20000, 20010))
+
+    def allocate(published, target):
+        return next(allocated)
+
+    assert service.published_ports() == [(1026, 1026), (9090, 9090), (27017, 27017)]
+    assert service.remap_ports(allocate) == ["20000:1026", "127.0.0.1:20001:9090/udp", "8080",
+                                             {"target": 27017, "published": "20002"}, {"target": 5432}]
+
+
+def test_named_volumes_skip_the_bind_mounts():
+    service = ServiceModel("db", {"volumes": ["data:/data/db", "./config:/config:ro", "/tmp:/tmp", "/anonymous",
+                                              {"type": "volume", "source": "logs", "target": "/logs"},
+                                              {"type": "bind", "source": "./certs", "target": "/certs"}]})
+
+    assert service.named_volumes() == [("data", "/data/db"), ("logs", "/logs")]
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from types import SimpleNamespace
+from components.diagnostics import DiagnosticsRecorder
+
+
+class Lines(list):
+    def close(self):
+        pass
+
+
+class Backend:
+    def list_containers(self, all=True, filters=None, health=True):
+        return [{"id": "c-orion", "name": "orion", "status": "exited", "health": "unhealthy"}]
+
+    def inspect_container(self, container_id):
+        return {"State": {"Status": "exited", "Health": {"Log": [{"ExitCode": 1}]}}, "RestartCount": 2,
+                "Config": {"Image": "fiware/orion-ld", "Env": ["MONGO_PASSWORD=secret"]}}
+
+    def container_logs(self, container_id, tail=None, since=None, follow=False):
+        return Lines([("2024-01-01T00:00:00Z", "Started")])
+
+
+def deployment(deployment_id):
+    engine = SimpleNamespace(backend=Backend(), get_project_name=lambda: deployment_id,
+                             get_container_names=lambda: {"orion": SimpleNamespace(name="orion")})
+
+    return SimpleNamespace(id=deployment_id, engine=engine,
+                           to_dict=lambda: {"id": deployment_id, "broker": "Orion-LD"})
+
+
+def test_a_deployment_gets_one_bundle_per_interval(tmp_path):
+    recorder = DiagnosticsRecorder(path=tmp_path, min_interval=60)
+    first = recorder.capture(deployment("a"), "timeout", "starting")
+
+    assert recorder.capture(deployment("a"), "failed", "unhealthy") is None
+    assert recorder.capture(deployment("b"), "failed", "unhealthy") is not None
+    assert [x["deployment"] for x in recorder.list()] == ["a", "b"]
+
+    bundle = recorder.get(first["id"])
+    orion = bundle["containers"]["orion"]
+
+    assert bundle["reason"] == "timeout" and orion["restart_count"] == 2 and orion["health_log"] == [{"ExitCode": 1}]
+    assert orion["logs"] == [{"time": "2024-01-01T00:00:00Z", "line": "Started"}]
+    assert "secret" not in str(bundle)
+
+
+def test_only_the_last_bundles_are_kept(tmp_path):
+    recorder = DiagnosticsRecorder(path=tmp_path, max_bundles=2, min_interval=0)
+
+    for x in ["a", "b", "c"]:
+        recorder.capture(deployment(x), "failed")
+
+    assert [x["deployment"] for x in recorder.list()] == ["b", "c"]
+    assert sorted(x.stem for x in tmp_path.glob('*.json')) == sorted(x["id"] for x in recorder.list())
+
+    # The index is rebuilt from the folder after a restart
+    assert DiagnosticsRecorder(path=tmp_path).list() == recorder.list()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from components.compose import aggregate_health_status
+
+
+def container(name, health, status="running"):
+    return {"name": name, "health": health, "status": status}
+
+
+def test_all_healthy():
+    status = [container("orion", "healthy"), container("mongo", "healthy")]
+
+    assert aggregate_health_status(status, expected=["orion", "mongo"])["status"] == "healthy"
+
+
+def test_no_containers_is_absent():
+    assert aggregate_health_status(list())["status"] == "absent"
+    assert aggregate_health_status(list(), expected=["orion", "mongo"])["status"] == "absent"
+
+
+def test_missing_container_is_starting():
+    response = aggregate_health_status([container("mongo", "healthy")], expected=["orion", "mongo"])
+
+    assert response["status"] == "starting"
+    assert response["missing"] == ["orion"]
+
+
+def test_unhealthy_wins_over_missing():
+    status = [container("mongo", "unhealthy")]
+
+    assert aggregate_health_status(status, expected=["orion", "mongo"])["status"] == "unhealthy"
+
+
+def test_unknown_and_starting():
+    assert aggregate_health_status([container("a", "unknown"), container("b", "healthy")])["status"] == "unknown"
+    assert aggregate_health_status([container("a", "starting"), container("b", "healthy")])["status"] == "starting"
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from components.health_monitor import HealthMonitor
+
+
+class Engine:
+    def __init__(self, *containers):
+        self.containers = list(containers)
+
+    def list_containers(self, all=True, filters=None, health=True):
+        return list(self.containers)
+
+
+class Listener:
+    def __init__(self):
+        self.transitions = list()
+
+    def publish(self, transition):
+        self.transitions.append(transition)
+
+
+def container(name, status="running", health="healthy"):
+    return {"id": f'c-{name}', "name": name, "status": status, "health": health,
+            "labels": {"com.docker.compose.project": "project"}}
+
+
+def monitor(engine):
+    result, listener = HealthMonitor(backend=engine), Listener()
+    result.attach(listener)
+
+    return result, listener
+
+
+def test_reconcile_publishes_only_the_changes():
+    engine = Engine(container("orion"), container("mongo", health="starting"))
+    health, listener = monitor(engine)
+    health.reconcile()
+    listener.transitions.clear()
+
+    # An event lost while the stream was down: mongo became healthy and orion was removed
+    engine.containers = [container("mongo"), container("scorpio", status="created", health="unknown")]
+    health.reconcile()
+
+    assert sorted(health.containers) == ["mongo", "scorpio"]
+    assert sorted((x["name"], x["previous_health"], x["health"], x["status"]) for x in listener.transitions) == [
+        ("mongo", "starting", "healthy", "running"),
+        ("orion", "healthy", None, "removed"),
+        ("scorpio", None, "unknown", "created")
+    ]
+
+
+def test_events_update_the_reconciled_table():
+    health, listener = monitor(Engine(container("orion", status="exited", health="unhealthy")))
+    health.reconcile()
+    listener.transitions.clear()
+
+    health.apply("start", "orion", {})
+    assert health.get("orion")["status"] == "running" and health.get("orion")["health"] == "starting"
+
+    health.apply("health_status: healthy", "orion", {})
+    health.apply("exec_start: sh", "orion", {})
+    health.apply("destroy", "orion", {})
+
+    assert health.get("orion") is None
+    assert [(x["health"], x["status"]) for x in listener.transitions] == [
+        ("starting", "running"), ("healthy", "running"), (None, "removed")
+    ]
+
+
+def test_an_event_without_change_is_not_a_transition():
+    health, listener = monitor(Engine(container("orion")))
+    health.reconcile()
+    listener.transitions.clear()
+
+    health.apply("health_status: healthy", "orion", {})
+
+    assert listener.transitions == list()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+import pytest
+from components.docker_backend import NativeBackend
+from components.exceptions import NoHealthyHost
+from components.hosts import DockerHost, HostPool
+from utils.fake_docker import FakeDocker
+
+GB = 1024 ** 3
+
+
+@pytest.fixture
+def remote_docker():
+    directory = mkdtemp(prefix="fake-remote-")
+    docker = FakeDocker(join(directory, "docker.sock")).start()
+
+    yield docker
+
+    docker.stop()
+    rmtree(directory, ignore_errors=True)
+
+
+def pool(*engines, failures=2):
+    return HostPool(hosts=[DockerHost(name=name, backend=NativeBackend(socket_path=engine.socket_path, timeout=2))
+                           for name, engine in engines],
+                    footprints={"Orion-LD": {"memory": GB, "cpus": 1.0}}, interval=0, failures=failures)
+
+
+def test_deployments_are_spread_by_reserved_memory(fake_docker, remote_docker):
+    hosts = pool(("local", fake_docker), ("remote", remote_docker))
+    hosts.check()
+
+    assert [hosts.place(x, "Orion-LD").name for x in ("a", "b", "c")] == ["local", "remote", "local"]
+
+
+def test_a_failed_host_is_not_used_until_it_recovers(fake_docker, remote_docker):
+    hosts = pool(("local", fake_docker), ("remote", remote_docker))
+    hosts.check()
+    remote_docker.stop()
+
+    # A single failed check does not exclude the host yet
+    hosts.check()
+    assert hosts.get("remote").healthy
+    hosts.check()
+    assert not hosts.get("remote").healthy and hosts.get("remote").error is not None
+
+    assert [hosts.place(x, "Orion-LD").name for x in ("a", "b")] == ["local", "local"]
+
+    remote_docker.start()
+    hosts.check()
+
+    assert hosts.get("remote").healthy
+    assert hosts.place("c", "Orion-LD").name == "remote"
+
+
+def test_no_healthy_host(fake_docker):
+    hosts = pool(("local", fake_docker), failures=1)
+    fake_docker.stop()
+    hosts.check()
+
+    with pytest.raises(NoHealthyHost):
+        hosts.place("a", "Orion-LD")
+
+    fake_docker.start()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from datetime import datetime
+from types import SimpleNamespace
+from components.journal import DeploymentJournal
+
+
+def deployment(deployment_id, broker="Stellio"):
+    return SimpleNamespace(id=deployment_id, broker=broker, project=None, prefix=None, path=None, host="local",
+                           ports=dict(), created=datetime.now())
+
+
+def test_replay_skips_released_deployments(tmp_path):
+    journal = DeploymentJournal(path=tmp_path / "journal.db")
+    journal.created(deployment("a"))
+    journal.created(deployment("b"))
+    journal.health("a", "starting")
+    journal.health("a", "healthy")
+    journal.released("b")
+
+    deployments = journal.replay()
+
+    assert list(deployments) == ["a"]
+    assert deployments["a"]["health"] == "healthy"
+    assert deployments["a"]["checked"] is not None
+
+
+def test_compact_keeps_the_last_creation_and_health(tmp_path):
+    journal = DeploymentJournal(path=tmp_path / "journal.db")
+    journal.created(deployment("a"))
+    journal.health("a", "starting")
+    journal.health("a", "healthy")
+    journal.created(deployment("b"))
+    journal.released("b")
+
+    assert journal.compact() == 3
+    assert journal.stats()["entries"] == 2
+    assert journal.replay()["a"]["health"] == "healthy"
+
+
+def test_compact_keeps_a_reused_identifier(tmp_path):
+    # The default deployment of a broker is cleaned and deployed again with the same identifier
+    journal = DeploymentJournal(path=tmp_path / "journal.db")
+    journal.created(deployment("Stellio"))
+    journal.released("Stellio")
+    journal.created(deployment("Stellio"))
+    journal.health("Stellio", "healthy")
+
+    assert list(journal.replay()) == ["Stellio"]
+    assert journal.compact() == 2
+    assert list(journal.replay()) == ["Stellio"]
+    assert journal.replay()["Stellio"]["health"] == "healthy"
+    journal.close()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from components.log_collector import LogCollector
+
+
+class Stream(list):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Engine:
+    def __init__(self, **logs):
+        self.logs = logs
+        self.requests = list()
+
+    def list_containers(self, all=True, filters=None, health=True):
+        return [{"id": f'c-{name}', "name": name} for name in self.logs]
+
+    def container_logs(self, container_id, tail=None, since=None, follow=False):
+        self.requests.append((container_id, tail, since))
+        # As the engine does, the since filter is inclusive
+        lines = [x for x in self.logs[container_id[2:]] if since is None or x[0] >= since]
+
+        return Stream(lines[-tail:])
+
+
+def line(second, text=None):
+    return f'2024-01-01T00:00:{second:02d}Z', text or f'line {second}'
+
+
+def test_the_buffer_keeps_the_last_lines():
+    engine = Engine(orion=[line(x) for x in range(10)])
+    collector = LogCollector({"local": engine}, lines=4, interval=0)
+
+    assert collector.collect() == 4
+    assert [x["line"] for x in collector.tail("orion")] == ["line 6", "line 7", "line 8", "line 9"]
+
+    engine.logs["orion"] += [line(x) for x in range(10, 13)]
+
+    assert collector.collect() == 3
+    assert [x["line"] for x in collector.tail("orion")] == ["line 9", "line 10", "line 11", "line 12"]
+    assert [x["time"] for x in collector.tail("orion", 2)] == [line(11)[0], line(12)[0]]
+    assert collector.stats()["lines"] == 4
+
+
+def test_the_lines_are_read_since_the_last_one_without_duplicates():
+    engine = Engine(orion=[line(1), line(2)])
+    collector = LogCollector({"local": engine}, interval=0)
+
+    assert collector.collect() == 2
+    # Nothing new, the engine returns again the last line collected
+    assert collector.collect() == 0
+
+    engine.logs["orion"].append(line(3))
+
+    assert collector.collect() == 1
+    assert [x["line"] for x in collector.tail("orion")] == ["line 1", "line 2", "line 3"]
+    assert [since for _, _, since in engine.requests] == [None, line(2)[0], line(2)[0]]
+
+
+def test_the_buffers_of_the_removed_containers_are_discarded():
+    engine = Engine(orion=[line(1)], mongo=[line(1)])
+    collector = LogCollector({"local": engine}, interval=0)
+    collector.collect()
+
+    del engine.logs["mongo"]
+    collector.collect()
+
+    assert collector.tail("mongo") == list() and len(collector.tail("orion")) == 1
+
+
+def test_the_long_lines_are_cut():
+    collector = LogCollector({"local": Engine(orion=[line(1, "x" * 100)])}, max_line=10, interval=0)
+    collector.collect()
+
+    assert collector.tail("orion")[0]["line"] == "x" * 10
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from io import StringIO
+from json import loads
+from logging import getLogger, DEBUG
+from api.custom_logging import BatchWriter, JsonLinesHandler
+
+
+class Stream(StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = list()
+
+    def write(self, data):
+        self.writes.append(data.count('\n'))
+        return super().write(data)
+
+
+def test_the_records_are_written_as_json_lines():
+    stream = Stream()
+    writer = BatchWriter([stream], flush_interval=0.01)
+    handler = JsonLinesHandler(writer)
+    log = getLogger("tests.json")
+    log.addHandler(handler)
+    log.setLevel(DEBUG)
+
+    try:
+        log.info("Deployment %s started", "Orion-LD")
+
+        try:
+            raise ValueError("no free port")
+        except ValueError:
+            log.exception("Deployment failed")
+    finally:
+        log.removeHandler(handler)
+        writer.close()
+
+    started, failed = [loads(x) for x in stream.getvalue().splitlines()]
+
+    assert started["level"] == "INFO" and started["message"] == "Deployment Orion-LD started"
+    assert started["caller"].startswith("tests.json:test_the_records_are_written_as_json_lines:")
+    assert started["time"].endswith("+00:00") and "exception" not in started
+    assert failed["level"] == "ERROR" and "ValueError: no free port" in failed["exception"]
+
+
+def test_the_pending_lines_are_written_in_batches():
+    stream = Stream()
+    writer = BatchWriter([stream], batch_size=10, flush_interval=0.01)
+
+    for x in range(100):
+        writer.write(f'{x}\n')
+    writer.close()
+
+    assert stream.getvalue().splitlines() == [str(x) for x in range(100)]
+    assert sum(stream.writes) == 100 and max(stream.writes) <= 10
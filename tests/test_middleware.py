@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from threading import Event
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from api.middleware import SecureHeadersMiddleware, ReadinessMiddleware, build_secure_headers
+
+
+def endpoint(request):
+    return PlainTextResponse("ok", headers={"Server": "uvicorn", "Cache-Control": "no-store", "X-Broker": "Orion-LD"})
+
+
+def test_the_security_headers_replace_the_endpoint_ones():
+    headers = build_secure_headers()
+    app = Starlette(routes=[Route("/work", endpoint)])
+    app.add_middleware(SecureHeadersMiddleware, headers=headers)
+    response = TestClient(app).get("/work")
+
+    for name, value in headers:
+        assert response.headers.get_list(name.decode()) == [value.decode()]
+
+    assert response.headers["server"] == "Secure" and response.headers["cache-control"] == "must-revalidate"
+    assert response.headers["x-broker"] == "Orion-LD"
+
+
+def test_the_requests_wait_for_the_services_with_503():
+    ready = Event()
+    app = Starlette(routes=[Route("/work", endpoint), Route("/ready", endpoint), Route("/docs/oauth", endpoint)])
+    app.add_middleware(ReadinessMiddleware, ready=ready, exempt=["/ready", "/docs"])
+    client = TestClient(app)
+
+    response = client.get("/work")
+    assert response.status_code == 503 and response.headers["retry-after"] == "1"
+    assert response.json() == {'message': 'The services are not ready, check GET /ready'}
+
+    assert client.get("/ready").status_code == 200 and client.get("/docs/oauth").status_code == 200
+    assert client.get("/readyz").status_code == 503
+
+    ready.set()
+    assert client.get("/work").status_code == 200
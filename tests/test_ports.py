@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from pathlib import Path
+from socket import socket, AF_INET, SOCK_STREAM
+import pytest
+from components.compose import Compose
+from components.deployments import DeploymentRegistry
+from components.exceptions import NoFreePort
+from components.hosts import DockerHost, HostPool
+from components.ports import PortAllocator
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    # The compose files of the brokers are referenced from the root of the repository
+    monkeypatch.chdir(Path(__file__).parents[1])
+    monkeypatch.setenv("ORION_LD_PORT", "1026")
+    monkeypatch.setenv("MONGO_DB_PORT", "27017")
+
+    hosts = HostPool(hosts=[DockerHost(name="local", backend=None, ports=PortAllocator(start=21000, end=21001)),
+                            DockerHost(name="remote", backend=None, host="tcp://remote:2375",
+                                       ports=PortAllocator(start=21000, end=21001, check=False))],
+                     interval=0)
+
+    return DeploymentRegistry(compose=Compose(backend=object()), path=tmp_path, hosts=hosts)
+
+
+def published(deployment):
+    return sorted(port["published"] for ports in deployment.ports.values() for port in ports)
+
+
+def test_every_host_allocates_its_own_ports(registry):
+    first = registry.acquire(broker="Orion-LD", deployment_id="first", remap_ports=True)
+    second = registry.acquire(broker="Orion-LD", deployment_id="second", remap_ports=True)
+
+    assert (first.host, second.host) == ("local", "remote")
+    assert published(first) == published(second) == [21000, 21001]
+
+
+def test_remote_ports_are_not_checked_on_the_local_host(registry):
+    with socket(AF_INET, SOCK_STREAM) as listener:
+        listener.bind(("0.0.0.0", 21000))
+
+        with pytest.raises(NoFreePort):
+            registry.acquire(broker="Orion-LD", deployment_id="first", remap_ports=True)
+
+        # The failed deployment gave back its port and its host reservation
+        assert registry.hosts.get("local").ports.allocated == set()
+        assert registry.hosts.get("local").deployments == dict()
+
+        registry.hosts.place("busy", "Orion-LD")
+        deployment = registry.acquire(broker="Orion-LD", deployment_id="second", remap_ports=True)
+
+    assert deployment.host == "remote"
+    assert published(deployment) == [21000, 21001]
+
+
+def test_release_gives_the_ports_back_to_the_host(registry):
+    first = registry.acquire(broker="Orion-LD", deployment_id="first", remap_ports=True)
+    registry.release(first)
+
+    assert registry.hosts.get("local").ports.allocated == set()
+    assert published(registry.acquire(broker="Orion-LD", deployment_id="again", remap_ports=True)) == [21000, 21001]
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from components.compose import Compose
+from components.docker_backend import NativeBackend
+from components.hosts import DockerHost, HostPool
+from components.prefetch import ImagePrefetcher
+
+
+TAGS = {"LEPUS_MONGO_DB_VERSION": "6.0", "MONGO_DB_VERSION": "6.0", "LEPUS_ORION_VERSION": "3.10.1",
+        "ORION_LD_VERSION": "1.6.0", "SCORPIO_VERSION": "4.1.15", "STELLIO_DOCKER_TAG": "2.17.2"}
+
+
+@pytest.fixture
+def prefetcher(fake_docker, repository, monkeypatch):
+    # The .env file of the composes is not part of the repository, the shell environment gives the tags
+    for name, tag in TAGS.items():
+        monkeypatch.setenv(name, tag)
+
+    backend = NativeBackend(socket_path=fake_docker.socket_path, timeout=5)
+    hosts = HostPool(hosts=[DockerHost(name="local", backend=backend)], interval=0)
+    prefetcher = ImagePrefetcher(compose=Compose(backend=backend), hosts=hosts, workers=4, interval=0,
+                                 on_start=False)
+
+    for image in prefetcher.images():
+        fake_docker.publish(image, size=1024, duration=0.3)
+
+    yield prefetcher
+
+    prefetcher.stop()
+
+
+def test_images_shared_by_brokers_are_listed_once(prefetcher):
+    images = prefetcher.images(["Lepus", "Orion-LD"])
+
+    shared = [image for image, brokers in images.items() if brokers == ["Lepus", "Orion-LD"]]
+    assert shared == ["mongo:6.0"]
+
+
+def test_concurrent_prefetches_pull_each_image_once(prefetcher, fake_docker):
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        reports = list(executor.map(lambda _: prefetcher.prefetch(), range(3)))
+
+    images = prefetcher.images()
+    assert all(fake_docker.pulls[fake_docker.reference(image)] == 1 for image in images)
+    assert all(report["failed"] == 0 and report["pulled"] == len(images) for report in reports)
+    assert prefetcher.stats()["running"] == 0
+
+
+def test_present_images_are_not_pulled_again(prefetcher, fake_docker):
+    prefetcher.prefetch(["Orion-LD"])
+    report = prefetcher.prefetch(["Orion-LD"])
+
+    assert report["pulled"] == 0 and report["present"] == report["images"]
+    assert all(count == 1 for count in fake_docker.pulls.values())
+
+    report = prefetcher.prefetch(["Orion-LD"], force=True)
+
+    assert report["pulled"] == report["images"]
+    assert all(count == 2 for count in fake_docker.pulls.values())
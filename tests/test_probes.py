@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from asyncio import run
+from types import SimpleNamespace
+from httpx import AsyncClient, MockTransport, Response
+from components.probes import ReadinessProber
+
+
+def engine(broker="Orion-LD", ports=(("1026", "1026"),), address=None):
+    model = SimpleNamespace(services={"orion": SimpleNamespace(published_ports=lambda: list(ports))})
+    host = SimpleNamespace(address=address) if address is not None else None
+
+    return SimpleNamespace(broker=broker, model=model, host=host)
+
+
+def prober(statuses):
+    result, requested = ReadinessProber(), list()
+    statuses = iter(statuses)
+
+    def handler(request):
+        requested.append(str(request.url))
+        return Response(next(statuses))
+
+    run(result.client.aclose())
+    result.client = AsyncClient(transport=MockTransport(handler))
+
+    return result, requested
+
+
+def test_the_backoff_grows_up_to_the_maximum():
+    probes = ReadinessProber(initial_backoff=0.05, max_backoff=1)
+
+    assert [probes.backoff(x) for x in range(7)] == [0.05, 0.1, 0.2, 0.4, 0.8, 1, 1]
+
+
+def test_the_broker_is_ready_once_the_endpoint_answers():
+    probes, requested = prober([503, 200])
+
+    async def main():
+        try:
+            return [await probes.probe(engine()), await probes.probe(engine())]
+        finally:
+            await probes.close()
+
+    first, second = run(main())
+
+    assert not first["ready"] and first["probes"][0]["status_code"] == 503
+    assert second["ready"] and second["probes"][0]["status_code"] == 200
+    assert requested == ["http://localhost:1026/ngsi-ld/v1/types"] * 2
+
+
+def test_a_remote_deployment_is_probed_at_its_host():
+    probes, requested = prober([200])
+
+    async def main():
+        try:
+            return await probes.probe(engine(address="10.0.0.2"))
+        finally:
+            await probes.close()
+
+    assert run(main())["ready"]
+    assert requested == ["http://10.0.0.2:1026/ngsi-ld/v1/types"]
+
+
+def test_a_service_without_published_port_is_not_ready():
+    probes, requested = prober([])
+
+    async def main():
+        try:
+            return await probes.probe(engine(ports=()))
+        finally:
+            await probes.close()
+
+    result = run(main())
+
+    assert not result["ready"] and result["probes"][0]["error"] == "No published port"
+    assert requested == list()
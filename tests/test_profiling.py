@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from asyncio import run, sleep
+from time import sleep as block
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from api.middleware import TracingMiddleware
+from components.profiling import LoopLagMonitor, TraceRecorder, span
+
+
+def traced_app(trace_all):
+    def endpoint(request):
+        with span("work"):
+            return PlainTextResponse("ok")
+
+    recorder = TraceRecorder()
+    app = Starlette(routes=[Route("/work", endpoint)])
+    app.add_middleware(TracingMiddleware, recorder=recorder, trace_all=trace_all)
+
+    return TestClient(app), recorder
+
+
+def test_every_request_is_traced_with_profiling_enabled():
+    client, recorder = traced_app(trace_all=True)
+    response = client.get("/work")
+
+    trace = recorder.get(response.headers["x-trace-id"])
+    assert [x["name"] for x in trace["spans"]] == ["work"] and trace["profile"] is None
+
+
+def test_only_the_profiled_requests_are_traced_with_profiling_disabled():
+    client, recorder = traced_app(trace_all=False)
+
+    assert "x-trace-id" not in client.get("/work").headers
+    assert "x-trace-id" not in client.get("/work", headers={"X-Profile": "0"}).headers
+    assert recorder.list()["recent"] == list()
+
+    response = client.get("/work", headers={"X-Profile": "1"})
+    trace = recorder.get(response.headers["x-trace-id"])
+
+    assert trace["path"] == "/work" and trace["profile"]["interval"] == 0.005
+
+
+def test_a_stall_is_captured_with_the_blocking_stack_and_requests():
+    recorder = TraceRecorder()
+    monitor = LoopLagMonitor(threshold=0.1, interval=0.01, recorder=recorder)
+
+    def blocking_docker_call():
+        block(0.4)
+
+    async def main():
+        monitor.start()
+        try:
+            await sleep(0.05)
+            trace = recorder.begin("POST", "/init")
+            blocking_docker_call()
+            recorder.end(trace, 201)
+            await sleep(0.05)
+        finally:
+            monitor.stop()
+
+    run(main())
+    stall, = monitor.stats()["stalls"]
+
+    assert stall["lag"] >= 0.3
+    assert any(" in blocking_docker_call: " in x for x in stall["stack"])
+    assert [(x["method"], x["path"]) for x in stall["requests"]] == [("POST", "/init")]
+
+
+def test_only_the_last_stalls_are_kept():
+    monitor = LoopLagMonitor(threshold=0.1, interval=0.01, max_stalls=1)
+
+    async def main():
+        monitor.start()
+        try:
+            for duration in (0.4, 0.3):
+                await sleep(0.05)
+                block(duration)
+            await sleep(0.05)
+        finally:
+            monitor.stop()
+
+    run(main())
+    stats = monitor.stats()
+
+    # Only the last stall is kept, the shorter one
+    assert stats["stalls_total"] == 2 and stats["max_lag"] >= 0.4 - 0.05
+    assert len(stats["stalls"]) == 1 and stats["stalls"][0]["lag"] < 0.4
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from components.compose import Compose
+from components.deployments import DeploymentRegistry, label_deployment
+from components.docker_backend import NativeBackend
+from components.hosts import DockerHost, HostPool
+from components.journal import DeploymentJournal
+
+
+def registry(path, backend):
+    hosts = HostPool(hosts=[DockerHost(name="local", backend=backend)], interval=0)
+
+    return DeploymentRegistry(compose=Compose(backend=backend), path=path.joinpath("deployments"), hosts=hosts,
+                              journal=DeploymentJournal(path=path.joinpath("journal.db")))
+
+
+def start(docker, deployment, health="healthy"):
+    for name in deployment.engine.get_container_names():
+        docker.add_container(name, health=health, labels={label_deployment: deployment.id})
+
+
+def test_restore_registers_the_deployments_not_released(tmp_path, fake_docker, repository):
+    backend = NativeBackend(socket_path=fake_docker.socket_path)
+    before = registry(tmp_path, backend)
+
+    running = before.acquire(broker="Orion-LD", deployment_id="running")
+    stopped = before.acquire(broker="Orion-LD", deployment_id="stopped")
+    cleaned = before.acquire(broker="Orion-LD", deployment_id="cleaned")
+    start(fake_docker, running)
+    before.release(cleaned)
+    before.journal.close()
+
+    # A new run of the service with the same journal and the containers left running
+    after = registry(tmp_path, backend)
+    report = after.restore()
+
+    assert report == {"restored": {"running": "healthy", "stopped": "absent"}, "skipped": list()}
+    assert sorted(after.live()) == ["running", "stopped"]
+    assert after.get("running").host == "local"
+    assert after.hosts.get("local").deployments.keys() == {"running", "stopped"}
+
+
+def test_restore_compacts_the_journal(tmp_path, fake_docker, repository):
+    backend = NativeBackend(socket_path=fake_docker.socket_path)
+    before = registry(tmp_path, backend)
+
+    deployment = before.acquire(broker="Orion-LD", deployment_id="a")
+    start(fake_docker, deployment)
+    for status in ("starting", "unhealthy", "starting", "healthy"):
+        before.observe(deployment, status)
+    before.release(before.acquire(broker="Orion-LD", deployment_id="b"))
+    assert before.journal.stats()["entries"] == 7
+    before.journal.close()
+
+    after = registry(tmp_path, backend)
+    after.restore()
+
+    # The creation and the last health of the deployment alive, nothing of the released one. The health read
+    # by the restore did not change, it is not journaled again
+    assert after.journal.stats()["entries"] == 2
+    assert after.get("a").health == "healthy"
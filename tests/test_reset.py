@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from pathlib import Path
+import pytest
+from components.compose import Compose
+from components.reset import ResetDriver, MongoReset, PostgresReset, KafkaReset, RestartReset, reset_drivers
+
+
+class FakeExecutor:
+    """
+    Stand-in of ComposeExecutor recording the commands, the outputs are answered by the first word of the command.
+    """
+    def __init__(self, outputs=None):
+        self.outputs = outputs or dict()
+        self.commands = list()
+        self.restarted = list()
+
+    def execute(self, service, command):
+        self.commands.append((service, command))
+        return self.outputs.get(command[0], '')
+
+    def restart(self, service):
+        self.restarted.append(service)
+
+
+def test_reset_driver_is_abstract():
+    with pytest.raises(TypeError):
+        ResetDriver(service="mongo")
+
+
+def test_mongo_drops_the_databases_but_the_system_ones():
+    executor = FakeExecutor()
+    MongoReset(service="mongo-db").reset(executor, environment=dict())
+
+    [(service, command)] = executor.commands
+    assert service == "mongo-db"
+    assert command[:2] == ["sh", "-c"]
+    assert "mongosh" in command[2] and "|| mongo " in command[2]
+    assert "dropDatabase" in command[2] and "['admin', 'config', 'local']" in command[2]
+
+
+def test_postgres_truncates_every_database_resolved_from_the_environment():
+    executor = FakeExecutor(outputs={"psql": "DO"})
+    driver = PostgresReset(service="stellio-postgres", user="${POSTGRES_USER}",
+                           databases=["${SEARCH_DB}", "subscription"])
+
+    output = driver.reset(executor, environment={"POSTGRES_USER": "stellio", "SEARCH_DB": "stellio_search"})
+
+    assert output == "DO\nDO"
+    assert [command[:5] for _, command in executor.commands] == [
+        ["psql", "-U", "stellio", "-d", "stellio_search"],
+        ["psql", "-U", "stellio", "-d", "subscription"]
+    ]
+    assert all(command[-1] == PostgresReset.sql for _, command in executor.commands)
+
+
+def test_kafka_deletes_the_topics_in_a_single_call():
+    executor = FakeExecutor(outputs={"kafka-topics": "__consumer_offsets\ncim.entity._CatchAll\nentities\n"})
+    KafkaReset(service="stellio-kafka").reset(executor, environment=dict())
+
+    listing, delete = executor.commands
+    assert "--list" in listing[1]
+    assert delete[1][-3:] == ["--delete", "--topic", r"cim\.entity\._CatchAll|entities"]
+
+
+def test_kafka_without_topics_does_not_delete():
+    executor = FakeExecutor(outputs={"kafka-topics": "__consumer_offsets\n"})
+
+    assert KafkaReset(service="stellio-kafka").reset(executor, environment=dict()) == ''
+    assert len(executor.commands) == 1
+
+
+def test_restart_restarts_the_service():
+    executor = FakeExecutor()
+    RestartReset(service="yanb").reset(executor, environment=dict())
+
+    assert executor.restarted == ["yanb"] and executor.commands == list()
+
+
+@pytest.mark.parametrize("broker", sorted(reset_drivers))
+def test_the_drivers_target_services_of_the_broker(broker, monkeypatch):
+    # The compose files of the brokers are referenced from the root of the repository
+    monkeypatch.chdir(Path(__file__).parents[1])
+    engine = Compose(backend=object()).session(broker=broker)
+    executor = FakeExecutor()
+
+    drivers = engine.reset(executor=executor)
+
+    services = set(engine.model.services)
+    assert [x["service"] for x in drivers] == [driver.service for driver in reset_drivers[broker]]
+    assert {service for service, _ in executor.commands} | set(executor.restarted) <= services
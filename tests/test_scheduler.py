@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from functools import partial
+from time import sleep
+import pytest
+from components.exceptions import AdmissionRejected
+from components.hosts import DockerHost, HostPool
+from components.jobs import JobManager, JobStatus
+from components.scheduler import AdmissionScheduler, HostAdmission
+
+GB = 1 << 30
+
+
+class Engine:
+    def __init__(self, memory, cpus=4):
+        self.resources = {"memory": memory, "cpus": cpus}
+
+    def info(self):
+        return self.resources
+
+    def list_containers(self, all=True, filters=None, health=True):
+        return list()
+
+
+def admission(tmp_path):
+    footprints = {"Orion-LD": {"memory": 2 * GB, "cpus": 1.0}}
+    hosts = HostPool(hosts=[DockerHost(name="small", backend=Engine(memory=1 * GB)),
+                            DockerHost(name="large", backend=Engine(memory=16 * GB), host="tcp://large:2375")],
+                     footprints=footprints, interval=0)
+
+    return hosts, HostAdmission(hosts=hosts, factory=lambda host: AdmissionScheduler(
+        backend=host.backend, footprints=footprints, path=tmp_path / f'{host.name}.json', reserve=0, name=host.name))
+
+
+def test_request_uses_the_resources_of_the_host_of_the_deployment(tmp_path):
+    hosts, scheduler = admission(tmp_path)
+    hosts.assign("a", "small", "Orion-LD")
+    hosts.assign("b", "large", "Orion-LD")
+
+    with pytest.raises(AdmissionRejected):
+        scheduler.request(broker="Orion-LD", deployment_id="a")
+
+    assert scheduler.request(broker="Orion-LD", deployment_id="b").status == "admitted"
+    assert [x["deployment"] for x in scheduler.stats()["large"]["admitted"]] == ["b"]
+    assert scheduler.stats()["small"]["admitted"] == []
+
+
+def test_release_after_the_host_released_the_deployment(tmp_path):
+    hosts, scheduler = admission(tmp_path)
+    hosts.assign("b", "large", "Orion-LD")
+    scheduler.request(broker="Orion-LD", deployment_id="b")
+
+    hosts.release("b")
+    scheduler.release("b")
+
+    assert scheduler.stats()["large"]["admitted"] == []
+
+
+def test_a_queued_job_rejected_after_max_wait_runs_its_clean_up(tmp_path):
+    footprints = {"Orion-LD": {"memory": 2 * GB, "cpus": 1.0}}
+    scheduler = AdmissionScheduler(backend=Engine(memory=3 * GB), footprints=footprints, path=tmp_path / "local.json",
+                                   reserve=0, max_wait=0.1, interval=0.05)
+    jobs = JobManager(workers=1)
+    released = list()
+
+    def submit(deployment):
+        return jobs.submit("init", "Orion-LD", lambda job: None, deployment=deployment,
+                           admission=partial(scheduler.request, broker="Orion-LD", deployment_id=deployment),
+                           on_reject=partial(released.append, deployment))
+
+    scheduler.start()
+    try:
+        admitted, queued = submit("a"), submit("b")
+        assert queued.status == JobStatus.QUEUED
+
+        for _ in range(100):
+            if queued.status == JobStatus.FAILED:
+                break
+            sleep(0.05)
+    finally:
+        scheduler.stop()
+        jobs.shutdown(wait=True)
+
+    assert admitted.status == JobStatus.SUCCEEDED
+    assert queued.error["type"] == "AdmissionRejected" and released == ["b"]
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from asyncio import run, sleep, gather
+from time import sleep as block
+from api.services import Services
+
+
+class SlowPool:
+    def __init__(self):
+        self.stopped = False
+
+    def shutdown(self):
+        # The compose down of the standby deployments
+        block(0.3)
+        self.stopped = True
+
+
+def test_the_blocking_stops_do_not_block_the_event_loop():
+    services = Services()
+    services.instances["pool"] = SlowPool()
+    ticks = list()
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(services.instances["pool"].stopped)
+            await sleep(0.02)
+
+    async def main():
+        await gather(services.stop(), ticker())
+
+    run(main())
+
+    assert services.instances["pool"].stopped and ticks == [False] * 5
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from time import time
+from types import SimpleNamespace
+from components.deployments import label_deployment, label_created
+from components.hosts import DockerHost, HostPool
+from components.sweeper import OrphanSweeper
+
+
+class Engine:
+    def __init__(self, *deployments):
+        created = str(int(time()) - 7200)
+        self.containers = [{"id": f'c-{x}', "name": f'{x}-orion', "labels": {label_deployment: x,
+                                                                             label_created: created}}
+                           for x in deployments]
+        self.removed = list()
+
+    def list_containers(self, all=False, filters=None, health=True):
+        return [x for x in self.containers if x["id"] not in self.removed]
+
+    def list_volumes(self, filters=None):
+        return list()
+
+    def list_networks(self, filters=None):
+        return list()
+
+    def remove_container(self, container_id):
+        self.removed.append(container_id)
+
+
+def sweeper(engines, alive=(), released=(), journal=None):
+    hosts = HostPool(hosts=[DockerHost(name=name, backend=engine) for name, engine in engines.items()], interval=0)
+    registry = SimpleNamespace(live=lambda: set(alive), retired=lambda: set(released), journal=journal)
+
+    return OrphanSweeper(hosts=hosts, registry=registry, ttl=3600, interval=0)
+
+
+def test_every_host_is_swept():
+    local, remote = Engine("a"), Engine("b")
+    report = sweeper({"local": local, "remote": remote}, released=["a", "b"]).sweep()
+
+    assert sorted((x["host"], x["deployment"]) for x in report["containers"]) == [("local", "a"), ("remote", "b")]
+    assert local.removed == ["c-a"] and remote.removed == ["c-b"]
+
+
+def test_without_journal_only_the_released_deployments_are_swept():
+    engine = Engine("Orion-LD", "released", "alive")
+    report = sweeper({"local": engine}, alive=["alive"], released=["released"]).sweep()
+
+    assert [x["deployment"] for x in report["containers"]] == ["released"]
+
+
+def test_with_journal_the_unknown_deployments_are_swept():
+    engine = Engine("Orion-LD", "alive")
+    report = sweeper({"local": engine}, alive=["alive"], journal=object()).sweep(dry_run=True)
+
+    assert [x["deployment"] for x in report["containers"]] == ["Orion-LD"]
+    assert engine.removed == list()
+
+
+def test_an_unreachable_host_does_not_stop_the_sweep():
+    class Down(Engine):
+        def list_containers(self, all=False, filters=None, health=True):
+            raise ConnectionError("engine down")
+
+    report = sweeper({"down": Down("a"), "local": Engine("b")}, released=["a", "b"]).sweep()
+
+    assert list(report["unreachable"]) == ["down"]
+    assert [x["deployment"] for x in report["containers"]] == ["b"]
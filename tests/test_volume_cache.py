@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+from components.volume_cache import VolumeCache
+
+
+def test_a_snapshot_is_claimed_once(tmp_path):
+    cache = VolumeCache(path=tmp_path, brokers=["Stellio"])
+
+    assert cache.claim("stellio-1")
+    assert not cache.claim("stellio-1")
+    assert cache.claim("stellio-2")
+
+    cache.unclaim("stellio-1")
+    assert cache.claim("stellio-1")
+
+
+def test_a_cached_snapshot_is_not_claimed(tmp_path):
+    cache = VolumeCache(path=tmp_path, brokers=["Stellio"])
+    cache.entries["stellio-1"] = {"volumes": dict(), "bytes": 0, "used": 0, "created": 0}
+
+    assert not cache.claim("stellio-1")
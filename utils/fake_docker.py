@@ -0,0 +1,482 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+##
+# Copyright 2023 FIWARE Foundation, e.V.
+#
+# This file is part of IoTAgent-SDMX (RDF Turtle)
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+##
+"""Stand-in Docker Engine API served over a unix socket
+
+Implements the subset of the Engine API used by components.docker_backend (containers, inspect, logs, events,
+volumes, networks and images) over an in-memory state, so the backends can be exercised and benchmarked without a
+docker engine. The images published in its registry stand-in are pulled at a configurable speed. The docker CLI can also talk to it (DOCKER_HOST=unix://<socket>) for the read operations.
+"""
+from http.server import BaseHTTPRequestHandler
+from json import dumps, loads
+from os import unlink
+from os.path import exists
+from queue import Queue, Empty
+from re import compile
+from socket import SHUT_RDWR
+from socketserver import ThreadingUnixStreamServer
+from threading import Thread, Lock, Timer
+from datetime import datetime, timezone
+from time import time, sleep
+from urllib.parse import urlparse, parse_qs, unquote
+from uuid import uuid4
+
+version_prefix = compile(r'^/v[0-9.]+')
+
+
+class FakeDocker:
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.containers = dict()
+        self.volumes = dict()
+        self.networks = dict()
+        self.subscribers = list()
+        self.followers = list()
+        self.images = dict()
+        self.registry = dict()
+        self.pulls = dict()
+        self.lock = Lock()
+        self.connections = set()
+        self.server = None
+        self.thread = None
+
+    def add_container(self, name, status="running", health=None, labels=None, memory=0):
+        container_id = uuid4().hex + uuid4().hex
+        with self.lock:
+            self.containers[container_id] = {"Id": container_id, "Name": name, "Status": status, "Health": health,
+                                             "Labels": labels or dict(), "Created": int(time()), "Memory": memory,
+                                             "Logs": list()}
+        self.emit("create", container_id)
+
+        return container_id
+
+    def set_state(self, container_id, action, status=None, health=None):
+        """
+        Change the state of a container and publish the docker event, e.g. ("health_status: healthy", health="healthy")
+        """
+        with self.lock:
+            container = self.containers[container_id]
+            container["Status"] = status or container["Status"]
+            container["Health"] = health or container["Health"]
+        self.emit(action, container_id)
+
+    def log(self, container_id, text, stream=1):
+        """
+        Append a line to the logs of a container, stream 1 is stdout and 2 stderr.
+        """
+        line = (time(), stream, text)
+        with self.lock:
+            self.containers[container_id]["Logs"].append(line)
+
+        for follower in list(self.followers):
+            follower.put((container_id, line))
+
+    def publish(self, image, size=0, layers=3, duration=0.0):
+        """
+        Make an image available in the registry stand-in, its pull takes duration seconds.
+
+        :param image: image reference, e.g. "mongo:4.4"
+        """
+        self.registry[self.reference(image)] = {"size": size, "layers": layers, "duration": duration}
+
+    def add_image(self, image, size=0):
+        image = self.reference(image)
+        self.images[image] = {"Id": f'sha256:{uuid4().hex}{uuid4().hex}', "RepoTags": [image], "Size": size}
+
+    @staticmethod
+    def reference(image):
+        # The engine and the registries use the latest tag for the references without tag or digest
+        return image if '@' in image or ':' in image.rsplit('/', 1)[-1] else f'{image}:latest'
+
+    def add_volume(self, name, labels=None, size=0):
+        self.volumes[name] = {"Name": name, "Labels": labels or dict(), "CreatedAt": "2023-01-01T00:00:00Z",
+                              "UsageData": {"Size": size, "RefCount": 0}}
+
+    def add_network(self, name, labels=None):
+        network_id = uuid4().hex
+        self.networks[network_id] = {"Name": name, "Id": network_id, "Labels": labels or dict(),
+                                     "Created": "2023-01-01T00:00:00Z"}
+
+    def emit(self, action, container_id, container=None):
+        container = container or self.containers[container_id]
+        event = {"Type": "container", "Action": action, "status": action, "id": container_id, "time": int(time()),
+                 "Actor": {"ID": container_id, "Attributes": {"name": container["Name"], **container["Labels"]}}}
+
+        for subscriber in list(self.subscribers):
+            subscriber.put(event)
+
+    def start(self):
+        if exists(self.socket_path):
+            unlink(self.socket_path)
+
+        fake = self
+
+        class Handler(FakeDockerHandler):
+            docker = fake
+
+        self.server = ThreadingUnixStreamServer(self.socket_path, Handler)
+        self.server.daemon_threads = True
+        self.thread = Thread(target=self.server.serve_forever, name="fake-docker", daemon=True)
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        for subscriber in list(self.subscribers):
+            subscriber.put(None)
+        self.server.shutdown()
+        self.server.server_close()
+
+        # A stopped engine does not answer on the persistent connections of its clients either
+        for connection in list(self.connections):
+            try:
+                connection.shutdown(SHUT_RDWR)
+            except OSError:
+                pass
+
+        unlink(self.socket_path)
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    docker = None
+
+    def setup(self):
+        super().setup()
+        self.docker.connections.add(self.connection)
+
+    def finish(self):
+        self.docker.connections.discard(self.connection)
+        super().finish()
+
+    def address_string(self):
+        return "fake-docker"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._send(200, b'', content_type="text/plain")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = version_prefix.sub('', url.path)
+        query = parse_qs(url.query)
+        filters = loads(query.get("filters", ["{}"])[0])
+
+        if path == "/_ping":
+            self._send(200, b'OK', content_type="text/plain")
+        elif path == "/info":
+            self._json({"NCPU": 8, "MemTotal": 16 * 1024 ** 3, "ServerVersion": "24.0.0"})
+        elif path.startswith("/containers/") and path.endswith("/stats"):
+            container = self._find(path[len("/containers/"):-len("/stats")])
+            if container is None:
+                self._json({"message": "No such container"}, status=404)
+            else:
+                self._json({"memory_stats": {"usage": container.get("Memory", 0), "stats": {"inactive_file": 0}},
+                            "cpu_stats": {"cpu_usage": {"total_usage": 0}, "system_cpu_usage": 0,
+                                          "online_cpus": 8},
+                            "precpu_stats": {"cpu_usage": {"total_usage": 0}, "system_cpu_usage": 0}})
+        elif path == "/version":
+            self._json({"Version": "24.0.0", "ApiVersion": "1.43", "MinAPIVersion": "1.12", "Os": "linux"})
+        elif path == "/containers/json":
+            containers = [x for x in self.docker.containers.values() if self._match(x["Labels"], filters)]
+            if query.get("all", ["0"])[0] in ("0", "false"):
+                containers = [x for x in containers if x["Status"] == "running"]
+            self._json([self._summary(x) for x in containers])
+        elif path.startswith("/containers/") and path.endswith("/logs"):
+            container = self._find(path[len("/containers/"):-len("/logs")])
+            if container is None:
+                self._json({"message": "No such container"}, status=404)
+            else:
+                self._logs(container, query)
+        elif path.startswith("/images/") and path.endswith("/json"):
+            image = self.docker.images.get(self.docker.reference(unquote(path[len("/images/"):-len("/json")])))
+            if image is None:
+                self._json({"message": "No such image"}, status=404)
+            else:
+                self._json(image)
+        elif path.startswith("/containers/") and path.endswith("/json"):
+            container = self._find(path[len("/containers/"):-len("/json")])
+            if container is None:
+                self._json({"message": "No such container"}, status=404)
+            else:
+                self._json(self._inspect(container))
+        elif path == "/volumes":
+            volumes = [x for x in self.docker.volumes.values() if self._match(x["Labels"], filters)]
+            self._json({"Volumes": volumes, "Warnings": None})
+        elif path == "/networks":
+            self._json([x for x in self.docker.networks.values() if self._match(x["Labels"], filters)])
+        elif path == "/system/df":
+            self._json({"Volumes": list(self.docker.volumes.values())})
+        elif path == "/events":
+            self._events()
+        else:
+            self._json({"message": f"page not found: {path}"}, status=404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        path = version_prefix.sub('', url.path)
+        query = parse_qs(url.query)
+
+        if path == "/images/create":
+            self._pull(query["fromImage"][0], query.get("tag", ["latest"])[0])
+        else:
+            self._json({"message": f"page not found: {path}"}, status=404)
+
+    def do_DELETE(self):
+        path = version_prefix.sub('', urlparse(self.path).path)
+
+        if path.startswith("/containers/"):
+            container = self._find(path[len("/containers/"):])
+            if container is None:
+                self._json({"message": "No such container"}, status=404)
+            else:
+                with self.docker.lock:
+                    del self.docker.containers[container["Id"]]
+                self.docker.emit("destroy", container["Id"], container)
+                self._send(204, b'')
+        elif path.startswith("/volumes/") and self.docker.volumes.pop(path[len("/volumes/"):], None) is not None:
+            self._send(204, b'')
+        elif path.startswith("/networks/"):
+            key = path[len("/networks/"):]
+            found = [x for x, y in self.docker.networks.items() if key in (x, y["Name"])]
+            for network_id in found:
+                del self.docker.networks[network_id]
+            self._send(204, b'') if found else self._json({"message": "No such network"}, status=404)
+        else:
+            self._json({"message": "No such resource"}, status=404)
+
+    def _events(self):
+        queue = Queue()
+        self.docker.subscribers.append(queue)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        try:
+            while True:
+                try:
+                    event = queue.get(timeout=1)
+                except Empty:
+                    continue
+                if event is None:
+                    break
+                data = dumps(event).encode() + b'\n'
+                self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+        except OSError:
+            pass
+        finally:
+            self.docker.subscribers.remove(queue)
+            self.close_connection = True
+
+    def _logs(self, container, query):
+        since = float(query.get("since", ["0"])[0])
+        tail = query.get("tail", ["all"])[0]
+        follow = query.get("follow", ["0"])[0] in ("1", "true")
+        queue = Queue()
+
+        if follow:
+            self.docker.followers.append(queue)
+
+        lines = [x for x in container["Logs"] if x[0] > since]
+        if tail != "all":
+            lines = lines[len(lines) - min(len(lines), int(tail)):]
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.docker.multiplexed-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(line):
+            at, stream, text = line
+            stamp = datetime.fromtimestamp(at, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f000Z')
+            payload = f'{stamp} {text}\n'.encode()
+            data = bytes([stream, 0, 0, 0]) + len(payload).to_bytes(4, "big") + payload
+            self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+            self.wfile.flush()
+
+        try:
+            for line in lines:
+                write(line)
+
+            while follow and container["Id"] in self.docker.containers:
+                try:
+                    container_id, line = queue.get(timeout=0.2)
+                except Empty:
+                    continue
+                if container_id == container["Id"]:
+                    write(line)
+
+            self.wfile.write(b'0\r\n\r\n')
+        except OSError:
+            pass
+        finally:
+            if follow:
+                self.docker.followers.remove(queue)
+                self.close_connection = True
+
+    def _pull(self, repository, tag):
+        image = f'{repository}@{tag}' if tag.startswith("sha256:") else f'{repository}:{tag}'
+        published = self.docker.registry.get(image)
+
+        if published is None:
+            self._json({"message": f"manifest for {image} not found: manifest unknown"}, status=404)
+            return
+
+        with self.docker.lock:
+            self.docker.pulls[image] = self.docker.pulls.get(image, 0) + 1
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(progress):
+            data = dumps(progress).encode() + b'\r\n'
+            self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+            self.wfile.flush()
+
+        # The layers are downloaded one after another, each one in two progress steps
+        layers, size = published["layers"], published["size"]
+        write({"status": f"Pulling from {repository}", "id": tag})
+        for layer in range(layers):
+            total = size // layers + (size % layers if layer == 0 else 0)
+            for current in (total // 2, total):
+                sleep(published["duration"] / layers / 2)
+                write({"status": "Downloading", "id": f'layer{layer}',
+                       "progressDetail": {"current": current, "total": total}})
+            write({"status": "Pull complete", "id": f'layer{layer}', "progressDetail": {}})
+
+        self.docker.add_image(image, size=size)
+        write({"status": f"Status: Downloaded newer image for {image}"})
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _find(self, key):
+        for container in self.docker.containers.values():
+            if key in (container["Id"], container["Id"][:12], container["Name"]):
+                return container
+
+        return None
+
+    @staticmethod
+    def _match(labels, filters):
+        for label in filters.get("label", list()):
+            key, _, value = label.partition('=')
+            if key not in labels or (value and labels[key] != value):
+                return False
+
+        return True
+
+    @staticmethod
+    def _summary(container):
+        health = f' ({container["Health"]})' if container["Health"] and container["Status"] == "running" else ''
+        status = f'Up 1 minute{health}' if container["Status"] == "running" else 'Exited (1) 1 minute ago'
+
+        return {"Id": container["Id"], "Names": [f'/{container["Name"]}'], "State": container["Status"],
+                "Status": status, "Labels": container["Labels"], "Created": container["Created"]}
+
+    @staticmethod
+    def _inspect(container):
+        state = {"Status": container["Status"], "Running": container["Status"] == "running"}
+        if container["Health"]:
+            failing = 3 if container["Health"] == "unhealthy" else 0
+            state["Health"] = {"Status": container["Health"], "FailingStreak": failing,
+                               "Log": [{"Start": "2023-01-01T00:00:00Z", "End": "2023-01-01T00:00:01Z",
+                                        "ExitCode": 1 if failing else 0, "Output": "probe"}]}
+
+        return {"Id": container["Id"], "Name": f'/{container["Name"]}', "State": state, "RestartCount": 0,
+                "Config": {"Labels": container["Labels"], "Env": ["PASSWORD=secret"]}}
+
+    def _json(self, data, status=200):
+        self._send(status, dumps(data).encode())
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Api-Version", "1.43")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeComposeCLI:
+    """
+    Stand-in of the python_on_whales compose commands of a deployment, the services of the compose model
+    become containers of a FakeDocker. The containers with healthcheck start in the starting health status
+    and turn healthy after health_delay seconds.
+    """
+    def __init__(self, docker, engine, health_delay=0.0):
+        self.docker = docker
+        self.engine = engine
+        self.health_delay = health_delay
+        self.timers = list()
+
+    def build(self, services=None, **kwargs):
+        return None
+
+    def up(self, detach=False, **kwargs):
+        project = self.engine.get_project_name()
+        existing = {x["Name"] for x in self.docker.containers.values()}
+
+        for name, service in self.engine.get_container_names().items():
+            if name in existing:
+                continue
+
+            # The labels of the compose files and overrides, e.g. the deployment labels, are kept
+            labels = service.config.get('labels') if isinstance(service.config.get('labels'), dict) else dict()
+            labels = {**labels, "com.docker.compose.project": project, "com.docker.compose.service": service.name}
+            health = "starting" if service.healthcheck is not None else None
+            container_id = self.docker.add_container(name, status="running", health=health, labels=labels)
+            self.docker.emit("start", container_id)
+
+            if health is not None:
+                timer = Timer(self.health_delay, self.docker.set_state, args=(container_id, "health_status: healthy"),
+                              kwargs={"health": "healthy"})
+                timer.start()
+                self.timers.append(timer)
+
+    def down(self, volumes=False, **kwargs):
+        project = self.engine.get_project_name()
+
+        for timer in self.timers:
+            timer.cancel()
+
+        for container_id, container in list(self.docker.containers.items()):
+            if container["Labels"].get("com.docker.compose.project") == project:
+                self.docker.set_state(container_id, "die", status="exited")
+                self.docker.emit("destroy", container_id)
+                del self.docker.containers[container_id]
+
+    def execute(self, service, command, **kwargs):
+        return ''
+
+    def restart(self, services=None, **kwargs):
+        return None
+
+
+class FakeDockerClient:
+    def __init__(self, docker, engine, health_delay=0.0):
+        self.compose = FakeComposeCLI(docker=docker, engine=engine, health_delay=health_delay)
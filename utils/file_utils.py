@@ -1,5 +1,24 @@
-def get_container_names_from_compose_file(file_path):
-    with open(file_path, 'r') as file:
-        data = file.readlines()
-    # return only the lines that contains "container_name", clean the result of any space or \n
-    return [x.split("container_name:")[-1].strip() for x in data if "container_name" in x]
\ No newline at end of file
+from pathlib import Path
+
+
+def read_env_file(file_path):
+    # parse a docker compose .env file, ignore comments and empty lines, return an empty dict if it does not exist
+    values = dict()
+    path = Path(file_path)
+
+    if path.is_file():
+        for line in path.read_text().splitlines():
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                values[key.strip()] = value.strip().strip('"').strip("'")
+
+    return values
+
+
+def write_env_file(file_path, values):
+    path = Path(file_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(''.join(f'{key}={value}\n' for key, value in values.items()))
+
+    return str(path)